@@ -0,0 +1,389 @@
+"""Benchmarks of every stage of the FMU generation pipeline.
+
+Each stage is timed on its own over synthetic datasets of growing size, and
+the results are written as JSON, optionally compared against a baseline from a
+previous run. No data is downloaded, so the benchmarks run offline.
+
+Run with ``nox -s benchmark`` or directly with:
+
+.. code-block:: shell
+
+   python benchmarks/run.py --output results.json --baseline baseline.json
+"""
+
+import ctypes
+import ctypes.util
+import json
+import os
+import platform
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from zipfile import ZipFile
+
+import numpy
+import pandas
+from lxml import etree
+
+from autofmu import __version__
+from autofmu.dataset import read_dataset
+from autofmu.generator import generate_model_description, generate_model_source
+from autofmu.strategies import (
+    DEFAULT_MAX_TABLE_SIZE,
+    linear_regression,
+    logistic_regression,
+    lookup_table,
+)
+from autofmu.utils import BACKENDS, compile_fmu
+
+QUICK_ROWS = [10**3, 10**4, 10**5]
+QUICK_VARIABLES = [2, 10, 50]
+FULL_ROWS = [10**3, 10**4, 10**5, 10**6, 10**7]
+FULL_VARIABLES = [2, 10, 50, 100, 500]
+LOGISTIC_OUTPUTS = 4
+
+HEADERS = Path(__file__).parent.parent / "src" / "autofmu" / "sources" / "headers"
+
+
+def make_dataframe(nrows: int, nvariables: int, seed: int = 0) -> pandas.DataFrame:
+    """Generate a synthetic dataset.
+
+    The dataset has ``nvariables - 1`` uniformly distributed inputs, a linear
+    output ``y`` and a categorical output ``c`` with three classes.
+
+    Arguments:
+        nrows: number of rows
+        nvariables: number of input and output variables
+        seed: seed of the random number generator
+
+    Returns:
+        The synthetic dataset
+    """
+    rng = numpy.random.default_rng(seed)
+    ninputs = max(1, nvariables - 1)
+    x = rng.uniform(-1, 1, size=(nrows, ninputs))
+    weights = rng.normal(size=ninputs)
+    linear = x @ weights
+    dataframe = pandas.DataFrame(x, columns=[f"x{i}" for i in range(ninputs)])
+    dataframe["y"] = linear + rng.normal(scale=0.1, size=nrows)
+    dataframe["c"] = numpy.digitize(linear, numpy.quantile(linear, [1 / 3, 2 / 3]))
+    return dataframe.astype(float)
+
+
+def best_time(function: Callable[[], Any], repeat: int) -> float:
+    """Run a function several times and return its fastest run in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def fmu_calls_per_second(library_path: Path, guid: str, ninputs: int) -> float:
+    """Measure the evaluation throughput of a compiled FMU.
+
+    The shared library is loaded directly with :py:mod:`ctypes`, and pairs of
+    ``fmi2SetReal`` and ``fmi2GetReal`` calls are issued for one second.
+
+    Arguments:
+        library_path: path to the FMU shared library
+        guid: globaly unique identifier of the FMU
+        ninputs: number of inputs of the FMU
+
+    Returns:
+        Number of ``fmi2SetReal`` plus ``fmi2GetReal`` calls per second
+    """
+    libc = ctypes.CDLL(ctypes.util.find_library("c"))
+    logger = ctypes.CFUNCTYPE(
+        None,
+        ctypes.c_void_p,
+        ctypes.c_char_p,
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_char_p,
+    )
+
+    class CallbackFunctions(ctypes.Structure):
+        _fields_ = [
+            ("logger", logger),
+            ("allocateMemory", ctypes.c_void_p),
+            ("freeMemory", ctypes.c_void_p),
+            ("stepFinished", ctypes.c_void_p),
+            ("componentEnvironment", ctypes.c_void_p),
+        ]
+
+    log = logger(lambda *args: None)
+    callbacks = CallbackFunctions(
+        log,
+        ctypes.cast(libc.calloc, ctypes.c_void_p),
+        ctypes.cast(libc.free, ctypes.c_void_p),
+        None,
+        None,
+    )
+
+    library = ctypes.CDLL(str(library_path))
+    library.fmi2Instantiate.restype = ctypes.c_void_p
+    library.fmi2Instantiate.argtypes = [
+        ctypes.c_char_p,
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_char_p,
+        ctypes.POINTER(CallbackFunctions),
+        ctypes.c_int,
+        ctypes.c_int,
+    ]
+    library.fmi2FreeInstance.argtypes = [ctypes.c_void_p]
+    instance = library.fmi2Instantiate(
+        b"benchmark", 1, guid.encode(), b"", ctypes.byref(callbacks), 0, 0
+    )
+
+    inputs_vr = (ctypes.c_uint * ninputs)(*range(1, ninputs + 1))
+    outputs_vr = (ctypes.c_uint * 2)(ninputs + 1, ninputs + 2)
+    inputs = (ctypes.c_double * ninputs)()
+    outputs = (ctypes.c_double * 2)()
+    set_real = library.fmi2SetReal
+    get_real = library.fmi2GetReal
+
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < 1.0:
+        for _ in range(1000):
+            inputs[0] += 1.0
+            set_real(ctypes.c_void_p(instance), inputs_vr, ninputs, inputs)
+            get_real(ctypes.c_void_p(instance), outputs_vr, 2, outputs)
+        calls += 2000
+    elapsed = time.perf_counter() - start
+
+    library.fmi2FreeInstance(instance)
+    return calls / elapsed
+
+
+def benchmark(nrows: int, nvariables: int, repeat: int, workdir: Path) -> List[Dict]:
+    """Time every stage of the pipeline on a synthetic dataset.
+
+    Arguments:
+        nrows: number of rows of the synthetic dataset
+        nvariables: number of variables of the synthetic dataset
+        repeat: number of times each stage is run, the fastest run is kept
+        workdir: directory to write the temporary files
+
+    Returns:
+        A record for each stage with the size of the dataset and the timings
+    """
+    dataframe = make_dataframe(nrows, nvariables)
+    inputs = [column for column in dataframe.columns if column.startswith("x")]
+    outputs = ["y", "c"]
+    csvfile = workdir / "dataset.csv"
+    dataframe.to_csv(csvfile, index=False)
+    records = []
+
+    def record(stage: str, seconds: float, **extra: Any) -> None:
+        records.append(
+            {"stage": stage, "rows": nrows, "variables": nvariables, "seconds": seconds}
+        )
+        records[-1].update(extra)
+        print(f"{stage:<24} rows={nrows:<9} variables={nvariables:<4} {seconds:.6f}s")
+
+    record(
+        "read_csv",
+        best_time(lambda: read_dataset(csvfile, [*inputs, *outputs]), repeat),
+    )
+    record(
+        "linear_regression",
+        best_time(lambda: linear_regression(dataframe, inputs, outputs), repeat),
+    )
+    record(
+        "logistic_regression",
+        best_time(lambda: logistic_regression(dataframe, inputs, ["c"]), repeat),
+    )
+    # Several categorical outputs, fitted one after another and in parallel
+    classes = dataframe.assign(
+        **{
+            f"c{index}": numpy.digitize(dataframe[column], [-1 / 3, 1 / 3])
+            for index, column in enumerate(inputs[:LOGISTIC_OUTPUTS])
+        }
+    )
+    outputs_c = [f"c{index}" for index in range(min(len(inputs), LOGISTIC_OUTPUTS))]
+    for jobs in (1, None):
+        record(
+            "logistic_regression_outputs" + ("_parallel" if jobs is None else ""),
+            best_time(
+                lambda jobs=jobs: logistic_regression(
+                    classes, inputs, outputs_c, jobs=jobs
+                ),
+                repeat,
+            ),
+            outputs=len(outputs_c),
+            cpus=os.cpu_count(),
+        )
+    # Lookup tables grow exponentially with the inputs, skip the widest datasets
+    if 2 ** len(inputs) * len(outputs) <= DEFAULT_MAX_TABLE_SIZE:
+        record(
+            "lookup_table",
+            best_time(lambda: lookup_table(dataframe, inputs, outputs), repeat),
+        )
+
+    # The FMU is generated from a linear model of both outputs
+    result = linear_regression(dataframe, inputs, outputs)
+    guid = "00000000-0000-0000-0000-000000000000"
+    source = ""
+
+    def render() -> None:
+        nonlocal source
+        source = generate_model_source(guid, inputs, outputs, "linear", result)
+
+    record("generate_model_source", best_time(render, repeat))
+
+    fmu = workdir / "benchmark.fmu"
+
+    def write_zip() -> None:
+        with ZipFile(fmu, "w") as zipfile:
+            description = generate_model_description(
+                "benchmark", "benchmark", guid, inputs, outputs
+            )
+            zipfile.writestr(
+                "modelDescription.xml", etree.tostring(description, pretty_print=True)
+            )
+            for header in HEADERS.glob("*.h"):
+                zipfile.write(str(header), f"sources/headers/{header.name}")
+            zipfile.writestr("sources/fmi2Functions.c", source)
+
+    record("write_zip", best_time(write_zip, repeat))
+
+    for backend in BACKENDS:
+
+        def compile_native(backend: str = backend) -> None:
+            write_zip()
+            compile_fmu("benchmark", fmu, targets=["native"], backend=backend)
+
+        stage = "compile_fmu" if backend == "direct" else f"compile_fmu_{backend}"
+        record(stage, best_time(compile_native, 1))
+
+    with TemporaryDirectory() as extracted:
+        with ZipFile(fmu) as zipfile:
+            zipfile.extractall(extracted)
+        library = next(Path(extracted).glob("binaries/*/benchmark.*"))
+        calls = fmu_calls_per_second(library, guid, len(inputs))
+    record("fmu_evaluation", 1 / calls, calls_per_second=calls)
+
+    return records
+
+
+def compare(
+    results: Sequence[Dict], baseline: Sequence[Dict], threshold: float
+) -> List[str]:
+    """Compare the results of a run against a baseline.
+
+    Arguments:
+        results: records of the current run
+        baseline: records of the baseline run
+        threshold: ratio over the baseline time above which a stage is
+            considered a regression
+
+    Returns:
+        Description of every stage that regressed
+    """
+    reference = {
+        (record["stage"], record["rows"], record["variables"]): record["seconds"]
+        for record in baseline
+    }
+    regressions = []
+    for record in results:
+        key = (record["stage"], record["rows"], record["variables"])
+        if key not in reference or reference[key] <= 0:
+            continue
+        ratio = record["seconds"] / reference[key]
+        print(f"{key[0]:<24} rows={key[1]:<9} variables={key[2]:<4} x{ratio:.2f}")
+        if ratio > threshold:
+            regressions.append(
+                f"{key[0]} (rows={key[1]}, variables={key[2]}) is {ratio:.2f} "
+                "times slower than the baseline"
+            )
+    return regressions
+
+
+def main(args: Optional[Sequence[str]] = None) -> int:
+    """Run the benchmarks from the command line.
+
+    Arguments:
+        args: sequence of command line arguments
+
+    Returns:
+        Exit status, non-zero if any stage regressed against the baseline
+    """
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="benchmark datasets up to 10^7 rows and 500 variables",
+    )
+    parser.add_argument("--rows", type=int, nargs="+", help="numbers of rows")
+    parser.add_argument("--variables", type=int, nargs="+", help="numbers of variables")
+    parser.add_argument(
+        "--max-cells",
+        type=int,
+        default=10**8,
+        help="skip datasets with more rows times variables (default %(default)s)",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each stage")
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        default=Path("benchmark.json"),
+        help="file to write the results (default '%(default)s')",
+    )
+    parser.add_argument(
+        "--baseline", type=Path, help="results of a previous run to compare against"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="slowdown over the baseline considered a regression (default %(default)s)",
+    )
+    options = parser.parse_args(args)
+
+    rows = options.rows or (FULL_ROWS if options.full else QUICK_ROWS)
+    variables = options.variables or (
+        FULL_VARIABLES if options.full else QUICK_VARIABLES
+    )
+
+    results: List[Dict] = []
+    with TemporaryDirectory() as workdir:
+        for nrows in rows:
+            for nvariables in variables:
+                if nrows * nvariables > options.max_cells:
+                    continue
+                results.extend(
+                    benchmark(nrows, nvariables, options.repeat, Path(workdir))
+                )
+
+    options.output.write_text(
+        json.dumps(
+            {
+                "version": __version__,
+                "python": sys.version,
+                "platform": platform.platform(),
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+    print(f"Results written to '{options.output}'")
+
+    if options.baseline:
+        baseline = json.loads(options.baseline.read_text())["results"]
+        regressions = compare(results, baseline, options.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -40,3 +40,14 @@ def docs(session):
         session.run("sphinx-autobuild", *sphinx_args)
     else:
         session.run("sphinx-build", *sphinx_args)
+
+
+@nox.session
+def benchmark(session):
+    """Benchmark the pipeline stages, comparing against a baseline if given.
+
+    Pass the options of ``benchmarks/run.py`` after ``--``, for example
+    ``nox -s benchmark -- --baseline baseline.json``.
+    """
+    session.install(".")
+    session.run("python", "benchmarks/run.py", *session.posargs)
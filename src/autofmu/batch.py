@@ -0,0 +1,369 @@
+"""Generation of many FMUs described in a manifest file.
+
+A manifest lists the FMUs to generate, either as a list of items or as a
+mapping with a ``fmus`` list and optional ``defaults`` shared by every item.
+For example, in YAML:
+
+.. code-block:: yaml
+
+   defaults:
+     dataset: plant.csv
+     strategy: linear
+   fmus:
+     - outfile: temperature.fmu
+       inputs: [power, ambient]
+       outputs: [temperature]
+     - outfile: valve.fmu
+       dataset: valve.parquet
+       strategy: logistic
+       inputs: [pressure]
+       outputs: [state]
+     - outfile: pump.fmu
+       strategy: lookup
+       parameters:
+         lookup: {resolution: 64}
+       inputs: [speed, head]
+       outputs: [flow]
+
+Relative paths are resolved from the directory of the manifest. Manifests can
+be written in JSON (``.json``), YAML (``.yaml`` or ``.yml``, requires
+``PyYAML``) or TOML (``.toml``, requires ``toml`` before Python 3.11).
+"""
+
+import json
+import logging
+import time
+from concurrent.futures import (
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+)
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import pandas
+
+from autofmu.cache import Cache
+from autofmu.dataset import dataset_columns, read_dataset
+from autofmu.generator import build_fmu, fit_model
+from autofmu.profiling import stage
+from autofmu.state import FitState
+from autofmu.strategies import Result
+
+
+@dataclass
+class BatchItem:
+    """Description of an FMU to generate in a batch."""
+
+    dataset: Path
+    inputs: List[str]
+    outputs: List[str]
+    outfile: Path
+    strategy: str = "linear"
+    name: Optional[str] = None
+    parameters: Optional[Dict[str, Dict[str, Any]]] = None
+
+    @property
+    def model_name(self) -> str:
+        """Name of the model, by default the name of the output file."""
+        return self.name or self.outfile.stem
+
+
+@dataclass
+class BatchStatus:
+    """Outcome of generating an FMU in a batch."""
+
+    item: BatchItem
+    strategy: Optional[str] = None
+    fit_time: float = 0.0
+    build_time: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        """Whether the FMU was generated."""
+        return self.error is None
+
+
+def _parse_manifest(path: Path) -> Any:
+    suffix = path.suffix.lower()
+    if suffix == ".json":
+        return json.loads(path.read_text())
+    if suffix in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError as error:
+            raise ImportError(
+                "Reading YAML manifests requires PyYAML, "
+                "install it with 'pip install pyyaml'"
+            ) from error
+        return yaml.safe_load(path.read_text())
+    if suffix == ".toml":
+        try:
+            import tomllib  # type: ignore
+
+            return tomllib.loads(path.read_text())
+        except ImportError:
+            pass
+        try:
+            import toml
+        except ImportError as error:
+            raise ImportError(
+                "Reading TOML manifests requires toml, "
+                "install it with 'pip install toml'"
+            ) from error
+        return toml.loads(path.read_text())
+    raise ValueError(
+        f"Unsupported manifest format '{suffix}', expected .json, .yaml or .toml"
+    )
+
+
+def load_manifest(path: Path) -> List[BatchItem]:
+    """Read the FMUs to generate from a manifest file.
+
+    Arguments:
+        path: path to the manifest file
+
+    Returns:
+        Description of each FMU in the manifest
+
+    Raises:
+        ValueError: if the manifest is malformed
+    """
+    path = Path(path)
+    data = _parse_manifest(path)
+    if isinstance(data, dict):
+        defaults = data.get("defaults", {})
+        entries = data.get("fmus", [])
+    else:
+        defaults, entries = {}, data
+    if not isinstance(defaults, dict):
+        raise ValueError(f"Expected a mapping of defaults in '{path}'")
+    if not isinstance(entries, list):
+        raise ValueError(f"Expected a list of FMUs in '{path}'")
+
+    names = {field.name for field in fields(BatchItem)}
+    items = []
+    for index, entry in enumerate(entries, 1):
+        if not isinstance(entry, dict):
+            raise ValueError(f"Expected a mapping in FMU {index}")
+        values = {**defaults, **entry}
+        unknown = set(values) - names
+        if unknown:
+            raise ValueError(
+                f"Unknown keys {', '.join(sorted(unknown))} in FMU {index}"
+            )
+        missing = {"dataset", "inputs", "outputs", "outfile"} - set(values)
+        if missing:
+            raise ValueError(
+                f"Missing keys {', '.join(sorted(missing))} in FMU {index}"
+            )
+        for key in ("inputs", "outputs"):
+            if not isinstance(values[key], list) or not all(
+                isinstance(column, str) for column in values[key]
+            ):
+                raise ValueError(f"Expected a list of columns in {key} of FMU {index}")
+        for key in ("dataset", "outfile", "strategy", "name"):
+            if values.get(key) is not None and not isinstance(values[key], str):
+                raise ValueError(f"Expected a string in {key} of FMU {index}")
+        if values.get("parameters") is not None and not isinstance(
+            values["parameters"], dict
+        ):
+            raise ValueError(f"Expected a mapping in parameters of FMU {index}")
+        values["dataset"] = path.parent / values["dataset"]
+        values["outfile"] = path.parent / values["outfile"]
+        items.append(BatchItem(**values))
+    return items
+
+
+# Datasets of the batch, set once in each worker process by its initializer so
+# that they are not sent along with every item
+_datasets: Dict[Path, pandas.DataFrame] = {}
+
+
+def _set_datasets(datasets: Dict[Path, pandas.DataFrame]) -> None:
+    global _datasets
+    _datasets = datasets
+
+
+def _fit_item(
+    item: BatchItem, cache: Optional[Cache]
+) -> Tuple[str, Result, Optional[FitState], float]:
+    start = time.perf_counter()
+    dataframe = _datasets[item.dataset][item.inputs + item.outputs]
+    # Fit strategies one at a time, this already runs in a worker process
+    strategy, result, state = fit_model(
+        dataframe,
+        item.inputs,
+        item.outputs,
+        item.strategy,
+        jobs=1,
+        parameters=item.parameters,
+        cache=cache,
+    )
+    return strategy, result, state, time.perf_counter() - start
+
+
+def _read_shared_dataset(
+    path: Path, statuses: Sequence[BatchStatus]
+) -> pandas.DataFrame:
+    # Items with missing columns fail alone, the others share a single read
+    available = set(dataset_columns(path))
+    columns: List[str] = []
+    for status in statuses:
+        item = status.item
+        missing = [
+            column for column in item.inputs + item.outputs if column not in available
+        ]
+        if missing:
+            status.error = (
+                f"failed to read dataset: Columns {', '.join(missing)} "
+                f"not found in '{path}'"
+            )
+            logging.error("Failed to read dataset of '%s': %s", item.outfile, missing)
+        else:
+            columns.extend(item.inputs + item.outputs)
+    if not columns:
+        return pandas.DataFrame()
+    return read_dataset(path, columns)  # type: ignore
+
+
+def run_batch(
+    items: Sequence[BatchItem],
+    jobs: Optional[int] = None,
+    targets: Optional[Iterable[str]] = None,
+    cache: Optional[Cache] = None,
+    compression: str = "store",
+    build_dir: Optional[Path] = None,
+    backend: str = "direct",
+    fit_cache: Optional[Cache] = None,
+) -> List[BatchStatus]:
+    """Generate many FMUs, sharing the work between them.
+
+    Each distinct dataset is read once, with the columns used by every FMU
+    that references it, except the FMUs whose columns are not in the dataset,
+    which fail on their own. The models are fitted in parallel in a pool of
+    processes, which receive the datasets once when they start, and, as soon as
+    each one is fitted, its FMU is written and its targets are compiled in a
+    pool of workers shared by every FMU. A failure in one FMU does not stop the
+    others.
+
+    Arguments:
+        items: description of each FMU to generate
+        jobs: maximum number of models to fit, and of targets to compile, at the
+            same time, by default the number of processors in the machine
+        targets: names of the targets to compile the FMUs to, by default all
+        cache: cache of compiled libraries, by default nothing is cached
+        compression: compression method of the FMU files (see
+            :py:data:`~autofmu.utils.COMPRESSIONS`)
+        build_dir: directory to stage and compile the FMUs in, by default the
+            system temporary directory
+        backend: how to compile each target (see
+            :py:data:`~autofmu.utils.BACKENDS`)
+        fit_cache: cache of fits, to reuse the fit of the same strategy to the
+            same data, by default every model is fitted
+
+    Returns:
+        Outcome of each FMU, in the same order as ``items``
+    """
+    statuses = [BatchStatus(item) for item in items]
+
+    sharing: Dict[Path, List[BatchStatus]] = {}
+    for status in statuses:
+        sharing.setdefault(status.item.dataset, []).append(status)
+
+    with ThreadPoolExecutor(max_workers=jobs) as loaders:
+        loading = {
+            dataset: loaders.submit(_read_shared_dataset, dataset, dataset_statuses)
+            for dataset, dataset_statuses in sharing.items()
+        }
+    datasets: Dict[Path, pandas.DataFrame] = {}
+    for dataset, future in loading.items():
+        error = future.exception()
+        if error is not None:
+            logging.error("Failed to read dataset '%s': %s", dataset, error)
+            for status in statuses:
+                if status.item.dataset == dataset:
+                    status.error = f"failed to read dataset: {error}"
+        else:
+            datasets[dataset] = future.result()  # type: ignore
+            logging.info("Read dataset '%s'", dataset)
+
+    def build(status: BatchStatus, result: Result, state: Optional[FitState]) -> None:
+        item = status.item
+        start = time.perf_counter()
+        with stage("build_fmu", model=item.model_name):
+            build_fmu(
+                item.model_name,
+                item.inputs,
+                item.outputs,
+                status.strategy,  # type: ignore
+                result,
+                item.outfile,
+                targets=targets,
+                cache=cache,
+                executor=compilers,
+                compression=compression,
+                build_dir=build_dir,
+                backend=backend,
+                state=state,
+            )
+        status.build_time = time.perf_counter() - start
+
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=_set_datasets, initargs=(datasets,)
+    ) as fitters, ThreadPoolExecutor(max_workers=jobs) as compilers, ThreadPoolExecutor(
+        max_workers=len(items) or 1
+    ) as builders:
+        fitting: Dict[Future, BatchStatus] = {}
+        for status in statuses:
+            if status.ok:
+                fitting[fitters.submit(_fit_item, status.item, fit_cache)] = status
+
+        building: Dict[Future, BatchStatus] = {}
+        for future in as_completed(fitting):
+            status = fitting[future]
+            error = future.exception()
+            if error is not None:
+                status.error = f"failed to fit model: {error}"
+                logging.error("Failed to fit '%s': %s", status.item.outfile, error)
+                continue
+            status.strategy, result, state, status.fit_time = future.result()
+            logging.info("Fitted '%s' in %.3fs", status.item.outfile, status.fit_time)
+            building[builders.submit(build, status, result, state)] = status
+
+        for future in as_completed(building):
+            status = building[future]
+            error = future.exception()
+            if error is not None:
+                status.error = f"failed to build FMU: {error}"
+                logging.error("Failed to build '%s': %s", status.item.outfile, error)
+            else:
+                logging.info("Generated '%s'", status.item.outfile)
+
+    return statuses
+
+
+def format_statuses(statuses: Iterable[BatchStatus]) -> str:
+    """Format the outcome of a batch as a table.
+
+    Arguments:
+        statuses: outcome of each FMU
+
+    Returns:
+        A text table with the strategy, fit and build times and status of each
+        FMU, followed by the number of FMUs that were generated
+    """
+    statuses = list(statuses)
+    lines = [f"{'fmu':<32} {'strategy':<10} {'fit':>9} {'build':>9}  status"]
+    for status in statuses:
+        lines.append(
+            f"{str(status.item.outfile):<32} {status.strategy or '-':<10} "
+            f"{status.fit_time:>8.3f}s {status.build_time:>8.3f}s  "
+            f"{'ok' if status.ok else status.error}"
+        )
+    succeeded = sum(status.ok for status in statuses)
+    lines.append(f"{succeeded} of {len(statuses)} FMUs generated")
+    return "\n".join(lines)
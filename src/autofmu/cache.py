@@ -0,0 +1,127 @@
+"""On-disk cache of build artifacts, bounded in size with LRU eviction."""
+
+import hashlib
+import logging
+import os
+import shutil
+from pathlib import Path
+from tempfile import mkdtemp
+from typing import Optional, Union
+
+DEFAULT_CACHE_DIR = (
+    Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "autofmu"
+)
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+
+
+def digest(*parts: Union[bytes, str]) -> str:
+    """Compute a hexadecimal digest that identifies a sequence of values.
+
+    Each part is length prefixed, so ``digest("ab", "c")`` and
+    ``digest("a", "bc")`` are different.
+
+    Arguments:
+        parts: values to hash, strings are encoded as UTF-8
+
+    Returns:
+        SHA-256 hexadecimal digest of the values
+    """
+    sha = hashlib.sha256()
+    for part in parts:
+        data = part.encode("utf-8") if isinstance(part, str) else part
+        sha.update(len(data).to_bytes(8, "little"))
+        sha.update(data)
+    return sha.hexdigest()
+
+
+def _size(path: Path) -> int:
+    if path.is_file():
+        return path.stat().st_size
+    return sum(item.stat().st_size for item in path.glob("**/*") if item.is_file())
+
+
+class Cache:
+    """A content addressed cache of files and directories.
+
+    Every entry is stored in its own subdirectory named after its key. The
+    modification time of an entry is updated whenever it is read, so that when
+    the total size exceeds the limit the least recently used entries are
+    removed first.
+    """
+
+    def __init__(
+        self,
+        directory: Path = DEFAULT_CACHE_DIR,
+        max_size: int = DEFAULT_CACHE_SIZE,
+    ) -> None:
+        """Create a cache.
+
+        Arguments:
+            directory: path to the directory where the entries are stored
+            max_size: maximum size in bytes of all the entries together
+        """
+        self.directory = Path(directory)
+        self.max_size = max_size
+
+    def get(self, key: str) -> Optional[Path]:
+        """Look up an entry in the cache.
+
+        Arguments:
+            key: key of the entry, usually computed with :py:func:`digest`
+
+        Returns:
+            Path to the directory with the contents of the entry, or ``None`` if
+            there is no entry with that key
+        """
+        entry = self.directory / key
+        if not entry.is_dir():
+            return None
+        os.utime(entry)
+        return entry
+
+    def put(self, key: str, source: Path) -> Path:
+        """Copy a file or a directory into the cache.
+
+        The entry is copied to a staging directory and then renamed, so that
+        concurrent readers never see a partially written entry.
+
+        Arguments:
+            key: key of the entry, usually computed with :py:func:`digest`
+            source: path to the file or directory to store
+
+        Returns:
+            Path to the directory with the contents of the entry
+        """
+        entry = self.directory / key
+        self.directory.mkdir(parents=True, exist_ok=True)
+        staging = Path(mkdtemp(prefix=".staging-", dir=self.directory))
+        try:
+            if source.is_dir():
+                shutil.copytree(source, staging / source.name)
+            else:
+                shutil.copy(source, staging / source.name)
+            os.replace(staging, entry)
+        except OSError:
+            # Another process stored the same entry in the meantime
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict()
+        return entry
+
+    def evict(self) -> None:
+        """Remove the least recently used entries until the cache fits its limit."""
+        if not self.directory.is_dir():
+            return
+        entries = [
+            entry
+            for entry in self.directory.iterdir()
+            if entry.is_dir() and not entry.name.startswith(".")
+        ]
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        sizes = {entry: _size(entry) for entry in entries}
+        total = sum(sizes.values())
+        for entry in entries:
+            if total <= self.max_size:
+                break
+            logging.info("Evicting cache entry '%s'", entry.name)
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= sizes[entry]
@@ -1,9 +1,22 @@
 """Utilities for exposing a command line interface of the program."""
 
+import os
 from argparse import ArgumentParser
 from pathlib import Path
 
 from autofmu import __version__
+from autofmu.cache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE
+from autofmu.sampling import DEFAULT_INITIAL_SIZE, DEFAULT_MAX_SIZE, DEFAULT_TOLERANCE
+from autofmu.strategies import (
+    DEFAULT_LOGISTIC_SOLVER,
+    DEFAULT_MAX_TABLE_SIZE,
+    DEFAULT_RESOLUTION,
+    DEFAULT_SPARSE_TOLERANCE,
+    LOGISTIC_SOLVERS,
+    SAGA_MIN_ROWS,
+    STRATEGIES,
+)
+from autofmu.utils import BACKENDS, COMPRESSIONS, TARGETS
 
 
 def create_argument_parser() -> ArgumentParser:
@@ -12,51 +25,330 @@ def create_argument_parser() -> ArgumentParser:
     Returns:
         An argument parser object
     """
-    parser = ArgumentParser(prog="autofmu")
+    parser = ArgumentParser(prog="autofmu", parents=[create_common_argument_parser()])
 
     # General options
     parser.add_argument(
         "dataset",
         metavar="FILE",
         type=Path,
-        help="CSV files that contain the datasets for training the FMU model",
+        nargs="+",
+        help="CSV, Parquet, Feather or NumPy (.npy) files that contain the "
+        "dataset for training the FMU model, given as paths, glob patterns or "
+        "directories, and read in parallel",
     )
     parser.add_argument(
         "-o",
         "--outfile",
         metavar="FILE",
         type=Path,
-        default=Path("model.fmu"),
-        help="file to output the generated FMU model (default '%(default)s')",
+        default=None,
+        help="file to output the generated FMU model (default 'model.fmu', or "
+        "the FMU given to '--update')",
     )
     parser.add_argument(
-        "-v",
-        "--verbose",
-        default=False,
-        action="store_true",
-        help="run the program in verbose mode",
+        "--update",
+        metavar="FMU",
+        type=Path,
+        default=None,
+        help="update an FMU generated before with the new rows in the dataset, "
+        "keeping its inputs, outputs and strategy",
     )
     parser.add_argument("-V", "--version", action="version", version=__version__)
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        type=Path,
+        default=None,
+        help="write the time and memory spent on each stage to a file in the "
+        "Chrome trace event format",
+    )
     parser.add_argument(
         "--inputs",
         metavar="VARIABLE",
-        required=True,
         nargs="+",
-        help="list of names of the model input variables",
+        help="list of names of the model input variables, required unless "
+        "updating an FMU",
     )
     parser.add_argument(
         "--outputs",
         metavar="VARIABLE",
-        required=True,
         nargs="+",
-        help="list of names of the model output variables",
+        help="list of names of the model output variables, required unless "
+        "updating an FMU",
     )
     parser.add_argument(
         "-s",
         "--strategy",
-        choices=["linear", "logistic"],
+        choices=[*STRATEGIES, "auto"],
         default="linear",
-        help="strategy to use to deduce the approximation",
+        help="strategy to use to deduce the approximation, 'auto' fits every "
+        "applicable strategy and selects the one that scores best on held-out data",
+    )
+    parser.add_argument(
+        "--validation-fraction",
+        metavar="FRACTION",
+        type=float,
+        default=0.2,
+        help="fraction of the dataset held out to score the strategies with "
+        "'--strategy auto' (default %(default)s)",
+    )
+    parser.add_argument(
+        "--folds",
+        metavar="K",
+        type=int,
+        default=None,
+        help="score the strategies with k-fold cross validation instead of a "
+        "single held-out fraction with '--strategy auto'",
+    )
+    parser.add_argument(
+        "--cost-tolerance",
+        metavar="SCORE",
+        type=float,
+        default=0.0,
+        help="with '--strategy auto', prefer the strategy that is cheaper to "
+        "evaluate among those that score within this tolerance of the best",
+    )
+    parser.add_argument(
+        "--resolution",
+        metavar="N",
+        type=int,
+        default=DEFAULT_RESOLUTION,
+        help="with '--strategy lookup', maximum number of breakpoints of each "
+        "input (default %(default)s)",
+    )
+    parser.add_argument(
+        "--max-table-size",
+        metavar="N",
+        type=int,
+        default=DEFAULT_MAX_TABLE_SIZE,
+        help="with '--strategy lookup', maximum number of values in the table "
+        "(default %(default)s)",
+    )
+    parser.add_argument(
+        "--solver",
+        choices=LOGISTIC_SOLVERS,
+        default=DEFAULT_LOGISTIC_SOLVER,
+        help="with '--strategy logistic', solver of the regression, 'auto' uses "
+        f"saga from {SAGA_MIN_ROWS} rows and lbfgs below (default %(default)s)",
+    )
+    parser.add_argument(
+        "--sparse-tolerance",
+        metavar="SCORE",
+        type=float,
+        default=DEFAULT_SPARSE_TOLERANCE,
+        help="with '--strategy sparse', maximum loss of score of each output "
+        "from dropping inputs (default %(default)s)",
+    )
+    parser.add_argument(
+        "--dependency-tolerance",
+        metavar="COEF",
+        type=float,
+        default=0.0,
+        help="declare that an output depends on an input only if the magnitude "
+        "of its coefficient is larger than this tolerance (default %(default)s)",
+    )
+    parser.add_argument(
+        "--chunksize",
+        metavar="ROWS",
+        type=int,
+        default=None,
+        help="read the dataset in chunks of this number of rows, so that the "
+        "linear strategy fits datasets larger than the available memory",
+    )
+    parser.add_argument(
+        "--sample",
+        action="store_true",
+        help="fit the strategy on progressively larger random samples of the "
+        "dataset, until the validation score converges; the dataset is read in "
+        "chunks of '--chunksize' rows, or '--sample-max-size' rows by default",
+    )
+    parser.add_argument(
+        "--sample-initial-size",
+        metavar="ROWS",
+        type=int,
+        default=DEFAULT_INITIAL_SIZE,
+        help="with '--sample', number of rows of the first sample "
+        "(default %(default)s)",
+    )
+    parser.add_argument(
+        "--sample-max-size",
+        metavar="ROWS",
+        type=int,
+        default=DEFAULT_MAX_SIZE,
+        help="with '--sample', maximum number of rows kept in memory "
+        "(default %(default)s)",
+    )
+    parser.add_argument(
+        "--sample-tolerance",
+        metavar="SCORE",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="with '--sample', stop growing the sample when the validation score "
+        "changes by less than this tolerance (default %(default)s)",
+    )
+
+    return parser
+
+
+def create_common_argument_parser() -> ArgumentParser:
+    """Create a parser of the options shared by every command.
+
+    These options control the output of the program, the caches and how FMUs
+    are compiled. The parser is meant to be given as a parent to the parser of
+    each command.
+
+    Returns:
+        An argument parser object, without a help option
+    """
+    parser = ArgumentParser(add_help=False)
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        default=False,
+        action="store_true",
+        help="run the program in verbose mode",
+    )
+    parser.add_argument(
+        "--no-fit-cache",
+        dest="fit_cache",
+        default=True,
+        action="store_false",
+        help="always fit the model instead of reusing a cached fit of the same "
+        "strategy to the same data",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="N",
+        type=int,
+        default=None,
+        help="number of targets to compile, models to fit, or dataset files to "
+        "read at the same time (default: number of processors)",
+    )
+    parser.add_argument(
+        "--targets",
+        metavar="TARGET",
+        nargs="+",
+        choices=list(TARGETS),
+        default=None,
+        help="targets to compile the FMU to, among %(choices)s (default: all)",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=list(BACKENDS),
+        default="direct",
+        help="compile the FMU by calling the compiler directly, or through "
+        "cmake (default '%(default)s')",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="cache",
+        default=True,
+        action="store_false",
+        help="always compile the FMU and fit the model instead of reusing "
+        "cached libraries and fits",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        metavar="DIR",
+        type=Path,
+        default=DEFAULT_CACHE_DIR,
+        help="directory to cache the compiled libraries and fits "
+        "(default '%(default)s')",
+    )
+    parser.add_argument(
+        "--cache-size",
+        metavar="MB",
+        type=int,
+        default=DEFAULT_CACHE_SIZE // (1024 * 1024),
+        help="maximum size of the cache in megabytes (default %(default)s)",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=list(COMPRESSIONS),
+        default="store",
+        help="compression method of the FMU file (default '%(default)s')",
+    )
+    parser.add_argument(
+        "--build-dir",
+        metavar="DIR",
+        type=Path,
+        default=None,
+        help="directory to stage and compile the FMU in, for example a tmpfs "
+        "mount such as /dev/shm (default: system temporary directory)",
+    )
+
+    return parser
+
+
+def create_batch_argument_parser() -> ArgumentParser:
+    """Create an argument parser object to process ``autofmu batch`` arguments.
+
+    Returns:
+        An argument parser object
+    """
+    parser = ArgumentParser(
+        prog="autofmu batch",
+        description="Generate every FMU listed in a manifest file.",
+        parents=[create_common_argument_parser()],
+    )
+    parser.add_argument(
+        "manifest",
+        metavar="MANIFEST",
+        type=Path,
+        help="JSON, YAML or TOML file that lists the dataset, inputs, outputs, "
+        "strategy and output file of each FMU",
+    )
+
+    return parser
+
+
+def create_serve_argument_parser() -> ArgumentParser:
+    """Create an argument parser object to process ``autofmu serve`` arguments.
+
+    Returns:
+        An argument parser object
+    """
+    parser = ArgumentParser(
+        prog="autofmu serve",
+        description="Run a service that generates FMUs on request over HTTP.",
+        parents=[create_common_argument_parser()],
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="address of the interface to listen on (default '%(default)s')",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8080,
+        help="TCP port to listen on (default %(default)s)",
+    )
+    parser.add_argument(
+        "--unix-socket",
+        metavar="PATH",
+        type=Path,
+        default=None,
+        help="listen on a Unix socket at this path instead of on a TCP port",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        metavar="N",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of FMUs to generate at the same time (default %(default)s)",
+    )
+    parser.add_argument(
+        "--queue-size",
+        metavar="N",
+        type=int,
+        default=None,
+        help="number of requests that can wait for a worker before new ones are "
+        "rejected (default: the number of workers)",
     )
+    parser.set_defaults(jobs=1)
 
     return parser
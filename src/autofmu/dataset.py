@@ -0,0 +1,287 @@
+"""Utilities for reading the datasets used to train the models.
+
+The format of a dataset is chosen by the extension of its file:
+
+* ``.csv``: comma separated values with a header row
+* ``.parquet``: Apache Parquet (requires ``pyarrow``)
+* ``.feather``: Apache Arrow IPC / Feather (requires ``pyarrow``)
+* ``.npy``: NumPy array, memory mapped. Structured arrays are indexed by their
+  field names, while the columns of two dimensional arrays are named after
+  their index (``"0"``, ``"1"``, ...)
+
+Only the requested columns are read, and they are always converted to floats.
+
+A dataset can also be split in several files, or shards, with the same
+columns, which are read in parallel by :py:func:`read_datasets`.
+"""
+
+import glob
+import itertools
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Deque, Iterable, Iterator, List, Optional, Union
+
+import numpy
+import pandas
+
+FORMATS = (".csv", ".parquet", ".feather", ".npy")
+
+
+def _import_pyarrow() -> Any:
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.feather
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as error:
+        raise ImportError(
+            "Reading Parquet and Feather datasets requires pyarrow, "
+            "install it with 'pip install pyarrow'"
+        ) from error
+    return pyarrow
+
+
+def _dataset_format(path: Path) -> str:
+    suffix = path.suffix.lower()
+    if suffix not in FORMATS:
+        raise ValueError(
+            f"Unsupported dataset format '{suffix}' of '{path}', "
+            f"expected one of {', '.join(FORMATS)}"
+        )
+    return suffix
+
+
+def _load_npy(path: Path) -> numpy.ndarray:
+    array = numpy.load(path, mmap_mode="r")
+    if array.dtype.names is None and array.ndim != 2:
+        raise ValueError(f"Expected a two dimensional array in '{path}'")
+    return array
+
+
+def _npy_columns(array: numpy.ndarray) -> List[str]:
+    if array.dtype.names is not None:
+        return list(array.dtype.names)
+    return [str(index) for index in range(array.shape[1])]
+
+
+def _npy_dataframe(array: numpy.ndarray, columns: List[str]) -> pandas.DataFrame:
+    if array.dtype.names is not None:
+        data = {column: array[column] for column in columns}
+        return pandas.DataFrame(data, copy=False).astype(float)
+    indices = [int(column) for column in columns]
+    if indices == list(range(array.shape[1])):
+        values = array
+    else:
+        values = array[:, indices]
+    return pandas.DataFrame(values, columns=columns, copy=False).astype(float)
+
+
+def dataset_columns(path: Path) -> List[str]:
+    """List the names of the columns of a dataset without reading its rows.
+
+    Arguments:
+        path: path to the dataset file
+
+    Returns:
+        Names of the columns in the order they are stored
+    """
+    fmt = _dataset_format(path)
+    if fmt == ".csv":
+        return list(pandas.read_csv(path, nrows=0).columns)
+    if fmt == ".parquet":
+        return list(_import_pyarrow().parquet.read_schema(path).names)
+    if fmt == ".feather":
+        pyarrow = _import_pyarrow()
+        with pyarrow.memory_map(str(path)) as source:
+            return list(pyarrow.ipc.open_file(source).schema.names)
+    return _npy_columns(_load_npy(path))
+
+
+def read_dataset(
+    path: Path,
+    columns: Iterable[str],
+    chunksize: Optional[int] = None,
+) -> Union[pandas.DataFrame, Iterator[pandas.DataFrame]]:
+    """Read the given columns of a dataset as floats.
+
+    Arguments:
+        path: path to the dataset file
+        columns: names of the columns to read, the other columns are skipped
+        chunksize: if given, read the dataset in chunks of this number of rows
+
+    Returns:
+        A dataframe with the given columns, or an iterator of dataframes with at
+        most ``chunksize`` rows each if ``chunksize`` is given
+
+    Raises:
+        ValueError: if the format of the dataset is not supported or any of the
+            columns is not in the dataset
+    """
+    path = Path(path)
+    columns = list(dict.fromkeys(columns))
+    fmt = _dataset_format(path)
+
+    available = set(dataset_columns(path))
+    missing = [column for column in columns if column not in available]
+    if missing:
+        raise ValueError(f"Columns {', '.join(missing)} not found in '{path}'")
+
+    if fmt == ".csv":
+        dtype = {column: "float64" for column in columns}
+        return pandas.read_csv(path, usecols=columns, dtype=dtype, chunksize=chunksize)
+
+    if fmt == ".parquet":
+        pyarrow = _import_pyarrow()
+        if chunksize:
+            parquet = pyarrow.parquet.ParquetFile(path)
+            return (
+                batch.to_pandas().astype(float)
+                for batch in parquet.iter_batches(chunksize, columns=columns)
+            )
+        table = pyarrow.parquet.read_table(path, columns=columns)
+        return table.to_pandas().astype(float)
+
+    if fmt == ".feather":
+        pyarrow = _import_pyarrow()
+        table = pyarrow.feather.read_table(path, columns=columns, memory_map=True)
+        if chunksize:
+            return (
+                batch.to_pandas().astype(float) for batch in table.to_batches(chunksize)
+            )
+        return table.to_pandas().astype(float)
+
+    array = _load_npy(path)
+    if chunksize:
+        return (
+            _npy_dataframe(array[start : start + chunksize], columns)
+            for start in range(0, len(array), chunksize)
+        )
+    return _npy_dataframe(array, columns)
+
+
+def expand_dataset_paths(paths: Iterable[Union[str, Path]]) -> List[Path]:
+    """Find the files of a dataset that is split in several files.
+
+    Arguments:
+        paths: paths to dataset files, glob patterns (e.g, ``"logs/*.csv"``), or
+            directories, whose files in a supported format are all included
+
+    Returns:
+        Paths to the dataset files, in the order given, with the files that
+        match each pattern or in each directory sorted by name
+
+    Raises:
+        ValueError: if a pattern or a directory does not match any file
+    """
+    files: List[Path] = []
+    for path in paths:
+        if Path(path).is_dir():
+            matches = sorted(
+                entry
+                for entry in Path(path).iterdir()
+                if entry.is_file() and entry.suffix.lower() in FORMATS
+            )
+        elif glob.has_magic(str(path)):
+            matches = sorted(Path(match) for match in glob.glob(str(path)))
+        else:
+            matches = [Path(path)]
+        if not matches:
+            raise ValueError(f"No dataset files found in '{path}'")
+        files.extend(matches)
+    return files
+
+
+def _read_shards(
+    paths: List[Path], columns: List[str], jobs: int
+) -> Iterator[pandas.DataFrame]:
+    # Keep reading the next shards while the current one is consumed
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending: Deque[Future] = deque()
+        remaining = iter(paths)
+        while True:
+            while len(pending) < jobs:
+                path = next(remaining, None)
+                if path is None:
+                    break
+                pending.append(executor.submit(read_dataset, path, columns))
+            if not pending:
+                return
+            yield pending.popleft().result()
+
+
+def _stream_shards(
+    paths: List[Path], columns: List[str], chunksize: int
+) -> Iterator[pandas.DataFrame]:
+    # Read the next chunk while the current one is consumed
+    chunks = itertools.chain.from_iterable(
+        read_dataset(path, columns, chunksize=chunksize) for path in paths
+    )
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending = executor.submit(next, chunks, None)
+        while True:
+            chunk = pending.result()
+            if chunk is None:
+                return
+            pending = executor.submit(next, chunks, None)
+            yield chunk
+
+
+def read_datasets(
+    paths: Iterable[Union[str, Path]],
+    columns: Iterable[str],
+    chunksize: Optional[int] = None,
+    jobs: Optional[int] = None,
+) -> Union[pandas.DataFrame, Iterator[pandas.DataFrame]]:
+    """Read the given columns of a dataset split in several files as floats.
+
+    The files are read in parallel in a pool of threads, and their columns
+    are checked before reading any rows. The rows of every file are copied into
+    a single array, which the dataframe uses without copying it again. A single
+    file is read exactly as with :py:func:`read_dataset`.
+
+    Arguments:
+        paths: paths to the dataset files, glob patterns or directories, see
+            :py:func:`expand_dataset_paths`
+        columns: names of the columns to read, the other columns are skipped
+        chunksize: if given, stream the files in order in chunks of at most
+            this number of rows, reading one chunk ahead in a background thread,
+            instead of concatenating all of them
+        jobs: maximum number of files to read at the same time, by default
+            the number of processors in the machine, unused if ``chunksize``
+            is given
+
+    Returns:
+        A dataframe with the given columns of all files, one after the other,
+        or an iterator of dataframes with at most ``chunksize`` rows each if
+        ``chunksize`` is given
+
+    Raises:
+        ValueError: if no files are found, the format of a file is not
+            supported or any of the columns is not in a file
+    """
+    files = expand_dataset_paths(paths)
+    columns = list(dict.fromkeys(columns))
+    if len(files) == 1:
+        return read_dataset(files[0], columns, chunksize=chunksize)
+
+    for path in files:
+        _dataset_format(path)
+        missing = set(columns) - set(dataset_columns(path))
+        if missing:
+            raise ValueError(
+                f"Columns {', '.join(sorted(missing))} not found in '{path}'"
+            )
+
+    if chunksize:
+        return _stream_shards(files, columns, chunksize)
+    shards = deque(_read_shards(files, columns, jobs or os.cpu_count() or 1))
+    # Fill a single array, releasing each shard once it is copied
+    values = numpy.empty((sum(len(shard.index) for shard in shards), len(columns)))
+    start = 0
+    while shards:
+        shard = shards.popleft()
+        values[start : start + len(shard.index)] = shard[columns].to_numpy(dtype=float)
+        start += len(shard.index)
+    return pandas.DataFrame(values, columns=columns, copy=False)
@@ -0,0 +1,95 @@
+"""Evaluation of the compiled model of an FMU on many samples at once.
+
+Going through the FMI takes a call to set the inputs and another to get the
+outputs of every sample. Instead, the binaries of the FMUs generated by this
+program export an ``autofmuEvaluate`` function that evaluates a whole matrix of
+samples in a single call, which :py:func:`evaluate` passes NumPy arrays to:
+
+.. code-block:: python
+
+   outputs = evaluate("model.fmu", dataframe[inputs].to_numpy())
+"""
+
+import ctypes
+import os
+from functools import lru_cache
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, List, Tuple
+from zipfile import ZipFile
+
+import numpy
+from lxml import etree
+
+from autofmu.utils import host_platform
+
+_DOUBLE_POINTER = ctypes.POINTER(ctypes.c_double)
+
+# Extracted libraries, which must stay on disk while they are loaded
+_library_dirs: List[TemporaryDirectory] = []
+
+
+@lru_cache(maxsize=32)
+def _load_model(path: str, mtime: int, size: int) -> Tuple[Any, int, int]:
+    # Loaded once per version of the FMU file, identified by its time and size
+    with ZipFile(path) as archive:
+        root = etree.fromstring(archive.read("modelDescription.xml"))
+        model_identifier = root.find("CoSimulation").get("modelIdentifier")
+        causalities = [
+            variable.get("causality") for variable in root.iter("ScalarVariable")
+        ]
+        platform, suffix = host_platform()
+        name = f"binaries/{platform}/{model_identifier}{suffix}"
+        if name not in archive.namelist():
+            raise ValueError(f"'{path}' has no binary for platform '{platform}'")
+        library_dir = TemporaryDirectory(prefix="autofmu-")
+        _library_dirs.append(library_dir)
+        library_path = archive.extract(name, library_dir.name)
+
+    library = ctypes.CDLL(library_path)
+    try:
+        function = library.autofmuEvaluate
+    except AttributeError:
+        raise ValueError(
+            f"'{path}' does not support bulk evaluation, generate it again"
+        ) from None
+    function.argtypes = [_DOUBLE_POINTER, _DOUBLE_POINTER, ctypes.c_size_t]
+    function.restype = None
+    return function, causalities.count("input"), causalities.count("output")
+
+
+def evaluate(fmu_path: Path, array: Any) -> numpy.ndarray:
+    """Evaluate the compiled model of an FMU on many samples at once.
+
+    The inputs are passed to the binary of the FMU for this platform without
+    copying them when they are already a C contiguous array of floats, and
+    the binary is loaded once for every call with the same FMU file.
+
+    Arguments:
+        fmu_path: path to an FMU generated by this program
+        array: matrix of input values with one row per sample, and one column
+            per input in the order of the model description
+
+    Returns:
+        Matrix of output values with one row per sample
+
+    Raises:
+        ValueError: if the FMU has no binary for this platform, or the array
+            does not have a column per input
+    """
+    stat = os.stat(fmu_path)
+    function, ninputs, noutputs = _load_model(
+        str(Path(fmu_path).resolve()), stat.st_mtime_ns, stat.st_size
+    )
+    inputs = numpy.ascontiguousarray(array, dtype=numpy.float64)
+    if inputs.ndim != 2 or inputs.shape[1] != ninputs:
+        raise ValueError(
+            f"Expected a matrix with {ninputs} columns, got shape {inputs.shape}"
+        )
+    outputs = numpy.empty((inputs.shape[0], noutputs))
+    function(
+        inputs.ctypes.data_as(_DOUBLE_POINTER),
+        outputs.ctypes.data_as(_DOUBLE_POINTER),
+        inputs.shape[0],
+    )
+    return outputs
@@ -0,0 +1,150 @@
+"""Reuse of the fits of a strategy to the same data across runs.
+
+Fits are stored in a :py:class:`~autofmu.cache.Cache`, keyed by a fingerprint
+of the values of the columns that were fitted, the strategy, its keyword
+arguments and the version of the program, so that changing only the name or
+the output file of an FMU, or generating it again after a compilation
+failure, does not fit the model again.
+
+Fits are stored as JSON, with the state of the fit written as in the FMUs
+(see :py:class:`~autofmu.state.FitState`), so that reading an entry of the
+cache never runs code.
+"""
+
+import hashlib
+import json
+import logging
+from dataclasses import asdict
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, Iterable, Optional, Tuple, Type
+
+import numpy
+import pandas
+
+from autofmu import __version__
+from autofmu.cache import Cache, digest
+from autofmu.state import FitState
+from autofmu.strategies import (
+    LinearRegressionResult,
+    LogisticRegressionResult,
+    LookupTableResult,
+    Result,
+    SparseLinearRegressionResult,
+)
+
+FINGERPRINT_CHUNK_ROWS = 65536
+"""Number of rows of each column hashed at a time by :py:func:`fingerprint`."""
+
+FIT_FILE = "fit.json"
+"""Name of the file that stores a fit in its cache entry."""
+
+_RESULT_TYPES: Dict[str, Type[Any]] = {
+    cls.__name__: cls
+    for cls in (
+        LinearRegressionResult,
+        SparseLinearRegressionResult,
+        LogisticRegressionResult,
+        LookupTableResult,
+    )
+}
+
+Fit = Tuple[str, Result, Optional[FitState]]
+
+
+def fingerprint(dataframe: pandas.DataFrame, columns: Iterable[str]) -> str:
+    """Compute a fingerprint of the values of some columns of a dataframe.
+
+    The values are hashed as floats, in chunks of
+    :py:data:`FINGERPRINT_CHUNK_ROWS` rows, so that no copy of a whole column
+    is made even when its values are not contiguous in memory.
+
+    Arguments:
+        dataframe: the dataframe with the values
+        columns: names of the columns to hash, in order
+
+    Returns:
+        Hexadecimal digest that identifies the values of the columns
+    """
+    sha = hashlib.blake2b(digest_size=32)
+    for column in columns:
+        values = dataframe[column].to_numpy(dtype=float)
+        sha.update(column.encode("utf-8"))
+        sha.update(len(values).to_bytes(8, "little"))
+        for start in range(0, len(values), FINGERPRINT_CHUNK_ROWS):
+            chunk = values[start : start + FINGERPRINT_CHUNK_ROWS]
+            sha.update(numpy.ascontiguousarray(chunk).data)
+    return sha.hexdigest()
+
+
+def fit_cache_key(data_fingerprint: str, strategy: str, **options: Any) -> str:
+    """Compute the key of a fit in the cache.
+
+    Arguments:
+        data_fingerprint: fingerprint of the data, see :py:func:`fingerprint`
+        strategy: name of the strategy
+        options: anything else that changes the fit, for example, the keyword
+            arguments of the strategy, which must be JSON serializable
+
+    Returns:
+        Key of the fit
+    """
+    return digest(
+        "fit",
+        __version__,
+        data_fingerprint,
+        strategy,
+        json.dumps(options, sort_keys=True),
+    )
+
+
+def load_fit(cache: Cache, key: str) -> Optional[Fit]:
+    """Load a fit from the cache.
+
+    Arguments:
+        cache: cache where the fit was stored
+        key: key of the fit, see :py:func:`fit_cache_key`
+
+    Returns:
+        The name of the strategy, its result and its state, or ``None`` if the
+        fit is not in the cache or cannot be read
+    """
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    try:
+        data = json.loads((entry / FIT_FILE).read_text())
+        result = _RESULT_TYPES[data["result_type"]](**data["result"])
+        state = FitState.from_dict(data["state"]) if data["state"] else None
+        return data["strategy"], result, state
+    except (OSError, ValueError, KeyError, TypeError) as error:
+        logging.warning("Ignoring unreadable cached fit '%s': %s", key, error)
+        return None
+
+
+def store_fit(cache: Cache, key: str, fit: Fit) -> None:
+    """Store a fit in the cache.
+
+    Arguments:
+        cache: cache to store the fit in
+        key: key of the fit, see :py:func:`fit_cache_key`
+        fit: the name of the strategy, its result and its state
+    """
+    strategy, result, state = fit
+    data = {
+        "strategy": strategy,
+        "result_type": type(result).__name__,
+        "result": asdict(result),
+        "state": state.to_dict() if state is not None else None,
+    }
+    with TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / FIT_FILE
+        path.write_text(json.dumps(data, default=_to_list))
+        cache.put(key, path)
+
+
+def _to_list(value: Any) -> Any:
+    # NumPy values that may be left in the fields of a result
+    if isinstance(value, (numpy.ndarray, numpy.generic)):
+        return value.tolist()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
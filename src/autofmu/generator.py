@@ -1,23 +1,45 @@
 """Utilities for generating valid Functional Mockup Units."""
 
+import logging
+import shutil
+from concurrent.futures import Executor
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
-from typing import Iterable, Union
-from uuid import uuid4
-from zipfile import ZipFile
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple, Union
+from uuid import NAMESPACE_URL, uuid5
 
+import numpy
 import pandas
 from jinja2 import Environment, FileSystemLoader
 from lxml import etree
 
 from autofmu import __version__
+from autofmu.cache import Cache
+from autofmu.fitcache import fingerprint, fit_cache_key, load_fit, store_fit
+from autofmu.profiling import stage
+from autofmu.sampling import (
+    SamplingOptions,
+    SamplingReport,
+    progressive_fit,
+    reservoir_sample,
+)
+from autofmu.selection import Candidate, select_strategy
+from autofmu.state import STATE_FILE, FitState
 from autofmu.strategies import (
-    LinearRegressionResult,
+    MAX_LOOKUP_INPUTS,
+    STRATEGIES,
+    LinearRegressionStatistics,
     LogisticRegressionResult,
-    linear_regression,
-    logistic_regression,
+    LookupTableResult,
+    Result,
+    SparseLinearRegressionResult,
 )
-from autofmu.utils import compile_fmu, slugify
+from autofmu.utils import compile_sources, slugify, write_archive
+
+UNROLL_THRESHOLD = 8
+"""Maximum non-zero coefficients of a sparse row to evaluate it unrolled."""
 
 
 def generate_model_description(
@@ -26,6 +48,9 @@ def generate_model_description(
     guid: str,
     inputs: Iterable[str],
     outputs: Iterable[str],
+    sampling: Optional[SamplingReport] = None,
+    result: Optional[Result] = None,
+    dependency_tolerance: float = 0.0,
 ) -> etree.ElementTree:
     """Generate a valid FMI 2.0 model description XML document.
 
@@ -35,6 +60,13 @@ def generate_model_description(
         guid: globaly unique identifier that identifies this model
         inputs: variable input names
         outputs: variable output names
+        sampling: if the model was fitted on a sample of the dataset, the
+            report of the sampling, recorded in the vendor annotations
+        result: the result of the approximation, to declare the inputs that
+            each output depends on in the model structure, by default every
+            output depends on every input
+        dependency_tolerance: coefficients of the result whose magnitude is
+            not larger than this tolerance are not declared as dependencies
 
     Returns:
         Valid FMI 2.0 model description XML document
@@ -54,7 +86,12 @@ def generate_model_description(
     model_exchange = etree.SubElement(
         root,
         "ModelExchange",
-        {"modelIdentifier": model_identifier},
+        {
+            "modelIdentifier": model_identifier,
+            "providesDirectionalDerivative": "true",
+            "canGetAndSetFMUstate": "true",
+            "canSerializeFMUstate": "true",
+        },
     )
     sourcefiles = etree.SubElement(model_exchange, "SourceFiles")
     etree.SubElement(sourcefiles, "File", {"name": f"{model_identifier}.c"})
@@ -63,7 +100,12 @@ def generate_model_description(
     co_simulation = etree.SubElement(
         root,
         "CoSimulation",
-        {"modelIdentifier": model_identifier},
+        {
+            "modelIdentifier": model_identifier,
+            "providesDirectionalDerivative": "true",
+            "canGetAndSetFMUstate": "true",
+            "canSerializeFMUstate": "true",
+        },
     )
     sourcefiles = etree.SubElement(co_simulation, "SourceFiles")
     etree.SubElement(sourcefiles, "File", {"name": f"{model_identifier}.c"})
@@ -75,6 +117,22 @@ def generate_model_description(
     etree.SubElement(log_categories, "Category", {"name": "logFmiCall"})
     etree.SubElement(log_categories, "Category", {"name": "logEvent"})
 
+    # Vendor annotations
+    if sampling is not None:
+        vendor_annotations = etree.SubElement(root, "VendorAnnotations")
+        tool = etree.SubElement(vendor_annotations, "Tool", {"name": "autofmu"})
+        etree.SubElement(
+            tool,
+            "Sampling",
+            {
+                "sampleSize": str(sampling.sample_size),
+                "totalRows": str(sampling.total_rows),
+                "validationScore": repr(sampling.score),
+                "fitTime": repr(sampling.fit_time),
+                "timeSaved": repr(sampling.time_saved),
+            },
+        )
+
     # Model variables and model structure
     model_variables = etree.SubElement(root, "ModelVariables")
     model_structure = etree.SubElement(root, "ModelStructure")
@@ -84,6 +142,17 @@ def generate_model_description(
         "InitialUnknowns",
     )
 
+    inputs = list(inputs)
+    outputs = list(outputs)
+    if result is not None:
+        # Indices of the input variables, which are listed first
+        dependencies: Optional[List[str]] = [
+            " ".join(str(index + 1) for index in output_dependencies)
+            for output_dependencies in result.dependencies(dependency_tolerance)
+        ]
+    else:
+        dependencies = None
+
     for index, variable in enumerate(inputs, 1):
         scalar_variable = etree.SubElement(
             model_variables,
@@ -91,33 +160,129 @@ def generate_model_description(
             {"name": variable, "valueReference": str(index), "causality": "input"},
         )
         etree.SubElement(scalar_variable, "Real", {"start": "0.0"})
-    for index, variable in enumerate(outputs, len(list(inputs)) + 1):
+    for output, variable in enumerate(outputs):
+        index = len(inputs) + output + 1
         scalar_variable = etree.SubElement(
             model_variables,
             "ScalarVariable",
             {"name": variable, "valueReference": str(index), "causality": "output"},
         )
         etree.SubElement(scalar_variable, "Real")
-        etree.SubElement(
-            model_structure_outputs,
-            "Unknown",
-            {"index": str(index), "dependencies": ""},
-        )
-        etree.SubElement(
-            model_structure_initial_unknowns,
-            "Unknown",
-            {"index": str(index)},
-        )
+        # Without a dependencies attribute, the output depends on every input
+        unknown = {"index": str(index)}
+        if dependencies is not None:
+            unknown["dependencies"] = dependencies[output]
+        etree.SubElement(model_structure_outputs, "Unknown", unknown)
+        etree.SubElement(model_structure_initial_unknowns, "Unknown", unknown)
 
     return etree.ElementTree(root)
 
 
+def generate_model_tables(
+    strategy: str,
+    result: Result,
+) -> Dict[str, Any]:
+    """Lay out the values of a result as the tables used by the C sources.
+
+    The logistic regression tables are flattened, with the values of each
+    output stored one after the other and sized exactly to its number of
+    classes. Binary outputs only have one decision function. The lookup tables
+    are flattened too, with the breakpoints of each input and the values of each
+    output one after the other. The sparse linear regression tables only keep
+    the non-zero coefficients, unrolled for rows with at most
+    :py:data:`UNROLL_THRESHOLD` of them and in compressed sparse row form for
+    the rest.
+
+    Arguments:
+        strategy: strategy used to find the approximation (e.g, "linear")
+        result: a result from an approximation calculation
+
+    Returns:
+        Mapping between table names and their values
+
+    Raises:
+        ValueError: if a lookup table has more than
+            :py:data:`~autofmu.strategies.MAX_LOOKUP_INPUTS` inputs
+    """
+    if isinstance(result, SparseLinearRegressionResult):
+        sparse: Dict[str, Any] = {"rows": [], "values": [], "columns": []}
+        for output, weights in enumerate(result.coefs):
+            terms = [(column, coef) for column, coef in enumerate(weights) if coef]
+            entry: Dict[str, Any] = {
+                "output": output,
+                "intercept": result.intercept[output],
+            }
+            if len(terms) <= UNROLL_THRESHOLD:
+                entry["terms"] = terms
+            else:
+                entry["start"] = len(sparse["values"])
+                entry["end"] = entry["start"] + len(terms)
+                sparse["columns"].extend(column for column, _ in terms)
+                sparse["values"].extend(coef for _, coef in terms)
+            sparse["rows"].append(entry)
+        return sparse
+    if isinstance(result, LookupTableResult):
+        if len(result.breakpoints) > MAX_LOOKUP_INPUTS:
+            raise ValueError(
+                f"A lookup table has at most {MAX_LOOKUP_INPUTS} inputs, "
+                f"not {len(result.breakpoints)}"
+            )
+        npoints = [len(points) for points in result.breakpoints]
+        offsets = [sum(npoints[:dim]) for dim in range(len(npoints))]
+        strides = [
+            int(numpy.prod(npoints[dim + 1 :], dtype=int))
+            for dim in range(len(npoints))
+        ]
+        return {
+            "breakpoints": [point for points in result.breakpoints for point in points],
+            "npoints": npoints,
+            "breakpoint_offsets": offsets,
+            "strides": strides,
+            "nvalues": len(result.values[0]),
+            "node_values": [value for values in result.values for value in values],
+        }
+    if not isinstance(result, LogisticRegressionResult):
+        return {}
+
+    tables: Dict[str, Any] = {
+        "outcomes": [],
+        "nclasses": [],
+        "outcome_offsets": [],
+        "coefs": [],
+        "intercepts": [],
+        "row_offsets": [],
+    }
+    for outcomes, coefs, intercepts in zip(
+        result.outcomes, result.coefs, result.intercepts
+    ):
+        tables["outcome_offsets"].append(len(tables["outcomes"]))
+        tables["outcomes"].extend(outcomes)
+        tables["nclasses"].append(len(outcomes))
+        tables["row_offsets"].append(len(tables["intercepts"]))
+        for row in coefs:
+            tables["coefs"].extend(row)
+        tables["intercepts"].extend(intercepts)
+    return tables
+
+
+@lru_cache(maxsize=None)
+def _template_environment() -> Environment:
+    return Environment(
+        block_start_string="/*%",
+        block_end_string="%*/",
+        variable_start_string="/**",
+        variable_end_string="**/",
+        loader=FileSystemLoader(Path(__file__).parent / "sources"),
+        autoescape=True,
+    )
+
+
 def generate_model_source(
     guid: str,
     inputs: Iterable[str],
     outputs: Iterable[str],
     strategy: str,
-    result: Union[LinearRegressionResult, LogisticRegressionResult],
+    result: Result,
 ) -> str:
     """Generate a valid FMI 2.0 C source code implementation.
 
@@ -130,15 +295,7 @@ def generate_model_source(
     Returns:
         Valid C source code that implements the FMI
     """
-    env = Environment(
-        block_start_string="/*%",
-        block_end_string="%*/",
-        variable_start_string="/**",
-        variable_end_string="**/",
-        loader=FileSystemLoader(Path(__file__).parent / "sources"),
-        autoescape=True,
-    )
-    template = env.get_template("fmi2Functions.c")
+    template = _template_environment().get_template("fmi2Functions.c")
     return template.render(
         {
             "guid": guid,
@@ -146,60 +303,540 @@ def generate_model_source(
             "outputs": outputs,
             "strategy": strategy,
             "result": result,
+            "tables": generate_model_tables(strategy, result),
         }
     )
 
 
-def generate_fmu(
-    dataframe: pandas.DataFrame,
+def generate_guid(
     model_name: str,
     inputs: Iterable[str],
     outputs: Iterable[str],
-    outfile: Path,
     strategy: str,
-) -> None:
-    """Generate a valid FMU model.
+    result: Result,
+) -> str:
+    """Generate a globaly unique identifier for a model.
+
+    The identifier is derived from the model contents, so that generating the
+    same model twice yields the same identifier and the same C sources, which
+    lets the compiled libraries be reused from a cache.
 
     Arguments:
-        dataframe: dataframe that contains the data used for the approximation
         model_name: name of the model as used in the modeling environment
         inputs: variable input names
         outputs: variable output names
-        outfile: path to the file to write the FMU
-        strategy: strategy to use to find the approximation (e.g, "linear")
+        strategy: strategy used to find the approximation (e.g, "linear")
+        result: a result from an approximation calculation
+
+    Returns:
+        Identifier in the UUID format
     """
-    model_identifier = slugify(model_name)
-    guid = str(uuid4())
+    name = repr(
+        (__version__, model_name, list(inputs), list(outputs), strategy, result)
+    )
+    return str(uuid5(NAMESPACE_URL, f"urn:autofmu:{name}"))
+
+
+def _log_sparsity(result: SparseLinearRegressionResult) -> None:
+    total = sum(len(row) for row in result.coefs)
+    logging.info(
+        "Kept %d of %d coefficients, score %.6f (%.6f with all of them)",
+        result.nonzeros(),
+        total,
+        result.score,
+        result.dense_score,
+    )
+
+
+def fit_model(
+    dataframe: Union[pandas.DataFrame, Iterable[pandas.DataFrame]],
+    inputs: Iterable[str],
+    outputs: Iterable[str],
+    strategy: str,
+    jobs: Optional[int] = None,
+    validation_fraction: float = 0.2,
+    folds: Optional[int] = None,
+    cost_tolerance: float = 0.0,
+    parameters: Optional[Mapping[str, Mapping[str, Any]]] = None,
+    previous: Optional[FitState] = None,
+    cache: Optional[Cache] = None,
+    candidates: Optional[List[Candidate]] = None,
+) -> Tuple[str, Result, Optional[FitState]]:
+    """Find the approximation of the outputs of a dataset with a strategy.
+
+    The linear strategies are fitted from the sufficient statistics of the
+    dataset, which are kept in the fit state together with the statistics of
+    ``previous``, so that they can be updated later with new rows only. The
+    logistic regression is warm started from the coefficients of
+    ``previous`` instead, as it has no such statistics.
+
+    Arguments:
+        dataframe: dataframe that contains the data used for the approximation,
+            or an iterable of dataframes that split it in chunks, in which case
+            the linear strategies fit the chunks without loading all of them
+        inputs: variable input names
+        outputs: variable output names
+        strategy: strategy to use to find the approximation (e.g, "linear"), or
+            "auto" to select the strategy that scores best on held-out data
+        jobs: maximum number of strategies to fit at the same time with the
+            "auto" strategy, or of outputs with the "logistic" strategy
+        validation_fraction: fraction of the rows held out to score the
+            candidates of the "auto" strategy
+        folds: if given, score the candidates of the "auto" strategy with k-fold
+            cross validation instead
+        cost_tolerance: score difference under which the "auto" strategy
+            prefers the candidate that is cheaper to evaluate
+        parameters: mapping between strategy names and the keyword arguments
+            to fit them with, for example ``{"lookup": {"resolution": 16}}``
+        previous: state of a previous fit of the same model to update with the
+            rows of ``dataframe``, whose strategy and keyword arguments are used
+        cache: cache of fits, to reuse the fit of the same strategy to the same
+            data (see :py:mod:`autofmu.fitcache`); the linear strategies fitted
+            in chunks and the updates of a previous fit are never cached, as
+            they take a single pass over the data
+        candidates: if given, the candidates scored by the "auto" strategy are
+            appended to this list, unless its fit was found in ``cache``
+
+    Returns:
+        The name of the strategy that was used, which is only different from
+        ``strategy`` for the "auto" strategy, its result and the state to
+        update it later, or ``None`` if the strategy cannot be updated
+
+    Raises:
+        ValueError: if ``previous`` was fitted with another strategy or other
+            variables
+    """
+    inputs = list(inputs)
+    outputs = list(outputs)
+    if previous is not None:
+        if (previous.strategy, previous.inputs, previous.outputs) != (
+            strategy,
+            inputs,
+            outputs,
+        ):
+            raise ValueError(
+                f"Cannot update a '{previous.strategy}' fit of {previous.inputs} "
+                f"to {previous.outputs} with a '{strategy}' fit of {inputs} "
+                f"to {outputs}"
+            )
+        kwargs: Mapping[str, Any] = previous.parameters
+    else:
+        kwargs = (parameters or {}).get(strategy, {})
 
-    with ZipFile(outfile, "w") as fmu:
-        # Write model description to the FMU zip file
-        model_description = generate_model_description(
-            model_name, model_identifier, guid, inputs, outputs
+    streaming = strategy in ("linear", "sparse") and not isinstance(
+        dataframe, pandas.DataFrame
+    )
+    if cache is not None and previous is None and not streaming:
+        if not isinstance(dataframe, pandas.DataFrame):
+            dataframe = pandas.concat(dataframe, ignore_index=True)
+        if strategy == "auto":
+            options: Dict[str, Any] = {
+                "parameters": {
+                    name: dict(values) for name, values in (parameters or {}).items()
+                },
+                "validation_fraction": validation_fraction,
+                "folds": folds,
+                "cost_tolerance": cost_tolerance,
+            }
+        else:
+            options = {"parameters": dict(kwargs)}
+        with stage("fingerprint"):
+            key = fit_cache_key(
+                fingerprint(dataframe, inputs + outputs),
+                strategy,
+                inputs=inputs,
+                outputs=outputs,
+                **options,
+            )
+        fit = load_fit(cache, key)
+        if fit is not None:
+            logging.info("Reusing the cached fit of strategy '%s'", strategy)
+            return fit  # type: ignore
+        fit = fit_model(
+            dataframe,
+            inputs,
+            outputs,
+            strategy,
+            jobs=jobs,
+            validation_fraction=validation_fraction,
+            folds=folds,
+            cost_tolerance=cost_tolerance,
+            parameters=parameters,
+            candidates=candidates,
         )
-        fmu.writestr(
-            "modelDescription.xml",
-            etree.tostring(model_description, pretty_print=True),
+        store_fit(cache, key, fit)
+        return fit
+
+    if strategy in ("linear", "sparse"):
+        chunks = [dataframe] if isinstance(dataframe, pandas.DataFrame) else dataframe
+        with stage("fit", strategy=f"{strategy}_statistics"):
+            statistics = LinearRegressionStatistics.from_chunks(chunks, inputs, outputs)
+            if previous is not None and previous.statistics is not None:
+                logging.info("Merging %d previous rows", previous.statistics.count)
+                statistics = previous.statistics.merge(statistics)
+            if strategy == "sparse":
+                result: Result = statistics.solve_sparse(**kwargs)
+            else:
+                result = statistics.solve()
+        if isinstance(result, SparseLinearRegressionResult):
+            _log_sparsity(result)
+        state = FitState(strategy, inputs, outputs, dict(kwargs), statistics)
+        return strategy, result, state
+
+    if not isinstance(dataframe, pandas.DataFrame):
+        dataframe = pandas.concat(dataframe, ignore_index=True)
+    if strategy == "auto":
+        with stage("select_strategy"):
+            strategy, scored = select_strategy(
+                dataframe,
+                inputs,
+                outputs,
+                validation_fraction=validation_fraction,
+                folds=folds,
+                cost_tolerance=cost_tolerance,
+                jobs=jobs,
+                parameters=parameters,
+            )
+        if candidates is not None:
+            candidates.extend(scored)
+        return fit_model(
+            dataframe, inputs, outputs, strategy, jobs=jobs, parameters=parameters
         )
+    extra: Dict[str, Any] = {}
+    if previous is not None:
+        extra["warm_start"] = previous.result
+    if strategy == "logistic":
+        extra["jobs"] = jobs
+    with stage("fit", strategy=strategy):
+        result = STRATEGIES[strategy](dataframe, inputs, outputs, **kwargs, **extra)
+    if isinstance(result, LogisticRegressionResult):
+        state = FitState(strategy, inputs, outputs, dict(kwargs), result=result)
+        return strategy, result, state
+    return strategy, result, None
+
+
+def fit_sampled_model(
+    dataframe: Union[pandas.DataFrame, Iterable[pandas.DataFrame]],
+    inputs: Iterable[str],
+    outputs: Iterable[str],
+    strategy: str,
+    sampling: Optional[SamplingOptions] = None,
+    jobs: Optional[int] = None,
+    validation_fraction: float = 0.2,
+    folds: Optional[int] = None,
+    cost_tolerance: float = 0.0,
+    parameters: Optional[Mapping[str, Mapping[str, Any]]] = None,
+    candidates: Optional[List[Candidate]] = None,
+) -> Tuple[str, Result, SamplingReport]:
+    """Find the approximation of the outputs of a dataset on a random sample.
+
+    A random sample of at most ``sampling.max_size`` rows is drawn while
+    reading the dataset, and the strategy is fitted on growing parts of it
+    until its validation score converges (see
+    :py:func:`~autofmu.sampling.progressive_fit`). The candidates of the
+    "auto" strategy are scored on the rows of the first step only.
+
+    Arguments:
+        dataframe: dataframe that contains the data used for the approximation,
+            or an iterable of dataframes that split it in chunks, which are
+            sampled without loading all of them
+        inputs: variable input names
+        outputs: variable output names
+        strategy: strategy to use to find the approximation (e.g, "linear"), or
+            "auto" to select the strategy that scores best on held-out data
+        sampling: options of the progressive sampling
+        jobs: maximum number of strategies to fit at the same time with the
+            "auto" strategy
+        validation_fraction: fraction of the rows held out to score the
+            candidates of the "auto" strategy
+        folds: if given, score the candidates of the "auto" strategy with k-fold
+            cross validation instead
+        cost_tolerance: score difference under which the "auto" strategy
+            prefers the candidate that is cheaper to evaluate
+        parameters: mapping between strategy names and the keyword arguments
+            to fit them with, for example ``{"lookup": {"resolution": 16}}``
+        candidates: if given, the candidates scored by the "auto" strategy are
+            appended to this list
 
-        # Write header files to the FMU zip file
-        headers = (Path(__file__).parent / "sources" / "headers").glob("**/*.h")
-        for header in headers:
-            fmu.write(str(header), f"sources/headers/{header.name}")
-
-        # Write source files to the FMU zip file
-        if strategy == "linear":
-            result = linear_regression(dataframe, inputs, outputs)  # type: ignore
-        elif strategy == "logistic":
-            result = logistic_regression(dataframe, inputs, outputs)  # type: ignore
-
-        model_source = generate_model_source(
-            guid=guid,
-            inputs=inputs,
-            outputs=outputs,
-            strategy=strategy,
-            result=result,
+    Returns:
+        The name of the strategy that was used, its result and the report of
+        the sampling
+    """
+    sampling = sampling or SamplingOptions()
+    chunks = [dataframe] if isinstance(dataframe, pandas.DataFrame) else dataframe
+    with stage("reservoir_sample"):
+        sample, total_rows = reservoir_sample(chunks, sampling.max_size, sampling.seed)
+    logging.info("Sampled %d of %d rows", len(sample.index), total_rows)
+
+    if strategy == "auto":
+        with stage("select_strategy"):
+            strategy, scored = select_strategy(
+                sample.iloc[: sampling.validation_size + sampling.initial_size],
+                inputs,
+                outputs,
+                validation_fraction=validation_fraction,
+                folds=folds,
+                cost_tolerance=cost_tolerance,
+                jobs=jobs,
+                parameters=parameters,
+            )
+        if candidates is not None:
+            candidates.extend(scored)
+    kwargs = (parameters or {}).get(strategy, {})
+    with stage("fit", strategy=strategy, sampled=True):
+        result, report = progressive_fit(
+            sample, inputs, outputs, strategy, kwargs, sampling, total_rows
         )
-        fmu.writestr("sources/fmi2Functions.c", model_source)
+    logging.info(
+        "Fitted %d of %d rows, saving an estimated %.3fs",
+        report.sample_size,
+        report.total_rows,
+        report.time_saved,
+    )
+    if isinstance(result, SparseLinearRegressionResult):
+        _log_sparsity(result)
+    return strategy, result, report
 
-    # Compile the generated source files
-    compile_fmu(model_identifier, outfile)
+
+def build_fmu(
+    model_name: str,
+    inputs: Iterable[str],
+    outputs: Iterable[str],
+    strategy: str,
+    result: Result,
+    outfile: Path,
+    targets: Optional[Iterable[str]] = None,
+    jobs: Optional[int] = None,
+    cache: Optional[Cache] = None,
+    executor: Optional[Executor] = None,
+    compression: str = "store",
+    build_dir: Optional[Path] = None,
+    backend: str = "direct",
+    sampling: Optional[SamplingReport] = None,
+    state: Optional[FitState] = None,
+    dependency_tolerance: float = 0.0,
+) -> None:
+    """Write and compile the FMU of an approximation.
+
+    The contents of the FMU are written once to a staging directory, where
+    the sources are compiled, and then packed into ``outfile`` in a single
+    pass. The FMU file is replaced atomically, so it is never seen half
+    written.
+
+    Arguments:
+        model_name: name of the model as used in the modeling environment
+        inputs: variable input names
+        outputs: variable output names
+        strategy: strategy used to find the approximation (e.g, "linear")
+        result: a result from an approximation calculation
+        outfile: path to the file to write the FMU
+        targets: names of the targets to compile the FMU to, by default all,
+            while an empty list compiles none
+        jobs: maximum number of targets to compile at the same time
+        cache: cache of compiled libraries, by default nothing is cached
+        executor: executor to run the compilation of each target, shared
+            between several FMUs, by default a new one is created
+        compression: compression method of the FMU file (see
+            :py:data:`~autofmu.utils.COMPRESSIONS`)
+        build_dir: directory to create the staging directory in, for example
+            a tmpfs mount, by default the system temporary directory
+        backend: how to compile each target (see
+            :py:data:`~autofmu.utils.BACKENDS`)
+        sampling: if the model was fitted on a sample of the dataset, the
+            report of the sampling, recorded in the model description
+        state: state of the fit, stored in the FMU to update it later (see
+            :py:mod:`autofmu.state`)
+        dependency_tolerance: coefficients of the result whose magnitude is
+            not larger than this tolerance are not declared as dependencies of
+            the outputs
+    """
+    model_identifier = slugify(model_name)
+    guid = generate_guid(model_name, inputs, outputs, strategy, result)
+
+    with TemporaryDirectory(dir=build_dir) as tmpdir:
+        source_dir = Path(tmpdir)
+        with stage("write_fmu"):
+            # Write model description to the staging directory
+            model_description = generate_model_description(
+                model_name,
+                model_identifier,
+                guid,
+                inputs,
+                outputs,
+                sampling,
+                result,
+                dependency_tolerance,
+            )
+            (source_dir / "modelDescription.xml").write_bytes(
+                etree.tostring(model_description, pretty_print=True)
+            )
+
+            # Copy header files to the staging directory
+            shutil.copytree(
+                Path(__file__).parent / "sources" / "headers",
+                source_dir / "sources" / "headers",
+            )
+
+            # Write source files to the staging directory
+            with stage("generate_model_source"):
+                model_source = generate_model_source(
+                    guid=guid,
+                    inputs=inputs,
+                    outputs=outputs,
+                    strategy=strategy,
+                    result=result,
+                )
+            (source_dir / "sources" / "fmi2Functions.c").write_text(model_source)
+
+            # Write the fit state to the resources of the staging directory
+            if state is not None:
+                (source_dir / STATE_FILE).parent.mkdir()
+                (source_dir / STATE_FILE).write_text(state.to_json())
+
+        # Compile the generated source files in place
+        with stage("compile_fmu"):
+            compile_sources(
+                model_identifier,
+                source_dir,
+                targets=targets,
+                jobs=jobs,
+                cache=cache,
+                executor=executor,
+                backend=backend,
+            )
+
+        # Pack the FMU in a single pass
+        with stage("write_archive"):
+            write_archive(source_dir, outfile, compression)
+
+
+def generate_fmu(
+    dataframe: Union[pandas.DataFrame, Iterable[pandas.DataFrame]],
+    model_name: str,
+    inputs: Iterable[str],
+    outputs: Iterable[str],
+    outfile: Path,
+    strategy: str,
+    targets: Optional[Iterable[str]] = None,
+    jobs: Optional[int] = None,
+    cache: Optional[Cache] = None,
+    validation_fraction: float = 0.2,
+    folds: Optional[int] = None,
+    cost_tolerance: float = 0.0,
+    parameters: Optional[Mapping[str, Mapping[str, Any]]] = None,
+    compression: str = "store",
+    build_dir: Optional[Path] = None,
+    backend: str = "direct",
+    sampling: Optional[SamplingOptions] = None,
+    previous: Optional[FitState] = None,
+    dependency_tolerance: float = 0.0,
+    fit_cache: Optional[Cache] = None,
+    candidates: Optional[List[Candidate]] = None,
+) -> str:
+    """Generate a valid FMU model.
+
+    The state of the fit is stored in the FMU, so that it can be updated later
+    with new rows only, by reading it with :py:func:`~autofmu.state.read_state`
+    and passing it as ``previous``. Models fitted on a sample of the dataset
+    cannot be updated.
+
+    Arguments:
+        dataframe: dataframe that contains the data used for the approximation,
+            or an iterable of dataframes that split it in chunks, in which case
+            the linear strategy fits the chunks without loading all of them
+        model_name: name of the model as used in the modeling environment
+        inputs: variable input names
+        outputs: variable output names
+        outfile: path to the file to write the FMU
+        strategy: strategy to use to find the approximation (e.g, "linear"), or
+            "auto" to select the strategy that scores best on held-out data
+        targets: names of the targets to compile the FMU to, by default all,
+            while an empty list compiles none
+        jobs: maximum number of targets to compile, of strategies to fit with
+            the "auto" strategy, or of outputs to fit with the "logistic"
+            strategy, at the same time
+        cache: cache of compiled libraries, by default nothing is cached
+        validation_fraction: fraction of the rows held out to score the
+            candidates of the "auto" strategy
+        folds: if given, score the candidates of the "auto" strategy with k-fold
+            cross validation instead
+        cost_tolerance: score difference under which the "auto" strategy
+            prefers the candidate that is cheaper to evaluate
+        parameters: mapping between strategy names and the keyword arguments
+            to fit them with, for example ``{"lookup": {"resolution": 16}}``
+        compression: compression method of the FMU file (see
+            :py:data:`~autofmu.utils.COMPRESSIONS`)
+        build_dir: directory to stage and compile the FMU in, by default the
+            system temporary directory
+        backend: how to compile each target (see
+            :py:data:`~autofmu.utils.BACKENDS`)
+        sampling: if given, fit the strategy on progressively larger random
+            samples of the dataset with these options, see
+            :py:func:`fit_sampled_model`
+        previous: state of a previous fit of the same model to update with the
+            rows of ``dataframe``, see :py:func:`fit_model`
+        dependency_tolerance: coefficients whose magnitude is not larger than
+            this tolerance are not declared as dependencies of the outputs
+        fit_cache: cache of fits, to reuse the fit of the same strategy to the
+            same data, by default the model is always fitted
+        candidates: if given, the candidates scored by the "auto" strategy are
+            appended to this list, see :py:func:`fit_model`
+
+    Returns:
+        The name of the strategy that was used, which is only different from
+        ``strategy`` for the "auto" strategy
+
+    Raises:
+        ValueError: if both ``sampling`` and ``previous`` are given
+    """
+    if sampling is not None and previous is not None:
+        raise ValueError("Cannot update a model by fitting it on a sample")
+    with stage("generate_fmu", model=model_name):
+        report, state = None, None
+        if sampling is not None:
+            strategy, result, report = fit_sampled_model(
+                dataframe,
+                inputs,
+                outputs,
+                strategy,
+                sampling,
+                jobs=jobs,
+                validation_fraction=validation_fraction,
+                folds=folds,
+                cost_tolerance=cost_tolerance,
+                parameters=parameters,
+                candidates=candidates,
+            )
+        else:
+            strategy, result, state = fit_model(
+                dataframe,
+                inputs,
+                outputs,
+                strategy,
+                jobs=jobs,
+                validation_fraction=validation_fraction,
+                folds=folds,
+                cost_tolerance=cost_tolerance,
+                parameters=parameters,
+                previous=previous,
+                cache=fit_cache,
+                candidates=candidates,
+            )
+        build_fmu(
+            model_name,
+            inputs,
+            outputs,
+            strategy,
+            result,
+            outfile,
+            targets=targets,
+            jobs=jobs,
+            cache=cache,
+            compression=compression,
+            build_dir=build_dir,
+            backend=backend,
+            sampling=report,
+            state=state,
+            dependency_tolerance=dependency_tolerance,
+        )
+    return strategy
@@ -2,12 +2,117 @@
 
 import logging
 import sys
-from typing import Optional, Sequence
+from argparse import Namespace
+from contextlib import ExitStack
+from pathlib import Path
+from typing import List, Optional, Sequence
 
-import pandas
-
-from autofmu.cli import create_argument_parser
+from autofmu.batch import format_statuses, load_manifest, run_batch
+from autofmu.cache import Cache
+from autofmu.cli import (
+    create_argument_parser,
+    create_batch_argument_parser,
+    create_serve_argument_parser,
+)
+from autofmu.dataset import expand_dataset_paths, read_datasets
 from autofmu.generator import generate_fmu
+from autofmu.profiling import profile, stage
+from autofmu.sampling import SamplingOptions
+from autofmu.selection import Candidate, format_candidates
+from autofmu.service import Service, create_server
+from autofmu.state import read_state
+
+
+def create_cache(options: Namespace) -> Optional[Cache]:
+    """Create the cache of compiled libraries requested in the command line.
+
+    Arguments:
+        options: parsed command line arguments
+
+    Returns:
+        The cache, or ``None`` if caching was disabled
+    """
+    if not options.cache:
+        return None
+    return Cache(options.cache_dir, options.cache_size * 1024 * 1024)
+
+
+def batch(args: Sequence[str]) -> None:
+    """Execute the ``autofmu batch`` command in a command line environment.
+
+    Arguments:
+        args: sequence of command line arguments, after ``batch``
+    """
+    parser = create_batch_argument_parser()
+    options = parser.parse_args(args)
+
+    if options.verbose:
+        logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+    try:
+        items = load_manifest(options.manifest)
+    except (OSError, ValueError, ImportError) as error:
+        parser.error(str(error))
+    logging.info("Generating %d FMUs from '%s'", len(items), options.manifest)
+
+    cache = create_cache(options)
+    statuses = run_batch(
+        items,
+        jobs=options.jobs,
+        targets=options.targets,
+        cache=cache,
+        compression=options.compression,
+        build_dir=options.build_dir,
+        backend=options.backend,
+        fit_cache=cache if options.fit_cache else None,
+    )
+    print(format_statuses(statuses))
+    if not all(status.ok for status in statuses):
+        sys.exit(1)
+
+
+def serve(args: Sequence[str]) -> None:
+    """Execute the ``autofmu serve`` command in a command line environment.
+
+    Arguments:
+        args: sequence of command line arguments, after ``serve``
+    """
+    parser = create_serve_argument_parser()
+    options = parser.parse_args(args)
+
+    logging.basicConfig(
+        level=logging.INFO if options.verbose else logging.WARNING,
+        format="[%(levelname)s] %(message)s",
+    )
+
+    queue_size = options.workers if options.queue_size is None else options.queue_size
+    cache = create_cache(options)
+    service = Service(
+        workers=options.workers,
+        queue_size=queue_size,
+        jobs=options.jobs,
+        targets=options.targets,
+        cache=cache,
+        compression=options.compression,
+        build_dir=options.build_dir,
+        backend=options.backend,
+        fit_cache=cache if options.fit_cache else None,
+    )
+    server = create_server(service, options.host, options.port, options.unix_socket)
+    if options.unix_socket:
+        print(f"Listening on '{options.unix_socket}'", flush=True)
+    else:
+        host, port = server.server_address[:2]
+        print(f"Listening on http://{host}:{port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if options.unix_socket:
+            options.unix_socket.unlink()
 
 
 def main(args: Optional[Sequence[str]] = None) -> None:
@@ -16,26 +121,120 @@ def main(args: Optional[Sequence[str]] = None) -> None:
     Arguments:
         args: sequence of command line arguments
     """
+    args = list(args if args else sys.argv[1:])
+    if args and args[0] == "batch":
+        batch(args[1:])
+        return
+    if args and args[0] == "serve":
+        serve(args[1:])
+        return
+
     parser = create_argument_parser()
-    options = parser.parse_args(args if args else sys.argv[1:])
+    options = parser.parse_args(args)
+
+    previous = None
+    if options.update:
+        try:
+            previous = read_state(options.update)
+        except (OSError, ValueError) as error:
+            parser.error(str(error))
+        if options.sample:
+            parser.error("argument --sample: not allowed with argument --update")
+        for name in ("inputs", "outputs"):
+            variables = getattr(options, name) or getattr(previous, name)
+            if variables != getattr(previous, name):
+                parser.error(
+                    f"argument --{name}: '{options.update}' was fitted with "
+                    f"{' '.join(getattr(previous, name))}"
+                )
+            setattr(options, name, variables)
+        options.strategy = previous.strategy
+    elif not options.inputs or not options.outputs:
+        parser.error("the following arguments are required: --inputs, --outputs")
+    options.outfile = options.outfile or options.update or Path("model.fmu")
 
     if options.verbose:
         logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
 
-    model_name = options.outfile.stem
-
-    logging.info("Reading dataset '%s'", options.dataset)
-    dataframe = pandas.read_csv(options.dataset)
-    nrows = len(dataframe.index)
-    ncols = len(dataframe.columns)
-    logging.info("Read %d rows and %d columns from '%s'", nrows, ncols, options.dataset)
-
-    logging.info("Generating FMU '%s'", options.outfile)
-    generate_fmu(
-        dataframe=dataframe,  # type: ignore
-        model_name=model_name,
-        inputs=options.inputs,
-        outputs=options.outputs,
-        outfile=options.outfile,
-        strategy=options.strategy,
-    )
+    with ExitStack() as stack:
+        profiler = stack.enter_context(profile()) if options.profile else None
+        with stage("main"):
+            model_name = options.outfile.stem
+
+            # A sample is drawn while reading, so the dataset is always streamed
+            chunksize = options.chunksize or (
+                options.sample_max_size if options.sample else None
+            )
+            try:
+                paths = expand_dataset_paths(options.dataset)
+                logging.info("Reading dataset from %d files", len(paths))
+                with stage("read_dataset", paths=[str(path) for path in paths]):
+                    dataframe = read_datasets(
+                        paths,
+                        [*options.inputs, *options.outputs],
+                        chunksize=chunksize,
+                        jobs=options.jobs,
+                    )
+            except ValueError as error:
+                parser.error(str(error))
+            if chunksize:
+                logging.info("Reading chunks of %d rows", chunksize)
+            else:
+                nrows = len(dataframe.index)  # type: ignore
+                ncols = len(dataframe.columns)  # type: ignore
+                logging.info(
+                    "Read %d rows and %d columns from %d files",
+                    nrows,
+                    ncols,
+                    len(paths),
+                )
+
+            logging.info("Generating FMU '%s'", options.outfile)
+            cache = create_cache(options)
+            candidates: List[Candidate] = []
+            strategy = generate_fmu(
+                dataframe=dataframe,  # type: ignore
+                model_name=model_name,
+                inputs=options.inputs,
+                outputs=options.outputs,
+                outfile=options.outfile,
+                strategy=options.strategy,
+                targets=options.targets,
+                jobs=options.jobs,
+                cache=cache,
+                validation_fraction=options.validation_fraction,
+                folds=options.folds,
+                cost_tolerance=options.cost_tolerance,
+                parameters={
+                    "lookup": {
+                        "resolution": options.resolution,
+                        "max_size": options.max_table_size,
+                    },
+                    "sparse": {"tolerance": options.sparse_tolerance},
+                    "logistic": {"solver": options.solver},
+                },
+                compression=options.compression,
+                build_dir=options.build_dir,
+                backend=options.backend,
+                sampling=(
+                    SamplingOptions(
+                        initial_size=options.sample_initial_size,
+                        max_size=options.sample_max_size,
+                        tolerance=options.sample_tolerance,
+                    )
+                    if options.sample
+                    else None
+                ),
+                previous=previous,
+                dependency_tolerance=options.dependency_tolerance,
+                fit_cache=cache if options.fit_cache else None,
+                candidates=candidates,
+            )
+            if options.strategy == "auto":
+                if candidates:
+                    print(format_candidates(candidates))
+                print(f"Selected strategy '{strategy}'")
+
+    if profiler:
+        profiler.write_trace(options.profile)
+        logging.info("Profile written to '%s'", options.profile)
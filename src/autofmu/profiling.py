@@ -0,0 +1,214 @@
+"""Measurements of the time and memory spent on each stage of the program.
+
+Stages are delimited with the :py:func:`stage` context manager, which does
+nothing unless a profiler is active. To collect the measurements, activate a
+profiler with :py:func:`profile`:
+
+.. code-block:: python
+
+   with profile() as profiler:
+       generate_fmu(...)
+   for measurement in profiler.stages:
+       print(measurement.name, measurement.wall_time)
+   profiler.write_trace("trace.json")
+
+The trace is written in the Chrome trace event format, which can be opened in
+``chrome://tracing`` or in Perfetto.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None  # type: ignore
+
+
+def _peak_rss() -> int:
+    if resource is None:  # pragma: no cover
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, while macOS reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _rss() -> int:
+    # Only Linux exposes the current resident set size without extra packages
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):  # pragma: no cover
+        return 0
+
+
+def _children_cpu_time() -> float:
+    if resource is None:  # pragma: no cover
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+@dataclass
+class Stage:
+    """Measurements of a stage of the program.
+
+    The memory is measured for the whole process: ``rss`` is its resident set
+    size when the stage ended, and ``peak_rss_increase`` is how much the stage
+    raised the peak resident set size of the process, which is zero for every
+    stage that did not use more memory than the stages before it.
+    """
+
+    name: str
+    start: float
+    wall_time: float
+    cpu_time: float
+    children_cpu_time: float
+    rss: int
+    peak_rss_increase: int
+    thread: int
+    args: Dict[str, Any] = field(default_factory=dict)
+
+
+class Profiler:
+    """Collector of the measurements of the stages of the program."""
+
+    def __init__(self, callback: Optional[Callable[[Stage], None]] = None) -> None:
+        """Create a profiler.
+
+        Arguments:
+            callback: function called with the measurements of each stage as
+                soon as the stage ends
+        """
+        self.stages: List[Stage] = []
+        self.callback = callback
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, measurement: Stage) -> None:
+        """Record the measurements of a stage.
+
+        Arguments:
+            measurement: measurements of the stage
+        """
+        with self._lock:
+            self.stages.append(measurement)
+        if self.callback:
+            self.callback(measurement)
+
+    def trace(self) -> Dict[str, Any]:
+        """Convert the measurements to the Chrome trace event format.
+
+        Returns:
+            A JSON serializable trace, with one complete event per stage
+        """
+        events = []
+        for measurement in self.stages:
+            args = dict(measurement.args)
+            args.update(
+                {
+                    "cpu_time": measurement.cpu_time,
+                    "children_cpu_time": measurement.children_cpu_time,
+                    "rss": measurement.rss,
+                    "peak_rss_increase": measurement.peak_rss_increase,
+                }
+            )
+            events.append(
+                {
+                    "name": measurement.name,
+                    "cat": "autofmu",
+                    "ph": "X",
+                    "ts": (measurement.start - self.origin) * 1e6,
+                    "dur": measurement.wall_time * 1e6,
+                    "pid": os.getpid(),
+                    "tid": measurement.thread,
+                    "args": args,
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_trace(self, path: Path) -> None:
+        """Write the measurements to a file in the Chrome trace event format.
+
+        Arguments:
+            path: path to the trace file
+        """
+        Path(path).write_text(json.dumps(self.trace(), indent=2))
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """List the measurements of every stage as plain dictionaries."""
+        return [asdict(measurement) for measurement in self.stages]
+
+
+_profilers: List[Profiler] = []
+_profilers_lock = threading.Lock()
+
+
+@contextmanager
+def profile(callback: Optional[Callable[[Stage], None]] = None) -> Iterator[Profiler]:
+    """Collect the measurements of the stages run inside this context.
+
+    Arguments:
+        callback: function called with the measurements of each stage as soon
+            as the stage ends
+
+    Yields:
+        The profiler that collects the measurements
+    """
+    profiler = Profiler(callback)
+    with _profilers_lock:
+        _profilers.append(profiler)
+    try:
+        yield profiler
+    finally:
+        with _profilers_lock:
+            _profilers.remove(profiler)
+
+
+@contextmanager
+def stage(name: str, **args: Any) -> Iterator[None]:
+    """Measure a stage of the program.
+
+    The wall time, the CPU time of the process and of its finished child
+    processes (for example, the compilers), the resident set size at the end of
+    the stage and the increase of the peak resident set size are measured. The
+    CPU time is measured for the whole process, so it includes the time of any
+    stage that runs at the same time in another thread.
+
+    Arguments:
+        name: name of the stage
+        args: extra information about the stage to record in the trace
+    """
+    if not _profilers:
+        yield
+        return
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    children_start = _children_cpu_time()
+    peak_start = _peak_rss()
+    try:
+        yield
+    finally:
+        measurement = Stage(
+            name=name,
+            start=start,
+            wall_time=time.perf_counter() - start,
+            cpu_time=time.process_time() - cpu_start,
+            children_cpu_time=_children_cpu_time() - children_start,
+            rss=_rss(),
+            peak_rss_increase=_peak_rss() - peak_start,
+            thread=threading.get_ident(),
+            args=args,
+        )
+        with _profilers_lock:
+            profilers = list(_profilers)
+        for profiler in profilers:
+            profiler.add(measurement)
@@ -0,0 +1,196 @@
+"""Fitting of strategies on progressively larger random samples of a dataset.
+
+Fitting a strategy on every row of a large dataset is often wasted effort, as
+the model stops improving long before. Instead, a uniform random sample of
+bounded size is drawn while streaming the dataset, and the strategy is fitted
+on geometrically growing parts of it until the score on held-out rows
+converges.
+"""
+
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Iterable, List, Mapping, Optional, Tuple
+
+import numpy
+import pandas
+
+from autofmu.selection import validation_score
+from autofmu.strategies import STRATEGIES, Result
+
+DEFAULT_INITIAL_SIZE = 1000
+"""Default number of rows of the first sample the strategy is fitted on."""
+
+DEFAULT_MAX_SIZE = 1000000
+"""Default maximum number of rows of the random sample kept in memory."""
+
+DEFAULT_TOLERANCE = 1e-3
+"""Default change of the validation score under which the fit has converged."""
+
+MIN_VALIDATION_SIZE = 2
+"""Minimum number of held-out rows, the validation score needs at least two."""
+
+
+@dataclass
+class SamplingOptions:
+    """Options of the progressive sampling of a dataset."""
+
+    initial_size: int = DEFAULT_INITIAL_SIZE
+    growth: float = 2.0
+    tolerance: float = DEFAULT_TOLERANCE
+    max_size: int = DEFAULT_MAX_SIZE
+    validation_size: int = 10000
+    seed: int = 0
+
+
+@dataclass
+class SamplingReport:
+    """Outcome of fitting a strategy on progressively larger samples."""
+
+    sample_size: int
+    total_rows: int
+    fit_time: float
+    time_saved: float
+    scores: List[Tuple[int, float]] = field(default_factory=list)
+
+    @property
+    def score(self) -> float:
+        """Validation score of the sample size that was used."""
+        return self.scores[-1][1] if self.scores else float("nan")
+
+
+def reservoir_sample(
+    chunks: Iterable[pandas.DataFrame], size: int, seed: int = 0
+) -> Tuple[pandas.DataFrame, int]:
+    """Draw a uniform random sample of the rows of a dataset read in chunks.
+
+    Every row gets a random key and the rows with the smallest keys are kept,
+    so only ``size`` rows are in memory at any time. The sample is returned
+    sorted by key, which means that its first rows are in turn a uniform
+    random sample of the dataset, of any size.
+
+    Arguments:
+        chunks: the dataset split in dataframes with the same columns
+        size: maximum number of rows of the sample
+        seed: seed of the random number generator
+
+    Returns:
+        The sample, in random order, and the number of rows of the dataset
+    """
+    rng = numpy.random.default_rng(seed)
+    sample: Optional[pandas.DataFrame] = None
+    keys = numpy.empty(0)
+    total = 0
+    for chunk in chunks:
+        total += len(chunk.index)
+        chunk_keys = rng.random(len(chunk.index))
+        if sample is not None and len(keys) >= size:
+            # Only rows with a smaller key than the largest kept one can enter
+            accepted = chunk_keys < keys.max()
+            chunk, chunk_keys = chunk[accepted], chunk_keys[accepted]
+        if not len(chunk_keys):
+            continue
+        if sample is None:
+            sample, keys = chunk, chunk_keys
+        else:
+            sample = pandas.concat([sample, chunk], ignore_index=True)
+            keys = numpy.concatenate([keys, chunk_keys])
+        if len(keys) > size:
+            kept = numpy.argpartition(keys, size - 1)[:size]
+            sample, keys = sample.iloc[kept], keys[kept]
+
+    if sample is None:
+        raise ValueError("Cannot sample an empty dataset")
+    order = numpy.argsort(keys, kind="stable")
+    return sample.iloc[order].reset_index(drop=True), total
+
+
+def progressive_fit(
+    sample: pandas.DataFrame,
+    inputs: Iterable[str],
+    outputs: Iterable[str],
+    strategy: str,
+    parameters: Optional[Mapping[str, Any]] = None,
+    options: Optional[SamplingOptions] = None,
+    total_rows: Optional[int] = None,
+) -> Tuple[Result, SamplingReport]:
+    """Fit a strategy on geometrically growing parts of a random sample.
+
+    The first rows of the sample, at least :py:data:`MIN_VALIDATION_SIZE`, are
+    held out for validation, and the strategy is fitted on the following
+    ``initial_size`` rows, then on ``growth`` times as many, and so on, until
+    the validation score changes by less than ``tolerance`` or the whole sample
+    is used. The time saved is
+    estimated by extrapolating the time of the last fit to every row of the
+    dataset.
+
+    Arguments:
+        sample: random sample of the dataset, in random order, as returned by
+            :py:func:`reservoir_sample`
+        inputs: input variable names
+        outputs: output variable names
+        strategy: name of the strategy to fit, as in
+            :py:data:`~autofmu.strategies.STRATEGIES`
+        parameters: keyword arguments to fit the strategy with
+        options: options of the progressive sampling
+        total_rows: number of rows of the whole dataset, by default the number
+            of rows of the sample
+
+    Returns:
+        The result of the last fit and the report of the sampling
+
+    Raises:
+        ValueError: if the sample is too small to hold out validation rows
+    """
+    options = options or SamplingOptions()
+    inputs = list(inputs)
+    outputs = list(outputs)
+    nvalidation = max(
+        min(options.validation_size, len(sample.index) // 5), MIN_VALIDATION_SIZE
+    )
+    if len(sample.index) <= nvalidation:
+        raise ValueError(
+            f"The sample needs more than {nvalidation} rows to hold out "
+            "validation rows"
+        )
+    validation = sample.iloc[:nvalidation]
+    train = sample.iloc[nvalidation:]
+
+    size = min(options.initial_size, len(train.index))
+    scores: List[Tuple[int, float]] = []
+    spent = 0.0
+    while True:
+        start = time.perf_counter()
+        try:
+            result = STRATEGIES[strategy](
+                train.iloc[:size], inputs, outputs, **(parameters or {})
+            )
+        except ValueError:
+            # Small samples may miss some classes, retry with a larger one
+            if size >= len(train.index):
+                raise
+            spent += time.perf_counter() - start
+            size = min(int(size * options.growth), len(train.index))
+            continue
+        elapsed = time.perf_counter() - start
+        spent += elapsed
+        score = validation_score(result, validation, inputs, outputs)
+        logging.info(
+            "Fitted %d rows in %.3fs, validation score %.6f", size, elapsed, score
+        )
+        converged = bool(scores) and abs(score - scores[-1][1]) < options.tolerance
+        scores.append((size, score))
+        if converged or size >= len(train.index):
+            break
+        size = min(int(size * options.growth), len(train.index))
+
+    total = total_rows if total_rows is not None else len(sample.index)
+    estimated = elapsed * total / size
+    report = SamplingReport(
+        sample_size=size,
+        total_rows=total,
+        fit_time=spent,
+        time_saved=max(0.0, estimated - spent),
+        scores=scores,
+    )
+    return result, report
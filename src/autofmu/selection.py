@@ -0,0 +1,235 @@
+"""Automatic selection of the strategy that best approximates a dataset."""
+
+import logging
+import math
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass
+from typing import Any, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy
+import pandas
+from sklearn.metrics import r2_score
+from sklearn.model_selection import KFold, train_test_split
+
+from autofmu.strategies import STRATEGIES, Result
+from autofmu.utils import SerialExecutor
+
+MAX_CLASSES = 50
+"""Maximum number of distinct values of an output to consider it categorical."""
+
+
+@dataclass
+class Candidate:
+    """Validation results of fitting a strategy."""
+
+    strategy: str
+    score: float
+    fit_time: float
+    cost: int
+    error: Optional[str] = None
+
+
+def applicable_strategies(
+    dataframe: pandas.DataFrame,
+    outputs: Iterable[str],
+) -> List[str]:
+    """List the strategies that can approximate the outputs of a dataset.
+
+    Every strategy applies to any dataset, except for the logistic regression
+    that only applies when all outputs are categorical, that is, they take at
+    least two and at most :py:data:`MAX_CLASSES` distinct values.
+
+    Arguments:
+        dataframe: dataframe that contains the data used for the approximation
+        outputs: output variable names
+
+    Returns:
+        Names of the applicable strategies, as in
+        :py:data:`~autofmu.strategies.STRATEGIES`
+    """
+    strategies = []
+    for strategy in STRATEGIES:
+        if strategy == "logistic":
+            nrows = len(dataframe.index)
+            counts = [dataframe[output].nunique() for output in outputs]
+            if not all(2 <= count <= min(MAX_CLASSES, nrows // 2) for count in counts):
+                continue
+        strategies.append(strategy)
+    return strategies
+
+
+def validation_score(
+    result: Result,
+    dataframe: pandas.DataFrame,
+    inputs: Sequence[str],
+    outputs: Sequence[str],
+) -> float:
+    """Score the predictions of a result against a dataset.
+
+    All strategies are scored with the coefficient of determination (R²) of
+    their predictions, averaged across outputs, so that their scores are
+    comparable.
+
+    Arguments:
+        result: a result from an approximation calculation
+        dataframe: dataframe with the validation data
+        inputs: input variable names
+        outputs: output variable names
+
+    Returns:
+        Coefficient of determination of the predictions
+    """
+    predictions = result.predict(dataframe[list(inputs)].to_numpy(dtype=float))
+    return float(r2_score(dataframe[list(outputs)].to_numpy(dtype=float), predictions))
+
+
+def _fit_and_score(
+    strategy: str,
+    train: pandas.DataFrame,
+    validation: pandas.DataFrame,
+    inputs: Sequence[str],
+    outputs: Sequence[str],
+    parameters: Mapping[str, Any],
+) -> Tuple[float, float, int]:
+    start = time.perf_counter()
+    result = STRATEGIES[strategy](train, inputs, outputs, **parameters)
+    fit_time = time.perf_counter() - start
+    score = validation_score(result, validation, inputs, outputs)
+    return score, fit_time, result.evaluation_cost()
+
+
+def format_candidates(candidates: Iterable[Candidate]) -> str:
+    """Format the validation results of the candidates as a table.
+
+    Arguments:
+        candidates: validation results of each strategy
+
+    Returns:
+        A text table with the score, fit time and evaluation cost of each
+        strategy
+    """
+    lines = [f"{'strategy':<12} {'score':>10} {'fit time':>10} {'cost':>8}"]
+    for candidate in candidates:
+        if candidate.error:
+            lines.append(f"{candidate.strategy:<12} failed: {candidate.error}")
+        else:
+            lines.append(
+                f"{candidate.strategy:<12} {candidate.score:>10.6f} "
+                f"{candidate.fit_time:>9.3f}s {candidate.cost:>8d}"
+            )
+    return "\n".join(lines)
+
+
+def select_strategy(
+    dataframe: pandas.DataFrame,
+    inputs: Iterable[str],
+    outputs: Iterable[str],
+    validation_fraction: float = 0.2,
+    folds: Optional[int] = None,
+    cost_tolerance: float = 0.0,
+    jobs: Optional[int] = None,
+    parameters: Optional[Mapping[str, Mapping[str, Any]]] = None,
+) -> Tuple[str, List[Candidate]]:
+    """Find the strategy that best approximates a dataset on held-out data.
+
+    Every applicable strategy is fitted at the same time in a pool of
+    processes, either on a train/validation split of the dataset or on each
+    fold of a k-fold cross validation, and scored with
+    :py:func:`validation_score` on the data that was held out.
+
+    Arguments:
+        dataframe: dataframe that contains the data used for the approximation
+        inputs: input variable names
+        outputs: output variable names
+        validation_fraction: fraction of the rows held out for validation
+        folds: if given, use k-fold cross validation with this number of folds
+            instead of a single train/validation split
+        cost_tolerance: strategies whose score is within this tolerance of
+            the best one are considered tied, and the tie is broken by the
+            cheapest evaluation cost
+        jobs: maximum number of strategies to fit at the same time, by default
+            the number of processors in the machine
+        parameters: mapping between strategy names and the keyword arguments
+            to fit them with
+
+    Returns:
+        The name of the selected strategy and the validation results of every
+        candidate
+
+    Raises:
+        ValueError: if no strategy could be fitted to the dataset
+    """
+    inputs = list(inputs)
+    outputs = list(outputs)
+    strategies = applicable_strategies(dataframe, outputs)
+
+    if folds:
+        splitter = KFold(n_splits=folds, shuffle=True, random_state=0)
+        splits = [
+            (dataframe.iloc[train], dataframe.iloc[validation])
+            for train, validation in splitter.split(dataframe)
+        ]
+    else:
+        splits = [
+            tuple(
+                train_test_split(
+                    dataframe, test_size=validation_fraction, random_state=0
+                )
+            )
+        ]
+
+    with ExitStack() as stack:
+        # Fit inline with a single job, which is also safe inside worker processes
+        if jobs == 1:
+            executor: Executor = SerialExecutor()
+        else:
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=jobs))
+        futures = {
+            strategy: [
+                executor.submit(
+                    _fit_and_score,
+                    strategy,
+                    train,
+                    validation,
+                    inputs,
+                    outputs,
+                    (parameters or {}).get(strategy, {}),
+                )
+                for train, validation in splits
+            ]
+            for strategy in strategies
+        }
+        candidates = []
+        for strategy, strategy_futures in futures.items():
+            try:
+                scores, fit_times, costs = zip(
+                    *(future.result() for future in strategy_futures)
+                )
+            except Exception as error:
+                candidates.append(Candidate(strategy, math.nan, 0.0, 0, str(error)))
+                continue
+            candidates.append(
+                Candidate(
+                    strategy=strategy,
+                    score=float(numpy.mean(scores)),
+                    fit_time=float(numpy.mean(fit_times)),
+                    cost=max(costs),
+                )
+            )
+
+    logging.info("Strategy candidates:\n%s", format_candidates(candidates))
+
+    valid = [candidate for candidate in candidates if not candidate.error]
+    if not valid:
+        raise ValueError("No strategy could be fitted to the dataset")
+    best_score = max(candidate.score for candidate in valid)
+    tied = [
+        candidate
+        for candidate in valid
+        if candidate.score >= best_score - cost_tolerance
+    ]
+    selected = min(tied, key=lambda candidate: (candidate.cost, -candidate.score))
+    logging.info("Selected strategy '%s'", selected.strategy)
+    return selected.strategy, candidates
@@ -0,0 +1,509 @@
+"""Long-running service that generates FMUs on request.
+
+The service keeps a pool of worker processes with the libraries already
+imported, the templates loaded and the compilers detected, so that a request
+only pays for fitting the model and compiling it. It speaks HTTP, over TCP or
+over a Unix socket:
+
+* ``POST /fmus`` generates an FMU and responds with its contents. The request
+  is either a JSON generation spec, with the path of a dataset readable by the
+  service::
+
+     {"dataset": "/data/plant.csv", "inputs": ["x", "y"], "outputs": ["z"],
+      "strategy": "linear", "name": "Plant"}
+
+  or the dataset itself uploaded as the request body, with the spec in the
+  query string (``?inputs=x,y&outputs=z&format=csv``).
+* ``GET /metrics`` reports the number of queued and running jobs and the
+  latency of the latest jobs, as JSON.
+* ``GET /health`` reports that the service is up.
+
+At most ``workers`` jobs run at the same time and at most ``queue_size`` more
+wait for a worker. Requests beyond that are rejected with
+``503 Service Unavailable`` and a ``Retry-After`` header, instead of
+oversubscribing the build host.
+"""
+
+import json
+import logging
+import os
+import shutil
+import signal
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from socketserver import ThreadingMixIn, UnixStreamServer
+from tempfile import TemporaryDirectory
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import numpy
+
+from autofmu.cache import Cache
+from autofmu.dataset import FORMATS, read_dataset
+from autofmu.generator import _template_environment, build_fmu, fit_model
+from autofmu.strategies import STRATEGIES
+from autofmu.utils import TARGETS, compiler_identity, detect_toolchain, slugify
+
+LATENCY_WINDOW = 1000
+"""Number of latest jobs whose latency is reported in the metrics."""
+
+
+class ServiceBusyError(Exception):
+    """Raised when a job is submitted while the queue of the service is full."""
+
+
+@dataclass
+class JobSpec:
+    """Description of an FMU to generate in the service."""
+
+    inputs: List[str]
+    outputs: List[str]
+    strategy: str = "linear"
+    name: str = "model"
+    dataset: Optional[Path] = None
+
+    @classmethod
+    def from_mapping(cls, values: Dict[str, Any]) -> "JobSpec":
+        """Create a job spec from a mapping, such as a decoded JSON object.
+
+        Arguments:
+            values: mapping between the names of the fields and their values,
+                lists may also be given as comma separated strings
+
+        Returns:
+            The job spec
+
+        Raises:
+            ValueError: if ``values`` is not a mapping, or any field is unknown,
+                missing or invalid
+        """
+        if not isinstance(values, dict):
+            raise ValueError("Expected a JSON object")
+        names = {"inputs", "outputs", "strategy", "name", "dataset"}
+        unknown = set(values) - names
+        if unknown:
+            raise ValueError(f"Unknown keys {', '.join(sorted(unknown))}")
+        missing = {"inputs", "outputs"} - set(values)
+        if missing:
+            raise ValueError(f"Missing keys {', '.join(sorted(missing))}")
+
+        def names_list(value: Any) -> List[str]:
+            if isinstance(value, str):
+                value = value.split(",")
+            elif not isinstance(value, list):
+                raise ValueError("Expected a list of names or a comma separated string")
+            return [str(name).strip() for name in value if str(name).strip()]
+
+        spec = cls(
+            inputs=names_list(values["inputs"]),
+            outputs=names_list(values["outputs"]),
+            strategy=str(values.get("strategy", "linear")),
+            name=str(values.get("name", "model")),
+            dataset=Path(values["dataset"]) if values.get("dataset") else None,
+        )
+        if not spec.inputs or not spec.outputs:
+            raise ValueError("Expected at least one input and one output")
+        if spec.strategy not in (*STRATEGIES, "auto"):
+            raise ValueError(f"Unknown strategy '{spec.strategy}'")
+        return spec
+
+
+@dataclass
+class JobTiming:
+    """Latency of a job, in seconds."""
+
+    queue_time: float
+    run_time: float
+
+    @property
+    def latency(self) -> float:
+        """Time from the submission of the job until it finished."""
+        return self.queue_time + self.run_time
+
+
+def _warm_up(targets: Optional[Iterable[str]], cache: Optional[Cache]) -> None:
+    # Leave interrupts to the main process, which shuts the workers down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Load the templates and detect the compilers once per worker process, as
+    # it starts; a failure is left to the jobs, which report it to the client
+    try:
+        _template_environment()
+        for name in TARGETS if targets is None else targets:
+            target = TARGETS[name]
+            if target.is_available():
+                compiler = target.compiler or os.environ.get("CC", "cc")
+                compiler_identity(compiler)
+                detect_toolchain(compiler, cache)
+    except Exception as error:
+        logging.warning("Failed to warm up worker process: %s", error)
+
+
+def _generate(
+    spec: JobSpec,
+    dataset: Path,
+    outfile: Path,
+    submitted: float,
+    options: Dict[str, Any],
+    fit_cache: Optional[Cache] = None,
+) -> Tuple[str, JobTiming]:
+    started = time.time()
+    dataframe = read_dataset(dataset, [*spec.inputs, *spec.outputs])
+    # Fit strategies one at a time, this already runs in a worker process
+    strategy, result, state = fit_model(
+        dataframe, spec.inputs, spec.outputs, spec.strategy, jobs=1, cache=fit_cache
+    )
+    build_fmu(
+        spec.name,
+        spec.inputs,
+        spec.outputs,
+        strategy,
+        result,
+        outfile,
+        state=state,
+        **options,
+    )
+    finished = time.time()
+    return strategy, JobTiming(started - submitted, finished - started)
+
+
+@dataclass
+class _Metrics:
+    pending: int = 0
+    completed: int = 0
+    failed: int = 0
+    rejected: int = 0
+    timings: Deque[JobTiming] = field(
+        default_factory=lambda: deque(maxlen=LATENCY_WINDOW)
+    )
+
+
+class Service:
+    """Pool of warm worker processes that generate FMUs."""
+
+    def __init__(
+        self,
+        workers: int = 1,
+        queue_size: int = 0,
+        jobs: Optional[int] = 1,
+        targets: Optional[Iterable[str]] = None,
+        cache: Optional[Cache] = None,
+        compression: str = "store",
+        build_dir: Optional[Path] = None,
+        backend: str = "direct",
+        fit_cache: Optional[Cache] = None,
+    ) -> None:
+        """Create a service and start its worker processes.
+
+        Arguments:
+            workers: number of FMUs to generate at the same time
+            queue_size: number of jobs that can wait for a worker, further jobs
+                are rejected
+            jobs: maximum number of targets each worker compiles at the same
+                time, so at most ``workers * jobs`` compilers run at once
+            targets: names of the targets to compile the FMUs to, by default all
+            cache: cache of compiled libraries, by default nothing is cached
+            compression: compression method of the FMU files (see
+                :py:data:`~autofmu.utils.COMPRESSIONS`)
+            build_dir: directory to stage and compile the FMUs in, by default
+                the system temporary directory
+            backend: how to compile each target (see
+                :py:data:`~autofmu.utils.BACKENDS`)
+            fit_cache: cache of fits, to reuse the fit of the same strategy to
+                the same data, by default every model is fitted
+        """
+        self.workers = workers
+        self.fit_cache = fit_cache
+        self.queue_size = queue_size
+        self.build_dir = build_dir
+        self.options: Dict[str, Any] = {
+            "targets": None if targets is None else list(targets),
+            "jobs": jobs,
+            "cache": cache,
+            "compression": compression,
+            "build_dir": build_dir,
+            "backend": backend,
+        }
+        self._metrics = _Metrics()
+        self._lock = threading.Lock()
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_warm_up,
+            initargs=(self.options["targets"], cache),
+        )
+        # Start every worker process, each warms up once as it starts
+        wait([self._executor.submit(os.getpid) for _ in range(workers)])
+
+    def close(self) -> None:
+        """Wait for the running jobs and stop the worker processes."""
+        self._executor.shutdown(wait=True)
+
+    def reserve(self) -> None:
+        """Reserve a place for a job, before receiving its dataset.
+
+        The reservation must be passed on with ``submit(..., reserved=True)``
+        or given back with :py:meth:`release`.
+
+        Raises:
+            ServiceBusyError: if every worker is busy and the queue is full
+        """
+        with self._lock:
+            if self._metrics.pending >= self.workers + self.queue_size:
+                self._metrics.rejected += 1
+                raise ServiceBusyError(
+                    f"{self._metrics.pending} jobs are already queued or running"
+                )
+            self._metrics.pending += 1
+
+    def release(self) -> None:
+        """Give back a place reserved with :py:meth:`reserve` without a job."""
+        with self._lock:
+            self._metrics.pending -= 1
+
+    def submit(
+        self, spec: JobSpec, dataset: Path, outfile: Path, reserved: bool = False
+    ) -> Future:
+        """Queue the generation of an FMU.
+
+        Arguments:
+            spec: description of the FMU to generate
+            dataset: path to the dataset to fit the model to
+            outfile: path to the file to write the FMU
+            reserved: whether a place was already reserved for the job with
+                :py:meth:`reserve`
+
+        Returns:
+            A future that holds the strategy used and the timing of the job
+
+        Raises:
+            ServiceBusyError: if every worker is busy and the queue is full
+        """
+        if not reserved:
+            self.reserve()
+        future = self._executor.submit(
+            _generate,
+            spec,
+            dataset,
+            outfile,
+            time.time(),
+            self.options,
+            self.fit_cache,
+        )
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future: Future) -> None:
+        with self._lock:
+            self._metrics.pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                self._metrics.failed += 1
+            else:
+                self._metrics.completed += 1
+                self._metrics.timings.append(future.result()[1])
+
+    def metrics(self) -> Dict[str, Any]:
+        """Report the load of the service and the latency of the latest jobs.
+
+        Returns:
+            A JSON serializable mapping with the number of queued, running,
+            completed, failed and rejected jobs, and statistics of the queue
+            time, run time and total latency, in seconds, of the latest
+            :py:data:`LATENCY_WINDOW` jobs
+        """
+        with self._lock:
+            metrics = self._metrics
+            timings = list(metrics.timings)
+            report: Dict[str, Any] = {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "running": min(metrics.pending, self.workers),
+                "queued": max(0, metrics.pending - self.workers),
+                "completed": metrics.completed,
+                "failed": metrics.failed,
+                "rejected": metrics.rejected,
+            }
+        for name in ("queue_time", "run_time", "latency"):
+            values = numpy.array([getattr(timing, name) for timing in timings])
+            if not len(values):
+                report[name] = None
+                continue
+            report[name] = {
+                "mean": float(values.mean()),
+                "p50": float(numpy.percentile(values, 50)),
+                "p95": float(numpy.percentile(values, 95)),
+                "max": float(values.max()),
+            }
+        return report
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: Any
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logging.info("%s", format % args)
+
+    def _send_json(
+        self, status: int, body: Any, headers: Optional[Dict[str, str]] = None
+    ) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, message: str, **headers: str) -> None:
+        if "Connection" in headers:
+            self.close_connection = True
+        self._send_json(status, {"error": message}, headers)
+
+    def do_GET(self) -> None:  # noqa: N802
+        path = urlsplit(self.path).path
+        if path == "/metrics":
+            self._send_json(200, self.server.service.metrics())
+        elif path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_error(404, f"Not found: {path}")
+
+    def do_POST(self) -> None:  # noqa: N802
+        url = urlsplit(self.path)
+        if url.path != "/fmus":
+            self._send_error(404, f"Not found: {url.path}", Connection="close")
+            return
+        service: Service = self.server.service
+        if self.headers.get("Content-Length") is None:
+            self._send_error(411, "Missing Content-Length", Connection="close")
+            return
+        try:
+            length = int(self.headers["Content-Length"])
+            if length < 0:
+                raise ValueError
+        except ValueError:
+            self._send_error(400, "Invalid Content-Length", Connection="close")
+            return
+        content_type = self.headers.get("Content-Type", "")
+
+        # Reject the job before receiving a dataset that could not be processed
+        try:
+            service.reserve()
+        except ServiceBusyError as error:
+            self._send_error(
+                503, str(error), **{"Retry-After": "1", "Connection": "close"}
+            )
+            return
+
+        with TemporaryDirectory(dir=service.build_dir) as tmpdir:
+            try:
+                spec, dataset = self._read_job(
+                    Path(tmpdir), url.query, content_type, length
+                )
+            except BaseException as error:
+                service.release()
+                if not isinstance(error, ValueError):
+                    raise
+                self._send_error(400, str(error), Connection="close")
+                return
+
+            outfile = Path(tmpdir) / f"{slugify(spec.name) or 'model'}.fmu"
+            future = service.submit(spec, dataset, outfile, reserved=True)
+            try:
+                strategy, timing = future.result()
+            except Exception as error:
+                self._send_error(422, str(error))
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header(
+                "Content-Disposition", f'attachment; filename="{outfile.name}"'
+            )
+            self.send_header("Content-Length", str(outfile.stat().st_size))
+            self.send_header("X-Autofmu-Strategy", strategy)
+            self.send_header("X-Autofmu-Queue-Time", f"{timing.queue_time:.6f}")
+            self.send_header("X-Autofmu-Run-Time", f"{timing.run_time:.6f}")
+            self.end_headers()
+            with outfile.open("rb") as fmu:
+                shutil.copyfileobj(fmu, self.wfile)
+
+    def _read_job(
+        self, tmpdir: Path, query_string: str, content_type: str, length: int
+    ) -> Tuple[JobSpec, Path]:
+        if content_type.startswith("application/json"):
+            spec = JobSpec.from_mapping(json.loads(self.rfile.read(length)))
+            if spec.dataset is None:
+                raise ValueError("Missing key dataset")
+            return spec, spec.dataset
+        query = {
+            name: ",".join(values) for name, values in parse_qs(query_string).items()
+        }
+        suffix = "." + query.pop("format", "csv").lstrip(".")
+        if suffix not in FORMATS:
+            raise ValueError(f"Unsupported dataset format '{suffix}'")
+        spec = JobSpec.from_mapping(query)
+        dataset = tmpdir / f"dataset{suffix}"
+        self._receive(dataset, length)
+        return spec, dataset
+
+    def _receive(self, path: Path, length: int) -> None:
+        with path.open("wb") as dataset:
+            while length > 0:
+                chunk = self.rfile.read(min(length, 1024 * 1024))
+                if not chunk:
+                    raise ValueError("Incomplete request body")
+                dataset.write(chunk)
+                length -= len(chunk)
+
+
+class _HTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], service: Service) -> None:
+        super().__init__(address, _RequestHandler)
+        self.service = service
+
+
+class _UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, service: Service) -> None:
+        super().__init__(path, _RequestHandler)
+        self.service = service
+
+    def get_request(self) -> Tuple[socket.socket, Tuple[str, int]]:
+        request, _ = super().get_request()
+        # The request handler expects an address with a host and a port
+        return request, ("local", 0)
+
+
+def create_server(
+    service: Service,
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    unix_socket: Optional[Path] = None,
+) -> Any:
+    """Create an HTTP server that handles requests with a service.
+
+    Call ``serve_forever()`` on the server to start handling requests.
+
+    Arguments:
+        service: service that generates the FMUs
+        host: address of the interface to listen on
+        port: TCP port to listen on, ``0`` to pick any free port
+        unix_socket: if given, listen on a Unix socket at this path instead of
+            on a TCP port
+
+    Returns:
+        The server, a :py:class:`socketserver.BaseServer`
+    """
+    if unix_socket is not None:
+        return _UnixHTTPServer(str(unix_socket), service)
+    return _HTTPServer((host, port), service)
@@ -22,56 +22,297 @@
 #define NOUTPUTS   /** outputs|length **/
 #define NVARIABLES /** (inputs + outputs)|length **/
 
-/* Buffer to save all the model variables */
-fmi2Real VARIABLES[NVARIABLES];
-
-/* Build relationship function that map the inputs to each output */
+/* State of an instance of the model */
+typedef struct {
+  /* Buffer to save all the model variables, the inputs followed by the outputs */
+  fmi2Real variables[NVARIABLES];
+  /* Whether the inputs changed since the outputs were last computed */
+  fmi2Boolean dirty;
+  /* Callbacks given by the environment when the instance was created */
+  fmi2CallbackFunctions functions;
+} Model;
+
+/* Snapshot of the variables of an instance, reused between calls to
+ * fmi2GetFMUstate so that saving the state does not allocate memory */
+typedef struct {
+  fmi2Real variables[NVARIABLES];
+  fmi2Boolean dirty;
+} ModelState;
+
+/* Serialized states are the variables followed by one byte for the dirty flag,
+ * in the byte order of the platform */
+#define SERIALIZED_SIZE (sizeof(fmi2Real) * NVARIABLES + 1)
+
+/* Build relationship function that map the inputs to the outputs, R, and the
+ * product of its Jacobian with a vector of input increments, J */
 
 /*% if strategy == "linear" %*/
 /* Linear regression strategy */
-fmi2Real R(fmi2ValueReference vref) {
-  const size_t output = vref - NOUTPUTS;
-  const fmi2Real coefs[NOUTPUTS][NINPUTS] = /** carray(result.coefs) **/;
-  const fmi2Real intercept[NOUTPUTS] = /** carray(result.intercept) **/;
-  
-  fmi2Real res = intercept[vref - NOUTPUTS];
-  for (size_t i = 0; i < NINPUTS; i++) {
-    fmi2Real coef = coefs[output][i];
-    fmi2Real input = VARIABLES[i];
-    res += coef * input;
+static const fmi2Real COEFS[NOUTPUTS][NINPUTS] = /** carray(result.coefs) **/;
+static const fmi2Real INTERCEPT[NOUTPUTS] = /** carray(result.intercept) **/;
+
+static void R(const fmi2Real inputs[], fmi2Real outputs[]) {
+  for (size_t output = 0; output < NOUTPUTS; output++) {
+    fmi2Real res = INTERCEPT[output];
+    for (size_t i = 0; i < NINPUTS; i++) {
+      res += COEFS[output][i] * inputs[i];
+    }
+    outputs[output] = res;
+  }
+}
+
+static void J(const fmi2Real inputs[], const fmi2Real seed[], fmi2Real doutputs[]) {
+  (void)inputs;
+  for (size_t output = 0; output < NOUTPUTS; output++) {
+    fmi2Real res = 0.0;
+    for (size_t i = 0; i < NINPUTS; i++) {
+      res += COEFS[output][i] * seed[i];
+    }
+    doutputs[output] = res;
+  }
+}
+/*% elif strategy == "sparse" %*/
+/* Sparse linear regression strategy, only the non-zero coefficients are stored */
+/*% if tables["values"] %*/
+#define NNONZEROS /** tables["values"]|length **/
+
+/* Coefficients of the rows that are not unrolled, in compressed sparse row form */
+static const fmi2Real VALUES[NNONZEROS] = /** carray(tables["values"]) **/;
+static const size_t COLUMNS[NNONZEROS] = /** carray(tables["columns"]) **/;
+
+static fmi2Real sparse_row(size_t start, size_t end, const fmi2Real inputs[]) {
+  fmi2Real res = 0.0;
+  for (size_t i = start; i < end; i++) {
+    res += VALUES[i] * inputs[COLUMNS[i]];
   }
   return res;
 }
+/*% endif %*/
+
+static void R(const fmi2Real inputs[], fmi2Real outputs[]) {
+  (void)inputs;
+  /*%- for row in tables["rows"] %*/
+  /*%- if row.terms is defined %*/
+  outputs[/** row.output **/] = /** row.intercept **/
+    /*%- for column, coef in row.terms %*/ + /** coef **/ * inputs[/** column **/]/*% endfor %*/;
+  /*%- else %*/
+  outputs[/** row.output **/] = /** row.intercept **/ + sparse_row(/** row.start **/, /** row.end **/, inputs);
+  /*%- endif %*/
+  /*%- endfor %*/
+}
+
+static void J(const fmi2Real inputs[], const fmi2Real seed[], fmi2Real doutputs[]) {
+  (void)inputs;
+  (void)seed;
+  /*%- for row in tables["rows"] %*/
+  /*%- if row.terms is defined %*/
+  doutputs[/** row.output **/] = 0.0
+    /*%- for column, coef in row.terms %*/ + /** coef **/ * seed[/** column **/]/*% endfor %*/;
+  /*%- else %*/
+  doutputs[/** row.output **/] = sparse_row(/** row.start **/, /** row.end **/, seed);
+  /*%- endif %*/
+  /*%- endfor %*/
+}
 /*% elif strategy == "logistic" %*/
 /* Logistic regression strategy */
-fmi2Real R(fmi2ValueReference vref) {
-  #define MAX_ENCODER_RANGE 100
-  size_t output = vref - NOUTPUTS;
-
-  const fmi2Real outcomes[NOUTPUTS][MAX_ENCODER_RANGE] = /** carray(result.outcomes) **/;
-  const size_t klen[NOUTPUTS] = {/** result.outcomes|map("length")|join(", ") **/};
-  const fmi2Real coefs[NOUTPUTS][MAX_ENCODER_RANGE][NINPUTS]  = /** carray(result.coefs) **/;
-  const fmi2Real intercepts[NOUTPUTS][MAX_ENCODER_RANGE] = /** carray(result.intercepts) **/;
-
-  fmi2Real outcome = outcomes[output][0];
-  fmi2Real max_probability = 0.0;
-  for (size_t i = 0; i < klen[output]; i++) {
-      fmi2Real probability = intercepts[output][i];
-      for (size_t j = 0; j < NINPUTS; j++) {
-        fmi2Real coef = coefs[output][i][j];
-        fmi2Real input = VARIABLES[j];
-        probability += coef * input;
+#define NCLASSES_TOTAL /** tables.outcomes|length **/
+#define NROWS          /** tables.intercepts|length **/
+
+/* Classes of all outputs, one after the other */
+static const fmi2Real OUTCOMES[NCLASSES_TOTAL] = /** carray(tables.outcomes) **/;
+static const size_t NCLASSES[NOUTPUTS] = /** carray(tables.nclasses) **/;
+static const size_t OUTCOME_OFFSETS[NOUTPUTS] = /** carray(tables.outcome_offsets) **/;
+
+/* Decision functions of all outputs: one for binary outputs, otherwise one per class */
+static const fmi2Real COEFS[NROWS * NINPUTS] = /** carray(tables.coefs) **/;
+static const fmi2Real INTERCEPTS[NROWS] = /** carray(tables.intercepts) **/;
+static const size_t ROW_OFFSETS[NOUTPUTS] = /** carray(tables.row_offsets) **/;
+
+static fmi2Real decision(size_t row, const fmi2Real inputs[]) {
+  const fmi2Real* coefs = COEFS + row * NINPUTS;
+  fmi2Real res = INTERCEPTS[row];
+  for (size_t i = 0; i < NINPUTS; i++) {
+    res += coefs[i] * inputs[i];
+  }
+  return res;
+}
+
+static void R(const fmi2Real inputs[], fmi2Real outputs[]) {
+  /* The sigmoid is monotonic, so the most probable class is the one with the
+   * highest decision function */
+  for (size_t output = 0; output < NOUTPUTS; output++) {
+    const fmi2Real* outcomes = OUTCOMES + OUTCOME_OFFSETS[output];
+    const size_t row = ROW_OFFSETS[output];
+    if (NCLASSES[output] == 2) {
+      outputs[output] = outcomes[decision(row, inputs) > 0];
+      continue;
+    }
+    size_t best = 0;
+    fmi2Real best_decision = decision(row, inputs);
+    for (size_t i = 1; i < NCLASSES[output]; i++) {
+      fmi2Real value = decision(row + i, inputs);
+      if (value > best_decision) {
+        best = i;
+        best_decision = value;
       }
-      probability = 1 / (1 + exp(-probability));
-      if (probability > max_probability) {
-        max_probability = probability;
-        outcome = outcomes[output][i];
+    }
+    outputs[output] = outcomes[best];
+  }
+}
+
+static void J(const fmi2Real inputs[], const fmi2Real seed[], fmi2Real doutputs[]) {
+  /* The outputs are piecewise constant, so their derivatives are zero except
+   * at the class boundaries, where they are not defined */
+  (void)inputs;
+  (void)seed;
+  for (size_t output = 0; output < NOUTPUTS; output++) {
+    doutputs[output] = 0.0;
+  }
+}
+/*% elif strategy == "lookup" %*/
+/* Lookup table strategy */
+#define NBREAKPOINTS /** tables.breakpoints|length **/
+#define NVALUES      /** tables.nvalues **/
+#define NCORNERS     ((size_t)1 << NINPUTS)
+
+/* Breakpoints of all inputs, one after the other, in increasing order */
+static const fmi2Real BREAKPOINTS[NBREAKPOINTS] = /** carray(tables.breakpoints) **/;
+static const size_t NPOINTS[NINPUTS] = /** carray(tables.npoints) **/;
+static const size_t BREAKPOINT_OFFSETS[NINPUTS] = /** carray(tables.breakpoint_offsets) **/;
+
+/* Values of all outputs at each node of the grid, in row major order */
+static const size_t STRIDES[NINPUTS] = /** carray(tables.strides) **/;
+static const fmi2Real VALUES[NOUTPUTS * NVALUES] = /** carray(tables.node_values) **/;
+
+/* Find the index of the interval between two breakpoints that contains x */
+static size_t find_interval(const fmi2Real points[], size_t npoints, fmi2Real x) {
+  size_t lo = 0;
+  size_t hi = npoints - 1;
+  while (hi - lo > 1) {
+    size_t mid = lo + (hi - lo) / 2;
+    if (x < points[mid]) {
+      hi = mid;
+    } else {
+      lo = mid;
+    }
+  }
+  return lo;
+}
+
+/* Locate the cell of the grid that contains the inputs. Returns the offset of
+ * its lower corner, and stores for each input the step to the upper corner, the
+ * distance to the lower corner, and the derivative of the distance */
+static size_t locate(const fmi2Real inputs[],
+                     size_t steps[],
+                     fmi2Real weights[],
+                     fmi2Real slopes[]) {
+  size_t offset = 0;
+  for (size_t i = 0; i < NINPUTS; i++) {
+    const fmi2Real* points = BREAKPOINTS + BREAKPOINT_OFFSETS[i];
+    steps[i] = 0;
+    weights[i] = 0.0;
+    slopes[i] = 0.0;
+    if (NPOINTS[i] == 1) {
+      continue;
+    }
+    size_t lo = find_interval(points, NPOINTS[i], inputs[i]);
+    fmi2Real width = points[lo + 1] - points[lo];
+    fmi2Real weight = (inputs[i] - points[lo]) / width;
+    offset += lo * STRIDES[i];
+    steps[i] = STRIDES[i];
+    /* The values are held constant beyond the first and last breakpoints */
+    if (weight < 0.0) {
+      weights[i] = 0.0;
+    } else if (weight > 1.0) {
+      weights[i] = 1.0;
+    } else {
+      weights[i] = weight;
+      slopes[i] = 1.0 / width;
+    }
+  }
+  return offset;
+}
+
+static void R(const fmi2Real inputs[], fmi2Real outputs[]) {
+  size_t steps[NINPUTS];
+  fmi2Real weights[NINPUTS];
+  fmi2Real slopes[NINPUTS];
+  size_t offset = locate(inputs, steps, weights, slopes);
+
+  /* Multilinear interpolation between the corners of the cell */
+  for (size_t output = 0; output < NOUTPUTS; output++) {
+    outputs[output] = 0.0;
+  }
+  for (size_t corner = 0; corner < NCORNERS; corner++) {
+    size_t index = offset;
+    fmi2Real weight = 1.0;
+    for (size_t i = 0; i < NINPUTS; i++) {
+      if (corner >> i & 1) {
+        index += steps[i];
+        weight *= weights[i];
+      } else {
+        weight *= 1.0 - weights[i];
       }
+    }
+    if (weight == 0.0) {
+      continue;
+    }
+    for (size_t output = 0; output < NOUTPUTS; output++) {
+      outputs[output] += weight * VALUES[output * NVALUES + index];
+    }
+  }
+}
+
+static void J(const fmi2Real inputs[], const fmi2Real seed[], fmi2Real doutputs[]) {
+  size_t steps[NINPUTS];
+  fmi2Real weights[NINPUTS];
+  fmi2Real slopes[NINPUTS];
+  size_t offset = locate(inputs, steps, weights, slopes);
+
+  /* Derivative of the weight of each corner along the seed, by the product rule */
+  for (size_t output = 0; output < NOUTPUTS; output++) {
+    doutputs[output] = 0.0;
+  }
+  for (size_t corner = 0; corner < NCORNERS; corner++) {
+    size_t index = offset;
+    fmi2Real weight = 1.0;
+    fmi2Real dweight = 0.0;
+    for (size_t i = 0; i < NINPUTS; i++) {
+      fmi2Real dfactor = slopes[i] * seed[i];
+      if (corner >> i & 1) {
+        index += steps[i];
+        dweight = dweight * weights[i] + weight * dfactor;
+        weight *= weights[i];
+      } else {
+        dweight = dweight * (1.0 - weights[i]) - weight * dfactor;
+        weight *= 1.0 - weights[i];
+      }
+    }
+    if (dweight == 0.0) {
+      continue;
+    }
+    for (size_t output = 0; output < NOUTPUTS; output++) {
+      doutputs[output] += dweight * VALUES[output * NVALUES + index];
+    }
   }
-  return outcome;
 }
 /*% endif %*/
 
+/*
+ * Bulk evaluation, outside of the FMI
+ */
+
+/* Evaluate the model on many samples in one call, for example to score it
+ * against a dataset. The inputs and outputs are row major matrices with one row
+ * per sample, and NINPUTS and NOUTPUTS columns */
+FMI2_Export void autofmuEvaluate(const fmi2Real inputs[],
+                                 fmi2Real outputs[],
+                                 size_t nrows) {
+  for (size_t row = 0; row < nrows; row++) {
+    R(inputs + row * NINPUTS, outputs + row * NOUTPUTS);
+  }
+}
+
 /*
  * FMI 2.0 implementation
  */
@@ -127,10 +368,25 @@ fmi2Component fmi2Instantiate(fmi2String instanceName,
     return NULL;
   }
 
-  return (void*)1;
+  Model* model = functions->allocateMemory(1, sizeof(Model));
+  if (!model) {
+    functions->logger(functions->componentEnvironment, instanceName, fmi2Error,
+                      "error", "fmi2Instantiate: Out of memory.");
+    return NULL;
+  }
+  memset(model->variables, 0, sizeof(model->variables));
+  model->dirty = fmi2True;
+  model->functions = *functions;
+
+  return model;
 }
 
-void fmi2FreeInstance(fmi2Component c) {}
+void fmi2FreeInstance(fmi2Component c) {
+  Model* model = c;
+  if (model) {
+    model->functions.freeMemory(model);
+  }
+}
 
 fmi2Status fmi2SetupExperiment(fmi2Component c,
                                fmi2Boolean toleranceDefined,
@@ -154,6 +410,12 @@ fmi2Status fmi2Terminate(fmi2Component c) {
 }
 
 fmi2Status fmi2Reset(fmi2Component c) {
+  Model* model = c;
+  if (!model) {
+    return fmi2Error;
+  }
+  memset(model->variables, 0, sizeof(model->variables));
+  model->dirty = fmi2True;
   return fmi2OK;
 }
 
@@ -161,10 +423,21 @@ fmi2Status fmi2GetReal(fmi2Component c,
                        const fmi2ValueReference vr[],
                        size_t nvr,
                        fmi2Real value[]) {
+  Model* model = c;
   size_t i = 0;
+  if (!model) {
+    return fmi2Error;
+  }
+  if (model->dirty) {
+    R(model->variables, model->variables + NINPUTS);
+    model->dirty = fmi2False;
+  }
   for (i = 0; i < nvr; i++) {
     fmi2ValueReference vref = vr[i];
-    value[i] = R(vref - 1);
+    if (vref < 1 || vref > NVARIABLES) {
+      return fmi2Error;
+    }
+    value[i] = model->variables[vref - 1];
   }
 
   return fmi2OK;
@@ -195,11 +468,19 @@ fmi2Status fmi2SetReal(fmi2Component c,
                        const fmi2ValueReference vr[],
                        size_t nvr,
                        const fmi2Real value[]) {
+  Model* model = c;
   size_t i;
+  if (!model) {
+    return fmi2Error;
+  }
   for (i = 0; i < nvr; i++) {
     fmi2ValueReference vref = vr[i];
-    VARIABLES[vref - 1] = value[i];
+    if (vref < 1 || vref > NINPUTS) {
+      return fmi2Error;
+    }
+    model->variables[vref - 1] = value[i];
   }
+  model->dirty = fmi2True;
   return fmi2OK;
 }
 
@@ -224,21 +505,58 @@ fmi2Status fmi2SetString(fmi2Component c,
   return fmi2OK;
 }
 
+/* Allocate a state, unless the environment passes one to reuse */
+static ModelState* reuse_state(Model* model, fmi2FMUstate* FMUstate) {
+  if (!*FMUstate) {
+    *FMUstate = model->functions.allocateMemory(1, sizeof(ModelState));
+  }
+  return *FMUstate;
+}
+
 fmi2Status fmi2GetFMUstate(fmi2Component c, fmi2FMUstate* FMUstate) {
+  Model* model = c;
+  if (!model || !FMUstate) {
+    return fmi2Error;
+  }
+  ModelState* state = reuse_state(model, FMUstate);
+  if (!state) {
+    return fmi2Error;
+  }
+  memcpy(state->variables, model->variables, sizeof(state->variables));
+  state->dirty = model->dirty;
   return fmi2OK;
 }
 
 fmi2Status fmi2SetFMUstate(fmi2Component c, fmi2FMUstate FMUstate) {
+  Model* model = c;
+  const ModelState* state = FMUstate;
+  if (!model || !state) {
+    return fmi2Error;
+  }
+  memcpy(model->variables, state->variables, sizeof(model->variables));
+  model->dirty = state->dirty;
   return fmi2OK;
 }
 
 fmi2Status fmi2FreeFMUstate(fmi2Component c, fmi2FMUstate* FMUstate) {
+  Model* model = c;
+  if (!model || !FMUstate) {
+    return fmi2Error;
+  }
+  if (*FMUstate) {
+    model->functions.freeMemory(*FMUstate);
+    *FMUstate = NULL;
+  }
   return fmi2OK;
 }
 
 fmi2Status fmi2SerializedFMUstateSize(fmi2Component c,
                                       fmi2FMUstate FMUstate,
                                       size_t* size) {
+  if (!c || !FMUstate || !size) {
+    return fmi2Error;
+  }
+  *size = SERIALIZED_SIZE;
   return fmi2OK;
 }
 
@@ -246,6 +564,12 @@ fmi2Status fmi2SerializeFMUstate(fmi2Component c,
                                  fmi2FMUstate FMUstate,
                                  fmi2Byte serializedState[],
                                  size_t size) {
+  const ModelState* state = FMUstate;
+  if (!c || !state || size < SERIALIZED_SIZE) {
+    return fmi2Error;
+  }
+  memcpy(serializedState, state->variables, sizeof(state->variables));
+  serializedState[SERIALIZED_SIZE - 1] = (fmi2Byte)(state->dirty ? 1 : 0);
   return fmi2OK;
 }
 
@@ -253,6 +577,24 @@ fmi2Status fmi2DeSerializeFMUstate(fmi2Component c,
                                    const fmi2Byte serializedState[],
                                    size_t size,
                                    fmi2FMUstate* FMUstate) {
+  Model* model = c;
+  if (!model || !FMUstate) {
+    return fmi2Error;
+  }
+  if (size != SERIALIZED_SIZE) {
+    model->functions.logger(model->functions.componentEnvironment, "?", fmi2Error,
+                            "error",
+                            "fmi2DeSerializeFMUstate: Wrong state size %lu. "
+                            "Expected %lu.",
+                            (unsigned long)size, (unsigned long)SERIALIZED_SIZE);
+    return fmi2Error;
+  }
+  ModelState* state = reuse_state(model, FMUstate);
+  if (!state) {
+    return fmi2Error;
+  }
+  memcpy(state->variables, serializedState, sizeof(state->variables));
+  state->dirty = serializedState[SERIALIZED_SIZE - 1] ? fmi2True : fmi2False;
   return fmi2OK;
 }
 
@@ -263,6 +605,29 @@ fmi2Status fmi2GetDirectionalDerivative(fmi2Component c,
                                         size_t nKnown,
                                         const fmi2Real dvKnown[],
                                         fmi2Real dvUnknown[]) {
+  Model* model = c;
+  fmi2Real seed[NINPUTS];
+  fmi2Real doutputs[NOUTPUTS];
+  size_t i;
+  if (!model) {
+    return fmi2Error;
+  }
+  memset(seed, 0, sizeof(seed));
+  for (i = 0; i < nKnown; i++) {
+    fmi2ValueReference vref = vKnown_ref[i];
+    if (vref < 1 || vref > NINPUTS) {
+      return fmi2Error;
+    }
+    seed[vref - 1] += dvKnown[i];
+  }
+  J(model->variables, seed, doutputs);
+  for (i = 0; i < nUnknown; i++) {
+    fmi2ValueReference vref = vUnknown_ref[i];
+    if (vref <= NINPUTS || vref > NVARIABLES) {
+      return fmi2Error;
+    }
+    dvUnknown[i] = doutputs[vref - 1 - NINPUTS];
+  }
   return fmi2OK;
 }
 
@@ -0,0 +1,135 @@
+"""State of a fit stored inside an FMU, to update it with new data.
+
+The state is written to ``resources/autofmu.json`` in the FMU. For the linear
+strategies it holds the sufficient statistics of every row fitted so far,
+which are merged with the statistics of the new rows. The logistic regression
+has no such statistics, so it holds the coefficients and the class encodings,
+which warm start the fit on the new rows.
+"""
+
+import json
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from zipfile import ZipFile
+
+import numpy
+
+from autofmu import __version__
+from autofmu.strategies import LinearRegressionStatistics, LogisticRegressionResult
+
+STATE_FILE = "resources/autofmu.json"
+"""Path of the fit state inside the FMU."""
+
+UPDATABLE_STRATEGIES = ("linear", "sparse", "logistic")
+"""Strategies whose FMUs can be updated with new data."""
+
+
+@dataclass
+class FitState:
+    """State of a fit needed to update it with new data."""
+
+    strategy: str
+    inputs: List[str]
+    outputs: List[str]
+    parameters: Dict[str, Any] = field(default_factory=dict)
+    statistics: Optional[LinearRegressionStatistics] = None
+    result: Optional[LogisticRegressionResult] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert the state to a mapping of JSON serializable values.
+
+        Returns:
+            The state as a mapping
+        """
+        data: Dict[str, Any] = {
+            "version": __version__,
+            "strategy": self.strategy,
+            "inputs": self.inputs,
+            "outputs": self.outputs,
+            "parameters": self.parameters,
+        }
+        if self.statistics is not None:
+            data["statistics"] = {
+                name: value.tolist() if isinstance(value, numpy.ndarray) else value
+                for name, value in asdict(self.statistics).items()
+            }
+        if self.result is not None:
+            data["result"] = asdict(self.result)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "FitState":
+        """Create a state from a mapping written by :py:meth:`to_dict`.
+
+        Arguments:
+            data: the state as a mapping
+
+        Returns:
+            The state described by the mapping
+        """
+        statistics = data.get("statistics")
+        result = data.get("result")
+        return cls(
+            strategy=data["strategy"],
+            inputs=data["inputs"],
+            outputs=data["outputs"],
+            parameters=data.get("parameters", {}),
+            statistics=(
+                LinearRegressionStatistics(
+                    count=statistics["count"],
+                    mean_x=numpy.asarray(statistics["mean_x"], dtype=float),
+                    mean_y=numpy.asarray(statistics["mean_y"], dtype=float),
+                    xx=numpy.asarray(statistics["xx"], dtype=float),
+                    xy=numpy.asarray(statistics["xy"], dtype=float),
+                    yy=numpy.asarray(statistics["yy"], dtype=float),
+                )
+                if statistics
+                else None
+            ),
+            result=LogisticRegressionResult(**result) if result else None,
+        )
+
+    def to_json(self) -> str:
+        """Serialize the state to JSON.
+
+        Returns:
+            The state as a JSON document
+        """
+        return json.dumps(self.to_dict())
+
+    @classmethod
+    def from_json(cls, text: str) -> "FitState":
+        """Deserialize a state from JSON.
+
+        Arguments:
+            text: JSON document written by :py:meth:`to_json`
+
+        Returns:
+            The state described by the document
+        """
+        return cls.from_dict(json.loads(text))
+
+
+def read_state(fmu_path: Path) -> FitState:
+    """Read the fit state stored in an FMU.
+
+    Arguments:
+        fmu_path: path to an FMU generated by this program
+
+    Returns:
+        The state of the fit of the FMU
+
+    Raises:
+        ValueError: if the FMU has no fit state, for example, because its
+            strategy cannot be updated
+    """
+    with ZipFile(fmu_path) as archive:
+        try:
+            text = archive.read(STATE_FILE).decode("utf-8")
+        except KeyError:
+            raise ValueError(
+                f"'{fmu_path}' has no fit state to update, only FMUs fitted with "
+                f"the {', '.join(UPDATABLE_STRATEGIES)} strategies can be updated"
+            ) from None
+    return FitState.from_json(text)
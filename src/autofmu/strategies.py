@@ -1,12 +1,18 @@
 """Strategies for deducing the relations between inputs and outputs in a dataset."""
 
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-from typing import Iterable, List
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
 
+import numpy
 import pandas
 from sklearn.linear_model import LinearRegression, LogisticRegression
-from sklearn.multioutput import MultiOutputClassifier
-from sklearn.preprocessing import LabelEncoder
+from sklearn.metrics import r2_score
+
+DEFAULT_SPARSE_TOLERANCE = 1e-3
+"""Default maximum loss of score of the sparse linear regression."""
 
 
 @dataclass
@@ -17,6 +23,37 @@ class LinearRegressionResult:
     intercept: List[float]
     score: float
 
+    def predict(self, x: numpy.ndarray) -> numpy.ndarray:
+        """Predict the outputs of the model.
+
+        Arguments:
+            x: matrix of input values with one row per sample
+
+        Returns:
+            Matrix of output values with one row per sample
+        """
+        coefs = numpy.asarray(self.coefs)
+        return numpy.asarray(x, dtype=float) @ coefs.T + numpy.asarray(self.intercept)
+
+    def evaluation_cost(self) -> int:
+        """Count the multiplications needed to evaluate the model once."""
+        return sum(len(row) for row in self.coefs)
+
+    def dependencies(self, tolerance: float = 0.0) -> List[List[int]]:
+        """List the inputs that each output depends on.
+
+        Arguments:
+            tolerance: coefficients whose magnitude is not larger than this
+                tolerance are considered zero
+
+        Returns:
+            Indices of the inputs with non-zero coefficients of each output
+        """
+        return [
+            [index for index, coef in enumerate(row) if abs(coef) > tolerance]
+            for row in self.coefs
+        ]
+
 
 def linear_regression(
     dataframe: pandas.DataFrame,
@@ -42,6 +79,303 @@ def linear_regression(
     return LinearRegressionResult(coefs=coefs, intercept=intercept, score=score)
 
 
+@dataclass
+class LinearRegressionStatistics:
+    """Sufficient statistics to fit a linear regression model.
+
+    Instead of the raw sums of products, the statistics are kept centered
+    around the running means (``xx`` is ``(X - mean_x)ᵀ(X - mean_x)``, and so
+    on), which is numerically stable for datasets with large offsets. The
+    statistics of two datasets can be merged, so that a dataset can be
+    processed in chunks with memory that only depends on the number of
+    variables.
+    """
+
+    count: int
+    mean_x: numpy.ndarray
+    mean_y: numpy.ndarray
+    xx: numpy.ndarray
+    xy: numpy.ndarray
+    yy: numpy.ndarray
+
+    @classmethod
+    def empty(cls, ninputs: int, noutputs: int) -> "LinearRegressionStatistics":
+        """Create the statistics of an empty dataset.
+
+        Arguments:
+            ninputs: number of input variables
+            noutputs: number of output variables
+
+        Returns:
+            Statistics with a count of zero
+        """
+        return cls(
+            count=0,
+            mean_x=numpy.zeros(ninputs),
+            mean_y=numpy.zeros(noutputs),
+            xx=numpy.zeros((ninputs, ninputs)),
+            xy=numpy.zeros((ninputs, noutputs)),
+            yy=numpy.zeros(noutputs),
+        )
+
+    @classmethod
+    def from_arrays(
+        cls, x: numpy.ndarray, y: numpy.ndarray
+    ) -> "LinearRegressionStatistics":
+        """Compute the statistics of a dataset.
+
+        Arguments:
+            x: matrix of input values with one row per sample
+            y: matrix of output values with one row per sample
+
+        Returns:
+            Statistics of the dataset
+        """
+        x = numpy.asarray(x, dtype=float)
+        y = numpy.asarray(y, dtype=float)
+        mean_x = x.mean(axis=0)
+        mean_y = y.mean(axis=0)
+        dx = x - mean_x
+        dy = y - mean_y
+        return cls(
+            count=len(x),
+            mean_x=mean_x,
+            mean_y=mean_y,
+            xx=dx.T @ dx,
+            xy=dx.T @ dy,
+            yy=numpy.einsum("ij,ij->j", dy, dy),
+        )
+
+    @classmethod
+    def from_chunks(
+        cls,
+        chunks: Iterable[pandas.DataFrame],
+        inputs: Iterable[str],
+        outputs: Iterable[str],
+    ) -> "LinearRegressionStatistics":
+        """Compute the statistics of a dataset that is read in chunks.
+
+        Arguments:
+            chunks: the dataset split in dataframes with the same columns
+            inputs: list of input variable names
+            outputs: list of output variable names
+
+        Returns:
+            Statistics of the whole dataset
+        """
+        inputs = list(inputs)
+        outputs = list(outputs)
+        statistics = cls.empty(len(inputs), len(outputs))
+        for chunk in chunks:
+            if len(chunk.index):
+                statistics = statistics.merge(
+                    cls.from_arrays(
+                        chunk[inputs].to_numpy(dtype=float),
+                        chunk[outputs].to_numpy(dtype=float),
+                    )
+                )
+        return statistics
+
+    def merge(
+        self, other: "LinearRegressionStatistics"
+    ) -> "LinearRegressionStatistics":
+        """Combine these statistics with the statistics of another dataset.
+
+        Arguments:
+            other: statistics of the other dataset
+
+        Returns:
+            Statistics of both datasets together
+        """
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            return other
+        count = self.count + other.count
+        weight = self.count * other.count / count
+        delta_x = other.mean_x - self.mean_x
+        delta_y = other.mean_y - self.mean_y
+        return LinearRegressionStatistics(
+            count=count,
+            mean_x=self.mean_x + delta_x * other.count / count,
+            mean_y=self.mean_y + delta_y * other.count / count,
+            xx=self.xx + other.xx + weight * numpy.outer(delta_x, delta_x),
+            xy=self.xy + other.xy + weight * numpy.outer(delta_x, delta_y),
+            yy=self.yy + other.yy + weight * delta_y**2,
+        )
+
+    def solve(self) -> LinearRegressionResult:
+        """Fit the linear regression model that these statistics describe.
+
+        Returns:
+            The same coefficients, intercepts and score as fitting the whole
+            dataset with :py:func:`linear_regression`
+
+        Raises:
+            ValueError: if the statistics describe an empty dataset
+        """
+        if self.count == 0:
+            raise ValueError("Cannot fit a linear regression to an empty dataset")
+        coefs, *_ = numpy.linalg.lstsq(self.xx, self.xy, rcond=None)
+        intercept = self.mean_y - self.mean_x @ coefs
+
+        # Residual and total sum of squares of each output
+        residual = self.yy - 2 * numpy.einsum("ij,ij->j", coefs, self.xy)
+        residual += numpy.einsum("ij,ik,kj->j", coefs, self.xx, coefs)
+        residual = numpy.maximum(residual, 0.0)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            scores = numpy.where(
+                self.yy > 0,
+                1 - residual / self.yy,
+                numpy.where(residual > 0, 0.0, 1.0),
+            )
+
+        return LinearRegressionResult(
+            coefs=coefs.T.tolist(),
+            intercept=intercept.tolist(),
+            score=float(scores.mean()),
+        )
+
+    def _subset_fit(
+        self, kept: numpy.ndarray, output: int
+    ) -> Tuple[numpy.ndarray, float]:
+        # Coefficients and score of an output fitted with a subset of the inputs
+        if not len(kept):
+            coefs = numpy.zeros(0)
+            residual = self.yy[output]
+        else:
+            xx = self.xx[numpy.ix_(kept, kept)]
+            xy = self.xy[kept, output]
+            coefs, *_ = numpy.linalg.lstsq(xx, xy, rcond=None)
+            residual = max(self.yy[output] - 2 * coefs @ xy + coefs @ xx @ coefs, 0.0)
+        if self.yy[output] > 0:
+            return coefs, float(1 - residual / self.yy[output])
+        return coefs, 0.0 if residual > 0 else 1.0
+
+    def solve_sparse(
+        self, tolerance: float = DEFAULT_SPARSE_TOLERANCE
+    ) -> "SparseLinearRegressionResult":
+        """Fit a linear regression model that only uses the most relevant inputs.
+
+        The inputs of each output are ranked by the magnitude of their
+        coefficient scaled by the spread of the input, and the least relevant
+        ones are dropped, refitting the rest, for as long as the score of the
+        output stays within ``tolerance`` of the score with all the inputs.
+        Refitting only takes the statistics, so the dataset is not read again.
+
+        Arguments:
+            tolerance: maximum loss of the score of each output
+
+        Returns:
+            A result whose dropped coefficients are exactly zero
+
+        Raises:
+            ValueError: if the statistics describe an empty dataset
+        """
+        dense = self.solve()
+        ninputs, noutputs = self.xy.shape
+        coefs = numpy.zeros((noutputs, ninputs))
+        intercept = numpy.zeros(noutputs)
+        scores = []
+        spread = numpy.sqrt(numpy.maximum(numpy.diag(self.xx), 0.0))
+        for output in range(noutputs):
+            everything = numpy.arange(ninputs)
+            full, full_score = self._subset_fit(everything, output)
+            order = numpy.argsort(numpy.abs(full) * spread, kind="stable")
+
+            # Dropping more inputs never improves the score, so the number of
+            # inputs that can be dropped is found with a binary search
+            low, high = 0, ninputs
+            while low < high:
+                middle = (low + high + 1) // 2
+                _, score = self._subset_fit(numpy.sort(order[middle:]), output)
+                if score >= full_score - tolerance:
+                    low = middle
+                else:
+                    high = middle - 1
+            kept = numpy.sort(order[low:])
+            kept_coefs, score = self._subset_fit(kept, output)
+            coefs[output, kept] = kept_coefs
+            intercept[output] = self.mean_y[output] - self.mean_x[kept] @ kept_coefs
+            scores.append(score)
+
+        return SparseLinearRegressionResult(
+            coefs=coefs.tolist(),
+            intercept=intercept.tolist(),
+            score=float(numpy.mean(scores)),
+            dense_score=dense.score,
+        )
+
+
+def streaming_linear_regression(
+    chunks: Iterable[pandas.DataFrame],
+    inputs: Iterable[str],
+    outputs: Iterable[str],
+) -> LinearRegressionResult:
+    """Fit a linear regression model to a dataset that is read in chunks.
+
+    Only the sufficient statistics of the dataset are kept in memory, so the
+    memory usage depends on the number of variables and not on the number of
+    rows, which allows fitting datasets larger than the available memory.
+
+    Arguments:
+        chunks: the dataset to run the linear regression against, split in
+            dataframes with the same columns
+        inputs: list of input variable names
+        outputs: list of output variable names
+
+    Returns:
+        A result that contains the values of the coefiecients and intercepts
+    """
+    return LinearRegressionStatistics.from_chunks(chunks, inputs, outputs).solve()
+
+
+@dataclass
+class SparseLinearRegressionResult(LinearRegressionResult):
+    """Result from running a linear regression model that drops inputs.
+
+    The coefficients of the dropped inputs are exactly zero.
+    """
+
+    dense_score: float
+
+    def evaluation_cost(self) -> int:
+        """Count the multiplications needed to evaluate the model once."""
+        return sum(1 for row in self.coefs for coef in row if coef != 0)
+
+    def nonzeros(self) -> int:
+        """Count the coefficients that are not zero."""
+        return self.evaluation_cost()
+
+
+def sparse_linear_regression(
+    dataframe: pandas.DataFrame,
+    inputs: Iterable[str],
+    outputs: Iterable[str],
+    tolerance: float = DEFAULT_SPARSE_TOLERANCE,
+) -> SparseLinearRegressionResult:
+    """Fit a linear regression model that only uses the most relevant inputs.
+
+    See :py:meth:`LinearRegressionStatistics.solve_sparse`.
+
+    Arguments:
+        dataframe: the dataset to run the linear regression against
+        inputs: list of input variable names
+        outputs: list of output variable names
+        tolerance: maximum loss of the score of each output, compared to the
+            linear regression with all the inputs
+
+    Returns:
+        A result that contains the values of the coefiecients and intercepts,
+        and the score of the linear regression with all the inputs
+    """
+    statistics = LinearRegressionStatistics.from_arrays(
+        dataframe[list(inputs)].to_numpy(dtype=float),
+        dataframe[list(outputs)].to_numpy(dtype=float),
+    )
+    return statistics.solve_sparse(tolerance)
+
+
 @dataclass
 class LogisticRegressionResult:
     """Result from running a logistic regression model."""
@@ -51,37 +385,424 @@ class LogisticRegressionResult:
     intercepts: List[List[float]]
     score: float
 
+    def predict(self, x: numpy.ndarray) -> numpy.ndarray:
+        """Predict the outputs of the model.
+
+        Arguments:
+            x: matrix of input values with one row per sample
+
+        Returns:
+            Matrix of output values with one row per sample
+        """
+        x = numpy.asarray(x, dtype=float)
+        columns = []
+        for outcomes, coefs, intercepts in zip(
+            self.outcomes, self.coefs, self.intercepts
+        ):
+            decision = x @ numpy.asarray(coefs).T + numpy.asarray(intercepts)
+            if decision.shape[1] == 1:
+                indices = (decision[:, 0] > 0).astype(int)
+            else:
+                indices = decision.argmax(axis=1)
+            columns.append(numpy.asarray(outcomes, dtype=float)[indices])
+        return numpy.column_stack(columns)
+
+    def evaluation_cost(self) -> int:
+        """Count the multiplications needed to evaluate the model once."""
+        return sum(len(row) for coefs in self.coefs for row in coefs)
+
+    def dependencies(self, tolerance: float = 0.0) -> List[List[int]]:
+        """List the inputs that each output depends on.
+
+        Arguments:
+            tolerance: coefficients whose magnitude is not larger than this
+                tolerance are considered zero
+
+        Returns:
+            Indices of the inputs with a non-zero coefficient in the decision
+            function of any class of each output
+        """
+        return [
+            numpy.flatnonzero(
+                (numpy.abs(numpy.asarray(coefs)) > tolerance).any(axis=0)
+            ).tolist()
+            for coefs in self.coefs
+        ]
+
+
+LOGISTIC_SOLVERS = ("auto", "lbfgs", "newton-cg", "sag", "saga")
+"""Solvers of the logistic regression, "auto" chooses one by the dataset size."""
+
+DEFAULT_LOGISTIC_SOLVER = "auto"
+"""Default solver of the logistic regression."""
+
+SAGA_MIN_ROWS = 100000
+"""Number of rows from which the "auto" solver of the logistic regression is
+saga, whose epochs cost linear time, instead of lbfgs."""
+
+SAGA_TOLERANCE = 1e-3
+"""Change of the coefficients in an epoch under which saga stops early."""
+
+
+# Inputs of the logistic regression, sent once to each worker process
+_logistic_inputs: Optional[numpy.ndarray] = None
+
+
+def _set_logistic_inputs(x: numpy.ndarray) -> None:
+    global _logistic_inputs
+    _logistic_inputs = x
+
+
+def _fit_logistic_output(
+    y: numpy.ndarray,
+    solver: str,
+    warm_start: Optional[Tuple[List, List[List[float]], List[float]]],
+    x: Optional[numpy.ndarray] = None,
+) -> Tuple[List[float], List[List[float]], List[float]]:
+    x = _logistic_inputs if x is None else x
+    estimator = LogisticRegression(max_iter=1000, solver=solver)
+    if solver in ("sag", "saga"):
+        estimator.set_params(tol=SAGA_TOLERANCE, random_state=0)
+    if warm_start is not None and warm_start[0] == numpy.unique(y).tolist():
+        estimator.set_params(warm_start=True)
+        estimator.coef_ = numpy.asarray(warm_start[1])
+        estimator.intercept_ = numpy.asarray(warm_start[2])
+    estimator.fit(x, y)
+    return (
+        estimator.classes_.tolist(),
+        estimator.coef_.tolist(),
+        estimator.intercept_.tolist(),
+    )
+
 
 def logistic_regression(
     dataframe: pandas.DataFrame,
     inputs: Iterable[str],
     outputs: Iterable[str],
+    warm_start: Optional[LogisticRegressionResult] = None,
+    solver: str = DEFAULT_LOGISTIC_SOLVER,
+    jobs: Optional[int] = 1,
 ) -> LogisticRegressionResult:
     """Extract the dataset variables columns and fit them in a logistic regression model.
 
+    Each output is fitted by its own classifier, in a pool of processes that
+    receive the inputs once each, and its classes are encoded by the
+    classifier from a view of its column. The
+    stochastic solvers converge slowly unless the inputs have the same scale,
+    so they fit standardized inputs, and the coefficients are converted back.
+
     Arguments:
         dataset: the dataset to run the logistic regression against
         inputs: list of input variable names
         outputs: list of output variable names
+        warm_start: a previous result to start the fit from, for example, of
+            the same model fitted to older data; outputs whose classes changed
+            since are fitted from scratch
+        solver: one of :py:data:`LOGISTIC_SOLVERS`, by default saga if the
+            dataset has at least :py:data:`SAGA_MIN_ROWS` rows, otherwise lbfgs
+        jobs: maximum number of outputs to fit at the same time, ``None`` for
+            the number of processors
 
     Returns:
         A result that contains the values of the coefiecients and intercepts
+
+    Raises:
+        ValueError: if the solver is unknown
+    """
+    if solver not in LOGISTIC_SOLVERS:
+        raise ValueError(
+            f"Unknown solver '{solver}', expected one of {', '.join(LOGISTIC_SOLVERS)}"
+        )
+    inputs = list(inputs)
+    outputs = list(outputs)
+    x = dataframe[inputs].to_numpy(dtype=float)
+    if solver == "auto":
+        solver = "saga" if len(x) >= SAGA_MIN_ROWS else "lbfgs"
+    if solver in ("sag", "saga"):
+        mean = x.mean(axis=0)
+        scale = x.std(axis=0)
+        scale[scale == 0.0] = 1.0
+        x_fit = (x - mean) / scale
+    else:
+        mean = numpy.zeros(len(inputs))
+        scale = numpy.ones(len(inputs))
+        x_fit = x
+
+    starts: List[Optional[Tuple[List, List[List[float]], List[float]]]] = []
+    for index in range(len(outputs)):
+        if warm_start is None:
+            starts.append(None)
+            continue
+        start_coefs = numpy.asarray(warm_start.coefs[index])
+        start_intercepts = numpy.asarray(warm_start.intercepts[index])
+        starts.append(
+            (
+                warm_start.outcomes[index],
+                (start_coefs * scale).tolist(),
+                (start_intercepts + start_coefs @ mean).tolist(),
+            )
+        )
+
+    columns = [dataframe[output].to_numpy() for output in outputs]
+    jobs = min(jobs or os.cpu_count() or 1, len(outputs))
+    if jobs > 1:
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_set_logistic_inputs,
+            initargs=(x_fit,),
+        ) as executor:
+            fits = list(
+                executor.map(
+                    _fit_logistic_output,
+                    columns,
+                    [solver] * len(outputs),
+                    starts,
+                )
+            )
+    else:
+        fits = [
+            _fit_logistic_output(y, solver, start, x_fit)
+            for y, start in zip(columns, starts)
+        ]
+
+    outcomes, coefs, intercepts = [], [], []
+    for classes, scaled_coefs, scaled_intercepts in fits:
+        output_coefs = numpy.asarray(scaled_coefs) / scale
+        outcomes.append(classes)
+        coefs.append(output_coefs.tolist())
+        intercepts.append(
+            (numpy.asarray(scaled_intercepts) - output_coefs @ mean).tolist()
+        )
+
+    result = LogisticRegressionResult(
+        outcomes=outcomes, coefs=coefs, intercepts=intercepts, score=0.0
+    )
+    # Fraction of the samples whose outputs are all predicted right
+    predictions = result.predict(x)
+    correct = numpy.ones(len(x), dtype=bool)
+    for index, output in enumerate(outputs):
+        correct &= predictions[:, index] == dataframe[output].to_numpy(dtype=float)
+    result.score = float(correct.mean())
+    return result
+
+
+DEFAULT_RESOLUTION = 32
+"""Default maximum number of breakpoints of each input of a lookup table."""
+
+DEFAULT_MAX_TABLE_SIZE = 65536
+"""Default maximum number of values stored in a lookup table."""
+
+MAX_LOOKUP_INPUTS = 30
+"""Maximum number of inputs of a lookup table, the generated C sources visit
+the ``2**inputs`` corners of a grid cell to interpolate it."""
+
+
+@dataclass
+class LookupTableResult:
+    """Result from building an N-D lookup table.
+
+    The table stores the value of each output at every node of a grid, which
+    is the cartesian product of the breakpoints of each input. The values are
+    interpolated multilinearly between the nodes, and held constant beyond the
+    first and last breakpoints.
     """
-    x = dataframe[inputs]
-    y = dataframe[outputs].copy()
-    encoders = [LabelEncoder() for _ in outputs]
-    for encoder, output in zip(encoders, outputs):
-        y[output] = encoder.fit_transform(y[output])
-
-    reg = MultiOutputClassifier(LogisticRegression(max_iter=1000)).fit(x, y)  # type: ignore
-    outcomes = [encoder.classes_.tolist() for encoder in encoders]
-    coefs = [estimator.coef_.tolist() for estimator in reg.estimators_]
-    intercepts = [estimator.intercept_.tolist() for estimator in reg.estimators_]
-    score = float(reg.score(x, y))
 
-    return LogisticRegressionResult(
-        outcomes=outcomes,
-        coefs=coefs,
-        intercepts=intercepts,
-        score=score,
+    breakpoints: List[List[float]]
+    values: List[List[float]]
+    score: float
+
+    def _locate(self, x: numpy.ndarray) -> Tuple[List, List, List]:
+        indices, weights, steps = [], [], []
+        strides = _strides([len(points) for points in self.breakpoints])
+        for column, values, stride in zip(x.T, self.breakpoints, strides):
+            points = numpy.asarray(values)
+            if len(points) == 1:
+                indices.append(numpy.zeros(len(column), dtype=int))
+                weights.append(numpy.zeros(len(column)))
+                steps.append(0)
+                continue
+            index = numpy.searchsorted(points, column, side="right") - 1
+            index = numpy.clip(index, 0, len(points) - 2)
+            lower = points[index]
+            weight = (column - lower) / (points[index + 1] - lower)
+            indices.append(index * stride)
+            weights.append(numpy.clip(weight, 0.0, 1.0))
+            steps.append(stride)
+        return indices, weights, steps
+
+    def predict(self, x: numpy.ndarray) -> numpy.ndarray:
+        """Predict the outputs of the model.
+
+        Arguments:
+            x: matrix of input values with one row per sample
+
+        Returns:
+            Matrix of output values with one row per sample
+        """
+        x = numpy.atleast_2d(numpy.asarray(x, dtype=float))
+        values = numpy.asarray(self.values)
+        indices, weights, steps = self._locate(x)
+        predictions = numpy.zeros((len(x), len(values)))
+        for corner in range(2 ** len(self.breakpoints)):
+            weight = numpy.ones(len(x))
+            offset = numpy.zeros(len(x), dtype=int)
+            for dim, (index, fraction, step) in enumerate(zip(indices, weights, steps)):
+                if corner >> dim & 1:
+                    weight = weight * fraction
+                    offset = offset + index + step
+                else:
+                    weight = weight * (1 - fraction)
+                    offset = offset + index
+            predictions += weight[:, None] * values[:, offset].T
+        return predictions
+
+    def evaluation_cost(self) -> int:
+        """Count the operations needed to evaluate the model once.
+
+        Each input takes a binary search over its breakpoints, and each output
+        a weighted sum of the values at the corners of the enclosing cell.
+        """
+        search = sum(
+            max(1, math.ceil(math.log2(len(points)))) for points in self.breakpoints
+        )
+        return search + len(self.values) * 2 ** len(self.breakpoints)
+
+    def dependencies(self, tolerance: float = 0.0) -> List[List[int]]:
+        """List the inputs that each output depends on.
+
+        Arguments:
+            tolerance: differences between neighbouring values of the table
+                that are not larger than this tolerance are considered zero
+
+        Returns:
+            Indices of the inputs along which the values of each output change
+        """
+        shape = [len(points) for points in self.breakpoints]
+        dependencies = []
+        for values in self.values:
+            grid = numpy.asarray(values).reshape(shape)
+            dependencies.append(
+                [
+                    axis
+                    for axis, count in enumerate(shape)
+                    if count > 1
+                    and numpy.abs(numpy.diff(grid, axis=axis)).max() > tolerance
+                ]
+            )
+        return dependencies
+
+
+def _strides(npoints: Sequence[int]) -> List[int]:
+    # Row major layout, the breakpoints of the last input vary the fastest
+    strides = []
+    stride = 1
+    for count in reversed(npoints):
+        strides.append(stride)
+        stride *= count
+    return strides[::-1]
+
+
+def _breakpoints(column: numpy.ndarray, npoints: int) -> numpy.ndarray:
+    unique = numpy.unique(column)
+    if len(unique) <= npoints:
+        return unique
+    return numpy.unique(numpy.quantile(column, numpy.linspace(0, 1, npoints)))
+
+
+def lookup_table(
+    dataframe: pandas.DataFrame,
+    inputs: Iterable[str],
+    outputs: Iterable[str],
+    resolution: int = DEFAULT_RESOLUTION,
+    max_size: int = DEFAULT_MAX_TABLE_SIZE,
+) -> LookupTableResult:
+    """Grid the dataset variables columns into an N-D lookup table.
+
+    The breakpoints of each input are its distinct values if there are at most
+    ``resolution`` of them, so that datasets sampled on a grid are reproduced
+    exactly, otherwise they are quantiles of the input, so that they are
+    denser where there is more data. The value at each node of the grid is
+    the mean of the samples closest to it, and nodes without samples take the
+    value of a linear regression of the dataset.
+
+    Arguments:
+        dataframe: the dataset to build the lookup table from
+        inputs: list of input variable names
+        outputs: list of output variable names
+        resolution: maximum number of breakpoints of each input
+        max_size: maximum number of values in the table, the number of
+            breakpoints of the inputs with the most breakpoints is reduced
+            until the table fits
+
+    Returns:
+        A result that contains the breakpoints and the values of the table
+
+    Raises:
+        ValueError: if the table has more than :py:data:`MAX_LOOKUP_INPUTS`
+            inputs, or does not fit in ``max_size`` values even with two
+            breakpoints per input
+    """
+    inputs = list(inputs)
+    outputs = list(outputs)
+    if len(inputs) > MAX_LOOKUP_INPUTS:
+        raise ValueError(
+            f"A lookup table has at most {MAX_LOOKUP_INPUTS} inputs, "
+            f"not {len(inputs)}"
+        )
+    x = dataframe[inputs].to_numpy(dtype=float)
+    y = dataframe[outputs].to_numpy(dtype=float)
+
+    npoints = [min(resolution, len(numpy.unique(column))) for column in x.T]
+    while numpy.prod(npoints) * len(outputs) > max_size:
+        largest = int(numpy.argmax(npoints))
+        if npoints[largest] <= 2:
+            raise ValueError(
+                f"A lookup table of {len(inputs)} inputs and {len(outputs)} "
+                f"outputs does not fit in {max_size} values"
+            )
+        npoints[largest] -= 1
+    breakpoints = [_breakpoints(column, n) for column, n in zip(x.T, npoints)]
+
+    # Assign each sample to its closest node and average the samples of each node
+    strides = _strides([len(points) for points in breakpoints])
+    size = int(numpy.prod([len(points) for points in breakpoints]))
+    nodes = numpy.zeros(len(x), dtype=int)
+    for column, points, stride in zip(x.T, breakpoints, strides):
+        midpoints = (points[1:] + points[:-1]) / 2
+        nodes += numpy.searchsorted(midpoints, column) * stride
+    counts = numpy.bincount(nodes, minlength=size)
+    sums = numpy.stack(
+        [numpy.bincount(nodes, weights=column, minlength=size) for column in y.T]
     )
+
+    grid = numpy.stack(
+        [axis.ravel() for axis in numpy.meshgrid(*breakpoints, indexing="ij")], axis=1
+    )
+    fallback = LinearRegression().fit(x, y).predict(grid).T
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        values = numpy.where(counts > 0, sums / counts, fallback)
+
+    result = LookupTableResult(
+        breakpoints=[points.tolist() for points in breakpoints],
+        values=values.tolist(),
+        score=0.0,
+    )
+    result.score = float(r2_score(y, result.predict(x)))
+    return result
+
+
+Result = Union[
+    LinearRegressionResult,
+    SparseLinearRegressionResult,
+    LogisticRegressionResult,
+    LookupTableResult,
+]
+Strategy = Callable[..., Result]
+
+STRATEGIES: Dict[str, Strategy] = {
+    "linear": linear_regression,
+    "logistic": logistic_regression,
+    "lookup": lookup_table,
+    "sparse": sparse_linear_regression,
+}
+"""Mapping between the names of the strategies and the functions that fit them."""
@@ -1,13 +1,26 @@
 """General utilities."""
 
+import json
+import logging
+import os
 import re
 import shutil
+import struct
 import subprocess
+import sys
+import tempfile
 import unicodedata
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass
+from functools import lru_cache
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from typing import Any, Mapping, Optional
-from zipfile import ZipFile
+from typing import Any, Callable, Iterable, List, Mapping, Optional, Tuple, Union
+from zipfile import ZIP_BZIP2, ZIP_DEFLATED, ZIP_LZMA, ZIP_STORED, ZipFile
+
+from autofmu.cache import Cache, digest
+from autofmu.profiling import stage
 
 
 def slugify(value: Any, allow_unicode: bool = False) -> str:
@@ -34,6 +47,102 @@ def slugify(value: Any, allow_unicode: bool = False) -> str:
     return re.sub(r"[-\s]+", "-", value).strip("-_")
 
 
+class SerialExecutor(Executor):
+    """Executor that runs each task as soon as it is submitted.
+
+    Useful where a pool of workers is expected but the tasks must run in the
+    calling thread, for example inside a worker process of another pool.
+    """
+
+    def submit(self, fn: Callable, *args: Any, **kwargs: Any) -> Future:  # type: ignore
+        """Run a task and return a future that holds its outcome."""
+        future: Future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+
+
+@dataclass(frozen=True)
+class Target:
+    """A platform that the FMU sources can be compiled to.
+
+    The native target uses the default compiler picked by CMake, while the
+    others cross compile with the given compiler for the given system.
+    """
+
+    name: str
+    compiler: Optional[str] = None
+    system: Optional[str] = None
+
+    def is_available(self) -> bool:
+        """Check if the compiler required by this target is installed."""
+        return self.compiler is None or shutil.which(self.compiler) is not None
+
+
+TARGETS = {
+    target.name: target
+    for target in (
+        Target("native"),
+        Target("i686-linux-gnu", "i686-linux-gnu-gcc", "Linux"),
+        Target("x86_64-linux-gnu", "x86_64-linux-gnu-gcc", "Linux"),
+        Target("i686-w64-mingw32", "i686-w64-mingw32-gcc", "Windows"),
+        Target("x86_64-w64-mingw32", "x86_64-w64-mingw32-gcc", "Windows"),
+    )
+}
+"""Targets that an FMU can be compiled to, by name."""
+
+COMPRESSIONS = {
+    "store": ZIP_STORED,
+    "deflate": ZIP_DEFLATED,
+    "bzip2": ZIP_BZIP2,
+    "lzma": ZIP_LZMA,
+}
+"""Compression methods of the entries of an FMU file, by name."""
+
+FMU_DIRECTORIES = ("binaries", "sources", "resources", "documentation")
+"""Directories of an FMU, besides its ``modelDescription.xml`` file."""
+
+BACKENDS = ("direct", "cmake")
+"""Ways of compiling an FMU: calling the compiler directly, or through cmake."""
+
+
+@dataclass(frozen=True)
+class Toolchain:
+    """Platform that a compiler builds shared libraries for."""
+
+    compiler: str
+    platform: str
+    suffix: str
+
+    @property
+    def flags(self) -> List[str]:
+        """Compiler flags to build a shared library for this platform."""
+        if self.platform.startswith("win"):
+            return ["-shared"]
+        return ["-shared", "-fPIC"]
+
+
+class CompilationError(Exception):
+    """Raised when one or more targets of an FMU fail to compile."""
+
+    def __init__(self, failures: Mapping[str, str]) -> None:
+        """Create a compilation error.
+
+        Arguments:
+            failures: mapping between the names of the targets that failed and
+                the output of their compiler
+        """
+        self.failures = dict(failures)
+        details = "\n".join(
+            f"[{name}]\n{output.strip()}" for name, output in self.failures.items()
+        )
+        super().__init__(
+            f"Failed to compile targets {', '.join(self.failures)}:\n{details}"
+        )
+
+
 def run_cmake(
     source_dir: Path,
     build_dir: Path,
@@ -54,60 +163,492 @@ def run_cmake(
         variables: a mapping between variable names and their values, e.g,
             ``{"CMAKE_PROJECT_NAME": "Unicorn"}`` would be passed as
             ``DCMAKE_PROJECT_NAME=Unicorn`` in the command line
+
+    Raises:
+        subprocess.CalledProcessError: if configuring or building fails, with
+            the combined standard output and error of cmake in ``output``
     """
     cmake = shutil.which("cmake") or "cmake"
     if variables:
         args = [f"-D{name}={value}" for name, value in variables.items()]
     else:
         args = []
-    subprocess.run(
-        [cmake, *args, "-S", source_dir, "-B", build_dir],
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-    )
-    subprocess.run(
-        [cmake, "--build", build_dir],
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
+    with stage("cmake_configure", build_dir=str(build_dir)):
+        subprocess.run(
+            [cmake, *args, "-S", source_dir, "-B", build_dir],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+            check=True,
+        )
+    with stage("cmake_build", build_dir=str(build_dir)):
+        subprocess.run(
+            [cmake, "--build", build_dir],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+            check=True,
+        )
+
+
+def run_compiler(command: List[str]) -> None:
+    """Run a compiler command.
+
+    Arguments:
+        command: the compiler executable followed by its arguments
+
+    Raises:
+        subprocess.CalledProcessError: if the compilation fails, with the
+            combined standard output and error of the compiler in ``output``
+    """
+    with stage("compiler", compiler=command[0]):
+        subprocess.run(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+            check=True,
+        )
+
+
+# Platforms supported by FMI, with the predefined macro and the prefixes of
+# ``sys.platform`` that identify them, in the order they are checked
+_PLATFORMS = (
+    ("_WIN32", ("win", "cygwin"), "win", ".dll"),
+    ("__APPLE__", ("darwin",), "darwin", ".dylib"),
+    ("__linux__", ("linux",), "linux", ".so"),
+)
+
+
+def host_platform() -> Tuple[str, str]:
+    """Find out the platform that this Python interpreter runs on.
+
+    Returns:
+        The name of the platform, as in the ``binaries`` directory of an FMU
+        (e.g, "linux64"), and the suffix of its shared libraries
+    """
+    bits = 8 * struct.calcsize("P")
+    for _, prefixes, system, suffix in _PLATFORMS:
+        if sys.platform.startswith(prefixes):
+            return f"{system}{bits}", suffix
+    raise ValueError(f"Unsupported platform '{sys.platform}'")
+
+
+@lru_cache(maxsize=None)
+def _probe_toolchain(compiler: str) -> Toolchain:
+    output = subprocess.run(
+        [compiler, "-dM", "-E", "-x", "c", os.devnull],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+        check=True,
+    ).stdout
+    macros = {}
+    for line in output.splitlines():
+        parts = line.split(maxsplit=2)
+        if len(parts) >= 2 and parts[0] == "#define":
+            macros[parts[1]] = parts[2] if len(parts) == 3 else ""
+    bits = 8 * int(macros.get("__SIZEOF_POINTER__", "8"))
+    for macro, _, system, suffix in _PLATFORMS:
+        if macro in macros:
+            return Toolchain(compiler, f"{system}{bits}", suffix)
+    raise ValueError(f"Unsupported platform of compiler '{compiler}'")
+
+
+def detect_toolchain(compiler: str, cache: Optional[Cache] = None) -> Toolchain:
+    """Find out the platform that a compiler builds libraries for.
+
+    The platform is read from the macros predefined by the compiler. The result
+    is remembered for the rest of the process and, if a cache is given, stored
+    in it so that later runs skip the detection while the compiler executable
+    is unchanged.
+
+    Arguments:
+        compiler: name or path of the compiler executable
+        cache: cache to store the detected toolchain across runs
+
+    Returns:
+        The toolchain of the compiler
+
+    Raises:
+        subprocess.CalledProcessError: if the compiler can not be run
+        ValueError: if the compiler targets a platform not supported by FMI
+    """
+    path = shutil.which(compiler) or compiler
+    if cache is None:
+        return _probe_toolchain(path)
+
+    stat = os.stat(path)
+    key = digest("toolchain", path, str(stat.st_mtime_ns), str(stat.st_size))
+    entry = cache.get(key)
+    if entry is not None:
+        return Toolchain(**json.loads((entry / "toolchain.json").read_text()))
+
+    toolchain = _probe_toolchain(path)
+    with TemporaryDirectory() as tmpdir:
+        tmpfile = Path(tmpdir) / "toolchain.json"
+        tmpfile.write_text(json.dumps(asdict(toolchain)))
+        cache.put(key, tmpfile)
+    return toolchain
+
+
+def build_target(
+    model_identifier: str,
+    source_dir: Path,
+    build_dir: Path,
+    target: Target,
+    backend: str = "direct",
+    cache: Optional[Cache] = None,
+) -> Path:
+    """Compile the FMU sources for a single target.
+
+    The libraries are written to a ``binaries`` directory inside
+    ``build_dir`` so that several targets can be built at the same time from
+    the same sources, with the same layout as in the FMU (for example,
+    ``binaries/linux64/model.so``).
+
+    With the ``"direct"`` backend the compiler is invoked once to build the
+    shared library, while the ``"cmake"`` backend configures and builds a
+    cmake project.
+
+    Arguments:
+        model_identifier: short class name according to C syntax, for example, "A_B_C"
+        source_dir: path to the FMU sources, containing a ``CMakeLists.txt``
+        build_dir: path to the build directory of this target
+        target: target to compile the FMU to
+        backend: how to compile the target (see :py:data:`BACKENDS`)
+        cache: cache to store the detected toolchains across runs
+
+    Returns:
+        Path to the directory where the target libraries were written
+
+    Raises:
+        CompilationError: if the compiler of the ``"direct"`` backend cannot be
+            run, for example, because it is not installed
+    """
+    binary_dir = build_dir / "binaries"
+    with stage("build_target", target=target.name, backend=backend):
+        if backend == "cmake":
+            variables = {
+                "CMAKE_PROJECT_NAME": model_identifier,
+                "FMU_BINARY_DIR": str(binary_dir),
+            }
+            if target.system:
+                variables["CMAKE_SYSTEM_NAME"] = target.system
+            if target.compiler:
+                variables["CMAKE_C_COMPILER"] = target.compiler
+            run_cmake(source_dir, build_dir, variables)
+        else:
+            compiler = target.compiler or os.environ.get("CC", "cc")
+            try:
+                toolchain = detect_toolchain(compiler, cache)
+                library = (
+                    binary_dir
+                    / toolchain.platform
+                    / (model_identifier + toolchain.suffix)
+                )
+                library.parent.mkdir(parents=True, exist_ok=True)
+                run_compiler(
+                    [
+                        toolchain.compiler,
+                        *os.environ.get("CFLAGS", "").split(),
+                        *toolchain.flags,
+                        "-o",
+                        str(library),
+                        str(source_dir / "sources" / "fmi2Functions.c"),
+                        *os.environ.get("LDFLAGS", "").split(),
+                    ]
+                )
+            except OSError as error:
+                raise CompilationError(
+                    {target.name: f"Cannot run compiler '{compiler}': {error}"}
+                ) from error
+    return binary_dir
+
+
+@lru_cache(maxsize=None)
+def compiler_identity(compiler: str) -> str:
+    """Describe the exact version of a compiler.
+
+    Arguments:
+        compiler: name or path of the compiler executable
+
+    Returns:
+        The resolved path of the compiler followed by its ``--version`` output
+    """
+    path = shutil.which(compiler) or compiler
+    try:
+        version = subprocess.run(
+            [path, "--version"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+        ).stdout
+    except OSError:
+        version = ""
+    return f"{path}\n{version}"
+
+
+def target_cache_key(
+    model_identifier: str, source_dir: Path, target: Target, backend: str = "direct"
+) -> str:
+    """Compute the key that identifies the libraries built for a target.
+
+    The key covers everything that affects the compiled libraries: the FMU
+    sources and headers, the ``CMakeLists.txt``, the backend, the identity of
+    the compiler, and of cmake when it is used, and the compiler flags set in
+    the environment.
+
+    Arguments:
+        model_identifier: short class name according to C syntax, for example, "A_B_C"
+        source_dir: path to the extracted FMU, containing a ``CMakeLists.txt``
+        target: target the FMU is compiled to
+        backend: how the target is compiled (see :py:data:`BACKENDS`)
+
+    Returns:
+        Key to use in a :py:class:`~autofmu.cache.Cache`
+    """
+    compiler = target.compiler or os.environ.get("CC", "cc")
+    parts: List[Union[bytes, str]] = [
+        model_identifier,
+        target.name,
+        target.system or "",
+        backend,
+        compiler_identity(compiler),
+        compiler_identity("cmake") if backend == "cmake" else "",
+        os.environ.get("CFLAGS", ""),
+        os.environ.get("LDFLAGS", ""),
+    ]
+    files = sorted(path for path in source_dir.glob("sources/**/*") if path.is_file())
+    for path in [*files, source_dir / "CMakeLists.txt"]:
+        parts.extend([path.relative_to(source_dir).as_posix(), path.read_bytes()])
+    return digest(*parts)
+
+
+def build_target_cached(
+    model_identifier: str,
+    source_dir: Path,
+    build_dir: Path,
+    target: Target,
+    cache: Optional[Cache] = None,
+    backend: str = "direct",
+) -> Path:
+    """Compile the FMU sources for a single target, reusing cached libraries.
+
+    On a cache hit the libraries are copied from the cache and the compiler is
+    not invoked at all. Otherwise the target is built with :py:func:`build_target`
+    and the resulting libraries are stored in the cache.
+
+    Arguments:
+        model_identifier: short class name according to C syntax, for example, "A_B_C"
+        source_dir: path to the extracted FMU, containing a ``CMakeLists.txt``
+        build_dir: path to the build directory of this target
+        target: target to compile the FMU to
+        cache: cache of compiled libraries, if ``None`` the target is always built
+        backend: how to compile the target (see :py:data:`BACKENDS`)
+
+    Returns:
+        Path to the directory where the target libraries were written
+    """
+    if cache is None:
+        return build_target(model_identifier, source_dir, build_dir, target, backend)
+
+    key = target_cache_key(model_identifier, source_dir, target, backend)
+    entry = cache.get(key)
+    if entry is not None:
+        logging.info("Using cached libraries for target '%s'", target.name)
+        binary_dir = build_dir / "binaries"
+        shutil.copytree(entry / "binaries", binary_dir)
+        return binary_dir
+
+    binary_dir = build_target(
+        model_identifier, source_dir, build_dir, target, backend, cache
     )
+    cache.put(key, binary_dir)
+    return binary_dir
 
 
-def compile_fmu(model_identifier: str, fmu_path: Path) -> None:
-    """Compile the C sources files of an FMU.
+def compile_sources(
+    model_identifier: str,
+    source_dir: Path,
+    targets: Optional[Iterable[str]] = None,
+    jobs: Optional[int] = None,
+    cache: Optional[Cache] = None,
+    executor: Optional[Executor] = None,
+    backend: str = "direct",
+) -> None:
+    """Compile the C sources files of an FMU staged in a directory.
 
-    Extracts the FMU into a temporary directory, calling cmake to build the FMU,
-    copying the generated library back into the FMU file.
+    Builds each target in its own directory under ``build``, and merges the
+    generated libraries into the ``binaries`` directory of the FMU.
     If `MinGW <http://www.mingw.org/>`_ is installed, it also cross compiles
     the FMU for Linux and Windows.
 
+    The targets are built concurrently. Targets whose compiler is not installed
+    are skipped.
+
+    Arguments:
+        model_identifier: short class name according to C syntax, for example, "A_B_C"
+        source_dir: path to the directory with the contents of the FMU
+        targets: names of the targets to build (see :py:data:`TARGETS`), by
+            default every target is built, while an empty list builds none
+        jobs: maximum number of targets to build at the same time, by default
+            the number of processors in the machine
+        cache: cache of compiled libraries, targets whose libraries are cached
+            are not built again
+        executor: executor to run the compilation of each target, for example
+            to share a pool of workers between several FMUs, in which case
+            ``jobs`` is ignored
+        backend: how to compile each target (see :py:data:`BACKENDS`)
+
+    Raises:
+        CompilationError: if any of the available targets fails to compile
+    """
+    selected = [TARGETS[name] for name in (TARGETS if targets is None else targets)]
+    available = []
+    for target in selected:
+        if target.is_available():
+            available.append(target)
+        else:
+            logging.info(
+                "Skipping target '%s': %s not found", target.name, target.compiler
+            )
+
+    shutil.copy(Path(__file__).parent / "cmake" / "CMakeLists.txt", source_dir)
+
+    with ExitStack() as stack:
+        if executor is None:
+            max_workers = min(jobs or os.cpu_count() or 1, len(available) or 1)
+            executor = stack.enter_context(
+                ThreadPoolExecutor(max_workers=max(1, max_workers))
+            )
+        futures = [
+            executor.submit(
+                build_target_cached,
+                model_identifier,
+                source_dir,
+                source_dir / "build" / target.name,
+                target,
+                cache,
+                backend,
+            )
+            for target in available
+        ]
+        for future in futures:
+            future.exception()
+
+    failures = {}
+    binary_dirs = []
+    for target, future in zip(available, futures):
+        try:
+            binary_dirs.append(future.result())
+            logging.info("Compiled target '%s'", target.name)
+        except subprocess.CalledProcessError as error:
+            failures[target.name] = error.output or str(error)
+        except CompilationError as error:
+            failures.update(error.failures)
+        except ValueError as error:
+            failures[target.name] = str(error)
+    if failures:
+        raise CompilationError(failures)
+
+    # Merge in target order, so that targets that produce the same platform
+    # library override each other just like in a sequential build
+    for binary_dir in binary_dirs:
+        for lib in sorted(binary_dir.glob("**/*")):
+            if lib.is_file():
+                dest = source_dir / "binaries" / lib.relative_to(binary_dir)
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy(lib, dest)
+
+
+def write_archive(source_dir: Path, outfile: Path, compression: str = "store") -> None:
+    """Pack the contents of an FMU staged in a directory into an FMU file.
+
+    Only the entries defined by the FMI standard are packed, so the build files
+    left in the directory are skipped. The archive is written next to
+    ``outfile`` and then renamed over it, so a partially written FMU never
+    appears at ``outfile``.
+
+    Arguments:
+        source_dir: path to the directory with the contents of the FMU
+        outfile: path to the FMU file
+        compression: compression method of the archive entries (see
+            :py:data:`COMPRESSIONS`)
+    """
+    outfile = Path(outfile)
+    paths = [path for path in [source_dir / "modelDescription.xml"] if path.is_file()]
+    for directory in FMU_DIRECTORIES:
+        paths.extend(
+            sorted(
+                path for path in (source_dir / directory).glob("**/*") if path.is_file()
+            )
+        )
+
+    fd, tmpname = tempfile.mkstemp(
+        prefix=f".{outfile.name}.", suffix=".tmp", dir=outfile.parent
+    )
+    try:
+        with os.fdopen(fd, "wb") as tmpfile, ZipFile(
+            tmpfile, "w", compression=COMPRESSIONS[compression]
+        ) as fmu:
+            for path in paths:
+                fmu.write(path, path.relative_to(source_dir).as_posix())
+        # mkstemp creates the file readable by its owner only
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmpname, 0o666 & ~umask)
+        os.replace(tmpname, outfile)
+    except BaseException:
+        os.unlink(tmpname)
+        raise
+
+
+def compile_fmu(
+    model_identifier: str,
+    fmu_path: Path,
+    targets: Optional[Iterable[str]] = None,
+    jobs: Optional[int] = None,
+    cache: Optional[Cache] = None,
+    executor: Optional[Executor] = None,
+    compression: str = "store",
+    backend: str = "direct",
+) -> None:
+    """Compile the C sources files of an existing FMU file.
+
+    Extracts the FMU into a temporary directory, compiles it with
+    :py:func:`compile_sources` and writes it back with the libraries. FMUs
+    generated by :py:func:`~autofmu.generator.build_fmu` are compiled before
+    they are packed, without this extra round trip.
+
     Arguments:
         model_identifier: short class name according to C syntax, for example, "A_B_C"
         fmu_path: path to the FMU file
+        targets: names of the targets to build (see :py:data:`TARGETS`), by
+            default every target is built, while an empty list builds none
+        jobs: maximum number of targets to build at the same time, by default
+            the number of processors in the machine
+        cache: cache of compiled libraries, targets whose libraries are cached
+            are not built again
+        executor: executor to run the compilation of each target, in which case
+            ``jobs`` is ignored
+        compression: compression method of the archive entries (see
+            :py:data:`COMPRESSIONS`)
+        backend: how to compile each target (see :py:data:`BACKENDS`)
+
+    Raises:
+        CompilationError: if any of the available targets fails to compile
     """
-    with ZipFile(fmu_path, "a") as fmu, TemporaryDirectory() as tmpdir:
-        fmu.extractall(tmpdir)
-
-        # Use CMake to compile the FMU for the current platform
-        shutil.copy(Path(__file__).parent / "cmake" / "CMakeLists.txt", tmpdir)
-        build_dir = Path(tmpdir) / "build"
-        run_cmake(Path(tmpdir), build_dir, {"CMAKE_PROJECT_NAME": model_identifier})
-
-        # Cross compile
-        compilers = (
-            ("i686-linux-gnu-gcc", "Linux"),
-            ("x86_64-linux-gnu-gcc", "Linux"),
-            ("i686-w64-mingw32-gcc", "Windows"),
-            ("x86_64-w64-mingw32-gcc", "Windows"),
+    with TemporaryDirectory() as tmpdir:
+        with ZipFile(fmu_path) as fmu:
+            fmu.extractall(tmpdir)
+        compile_sources(
+            model_identifier,
+            Path(tmpdir),
+            targets=targets,
+            jobs=jobs,
+            cache=cache,
+            executor=executor,
+            backend=backend,
         )
-        for compiler, system in compilers:
-            run_cmake(
-                Path(tmpdir),
-                build_dir / compiler,
-                {
-                    "CMAKE_PROJECT_NAME": model_identifier,
-                    "CMAKE_SYSTEM_NAME": system,
-                    "CMAKE_C_COMPILER": compiler,
-                },
-            )
-        for lib in Path(tmpdir).glob("binaries/**/*"):
-            fmu.write(lib, lib.relative_to(tmpdir))
+        write_archive(Path(tmpdir), fmu_path, compression)
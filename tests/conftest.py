@@ -1,9 +1,21 @@
 import csv
 from random import random
 
+import numpy
+import pandas
 import pytest
 
 
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    # Keep the caches written by the tests out of the cache of the user
+    cache_home = tmp_path / "cache-home"
+    monkeypatch.setenv("XDG_CACHE_HOME", str(cache_home))
+    monkeypatch.setattr("autofmu.cache.DEFAULT_CACHE_DIR", cache_home / "autofmu")
+    monkeypatch.setattr("autofmu.cli.DEFAULT_CACHE_DIR", cache_home / "autofmu")
+    return cache_home / "autofmu"
+
+
 @pytest.fixture
 def csvfile(tmp_path):
     header = ["x", "y", "z"]
@@ -19,3 +31,20 @@ def csvfile(tmp_path):
             writer.writerow(row)
 
     return filename
+
+
+@pytest.fixture
+def make_dataframe():
+    # Dataset of two uniform inputs, x and y, and an output z that is either
+    # 2x - y + 1 plus some noise, or whether x is greater than y
+    def make_dataframe(nrows=200, seed=0, categorical=False, noise=0.0):
+        rng = numpy.random.default_rng(seed)
+        x = rng.uniform(0, 1, size=nrows)
+        y = rng.uniform(0, 1, size=nrows)
+        if categorical:
+            z = (x > y).astype(float)
+        else:
+            z = 2 * x - y + 1 + rng.normal(scale=noise, size=nrows)
+        return pandas.DataFrame({"x": x, "y": y, "z": z})
+
+    return make_dataframe
@@ -0,0 +1,84 @@
+import json
+
+import pytest
+from fmpy.validation import validate_fmu
+
+from autofmu.batch import BatchItem, format_statuses, load_manifest, run_batch
+from autofmu.strategies import STRATEGIES
+
+
+def test_load_manifest_applies_defaults_and_resolves_paths(tmp_path):
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(
+        json.dumps(
+            {
+                "defaults": {"dataset": "data.csv", "strategy": "logistic"},
+                "fmus": [
+                    {"inputs": ["x"], "outputs": ["z"], "outfile": "a.fmu"},
+                    {
+                        "inputs": ["y"],
+                        "outputs": ["z"],
+                        "outfile": "b.fmu",
+                        "strategy": "linear",
+                    },
+                ],
+            }
+        )
+    )
+    items = load_manifest(manifest)
+    assert items == [
+        BatchItem(tmp_path / "data.csv", ["x"], ["z"], tmp_path / "a.fmu", "logistic"),
+        BatchItem(tmp_path / "data.csv", ["y"], ["z"], tmp_path / "b.fmu", "linear"),
+    ]
+
+
+ITEM = {"dataset": "data.csv", "inputs": ["x"], "outputs": ["z"], "outfile": "a.fmu"}
+
+
+@pytest.mark.parametrize(
+    "manifest",
+    [
+        {"fmus": "spam"},
+        {"defaults": ["spam"], "fmus": [ITEM]},
+        ["spam"],
+        [{**ITEM, "inputs": "x"}],
+        [{**ITEM, "outputs": [1]}],
+        [{**ITEM, "outfile": 1}],
+        [{**ITEM, "parameters": ["spam"]}],
+    ],
+)
+def test_load_manifest_rejects_malformed_entries(tmp_path, manifest):
+    path = tmp_path / "manifest.json"
+    path.write_text(json.dumps(manifest))
+    with pytest.raises(ValueError):
+        load_manifest(path)
+
+
+def test_run_batch_reports_failures_without_stopping(tmp_path, csvfile):
+    items = [
+        BatchItem(csvfile, ["x", "y"], ["z"], tmp_path / "first.fmu"),
+        BatchItem(csvfile, ["x"], ["z"], tmp_path / "second.fmu", "auto"),
+        BatchItem(csvfile, ["x"], ["z"], tmp_path / "broken.fmu", "spam"),
+    ]
+    statuses = run_batch(items, jobs=2, targets=["native"])
+
+    assert [status.ok for status in statuses] == [True, True, False]
+    assert statuses[1].strategy in STRATEGIES
+    assert not validate_fmu(str(tmp_path / "first.fmu"))
+    assert not validate_fmu(str(tmp_path / "second.fmu"))
+    assert not (tmp_path / "broken.fmu").exists()
+    assert "2 of 3 FMUs generated" in format_statuses(statuses)
+
+
+def test_run_batch_fails_only_items_with_missing_columns(tmp_path, csvfile):
+    items = [
+        BatchItem(csvfile, ["x", "y"], ["z"], tmp_path / "good.fmu"),
+        BatchItem(csvfile, ["x", "typo"], ["z"], tmp_path / "bad.fmu"),
+    ]
+    statuses = run_batch(items, jobs=2, targets=["native"])
+
+    assert [status.ok for status in statuses] == [True, False]
+    assert "typo" in statuses[1].error
+    assert not validate_fmu(str(tmp_path / "good.fmu"))
+    assert not (tmp_path / "bad.fmu").exists()
+    assert "1 of 2 FMUs generated" in format_statuses(statuses)
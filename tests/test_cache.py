@@ -0,0 +1,38 @@
+import os
+
+from autofmu.cache import Cache, digest
+
+
+def test_digest_separates_parts():
+    assert digest("ab", "c") != digest("a", "bc")
+    assert digest(b"spam") == digest("spam")
+
+
+def test_cache_stores_and_retrieves_directories(tmp_path):
+    source = tmp_path / "binaries"
+    (source / "linux64").mkdir(parents=True)
+    (source / "linux64" / "model.so").write_bytes(b"library")
+    cache = Cache(tmp_path / "cache")
+
+    assert cache.get("key") is None
+    cache.put("key", source)
+    entry = cache.get("key")
+    assert entry is not None
+    assert (entry / "binaries" / "linux64" / "model.so").read_bytes() == b"library"
+
+
+def test_cache_evicts_least_recently_used_entries(tmp_path):
+    cache = Cache(tmp_path / "cache", max_size=250)
+    for index, key in enumerate(["old", "used", "new"]):
+        source = tmp_path / key
+        source.write_bytes(b"x" * 100)
+        cache.put(key, source)
+        entry = cache.get(key)
+        assert entry is not None
+        os.utime(entry, (index, index))
+    os.utime(cache.directory / "used")
+
+    cache.evict()
+    assert cache.get("old") is None
+    assert cache.get("used") is not None
+    assert cache.get("new") is not None
@@ -0,0 +1,131 @@
+import numpy
+import pandas
+import pytest
+
+from autofmu import dataset
+from autofmu.dataset import expand_dataset_paths, read_dataset, read_datasets
+
+
+def test_read_dataset_reads_only_selected_columns_as_floats(csvfile):
+    dataframe = read_dataset(csvfile, ["x", "z"])
+    assert list(dataframe.columns) == ["x", "z"]
+    assert all(dtype == numpy.float64 for dtype in dataframe.dtypes)
+
+
+def test_read_dataset_fails_on_missing_columns(csvfile):
+    with pytest.raises(ValueError, match="spam"):
+        read_dataset(csvfile, ["x", "spam"])
+
+
+def test_read_dataset_fails_on_unsupported_format(tmp_path):
+    with pytest.raises(ValueError, match="Unsupported"):
+        read_dataset(tmp_path / "dataset.xlsx", ["x"])
+
+
+def test_read_dataset_reads_chunks(csvfile):
+    chunks = list(read_dataset(csvfile, ["x", "y"], chunksize=4))
+    assert [len(chunk.index) for chunk in chunks] == [4, 4, 2]
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "feather"])
+def test_read_dataset_reads_columnar_formats(tmp_path, csvfile, fmt):
+    pytest.importorskip("pyarrow")
+    expected = pandas.read_csv(csvfile)
+    path = tmp_path / f"dataset.{fmt}"
+    getattr(expected, f"to_{fmt}")(path)
+
+    dataframe = read_dataset(path, ["y", "z"])
+    pandas.testing.assert_frame_equal(dataframe, expected[["y", "z"]])
+    chunks = list(read_dataset(path, ["y", "z"], chunksize=3))
+    assert sum(len(chunk.index) for chunk in chunks) == len(expected.index)
+
+
+def test_read_dataset_reads_npy_arrays(tmp_path):
+    values = numpy.arange(12, dtype=float).reshape(4, 3)
+    numpy.save(tmp_path / "plain.npy", values)
+    structured = numpy.zeros(4, dtype=[("x", "f8"), ("y", "f4")])
+    structured["x"] = values[:, 0]
+    structured["y"] = values[:, 1]
+    numpy.save(tmp_path / "structured.npy", structured)
+
+    plain = read_dataset(tmp_path / "plain.npy", ["0", "2"])
+    numpy.testing.assert_array_equal(plain.to_numpy(), values[:, [0, 2]])
+    named = read_dataset(tmp_path / "structured.npy", ["y", "x"])
+    numpy.testing.assert_array_equal(named.to_numpy(), values[:, [1, 0]])
+
+
+@pytest.fixture
+def shards(tmp_path):
+    directory = tmp_path / "shards"
+    directory.mkdir()
+    values = numpy.arange(30, dtype=float).reshape(10, 3)
+    dataframe = pandas.DataFrame(values, columns=["x", "y", "z"])
+    for index, start in enumerate(range(0, 10, 4)):
+        shard = dataframe.iloc[start : start + 4]
+        shard.to_csv(directory / f"hour-{index:02d}.csv", index=False)
+    (directory / "notes.txt").write_text("not a dataset")
+    return directory, dataframe
+
+
+def test_expand_dataset_paths_finds_files_of_directories_and_patterns(shards):
+    directory, _ = shards
+    expected = [directory / f"hour-{index:02d}.csv" for index in range(3)]
+    assert expand_dataset_paths([directory]) == expected
+    assert expand_dataset_paths([str(directory / "hour-*.csv")]) == expected
+    assert expand_dataset_paths([expected[2], expected[0]]) == [
+        expected[2],
+        expected[0],
+    ]
+    with pytest.raises(ValueError, match="No dataset files"):
+        expand_dataset_paths([str(directory / "*.parquet")])
+
+
+def test_read_datasets_concatenates_shards_in_order(shards):
+    directory, expected = shards
+    dataframe = read_datasets([directory], ["z", "x"], jobs=2)
+    pandas.testing.assert_frame_equal(dataframe, expected[["z", "x"]])
+
+
+def test_read_datasets_does_not_copy_concatenated_shards(shards, monkeypatch):
+    buffers = []
+    empty = numpy.empty
+
+    def spy(*args, **kwargs):
+        buffers.append(empty(*args, **kwargs))
+        return buffers[-1]
+
+    monkeypatch.setattr(numpy, "empty", spy)
+    dataframe = read_datasets([shards[0]], ["x", "y"], jobs=2)
+    monkeypatch.undo()
+    assert any(
+        numpy.shares_memory(buffer, dataframe["x"].to_numpy()) for buffer in buffers
+    )
+
+
+def test_read_datasets_streams_shards_in_chunks(shards):
+    directory, expected = shards
+    chunks = list(read_datasets([directory], ["x", "y"], chunksize=3, jobs=2))
+    assert [len(chunk.index) for chunk in chunks] == [3, 1, 3, 1, 2]
+    pandas.testing.assert_frame_equal(
+        pandas.concat(chunks, ignore_index=True), expected[["x", "y"]]
+    )
+
+
+def test_read_datasets_streams_shards_without_reading_them_whole(shards, monkeypatch):
+    calls = []
+    read_dataset = dataset.read_dataset
+
+    def spy(path, columns, chunksize=None):
+        calls.append(chunksize)
+        return read_dataset(path, columns, chunksize=chunksize)
+
+    monkeypatch.setattr(dataset, "read_dataset", spy)
+    list(read_datasets([shards[0]], ["x", "y"], chunksize=3, jobs=2))
+    assert calls and all(chunksize == 3 for chunksize in calls)
+
+
+def test_read_datasets_checks_columns_of_every_shard(shards):
+    directory, _ = shards
+    pandas.DataFrame({"x": [1.0]}).to_csv(directory / "hour-99.csv", index=False)
+    with pytest.raises(ValueError, match="hour-99"):
+        read_datasets([directory], ["x", "y"], chunksize=3)
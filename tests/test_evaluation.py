@@ -0,0 +1,63 @@
+import subprocess
+import sys
+
+import numpy
+import pandas
+import pytest
+from fmpy import extract
+from fmpy.fmi2 import FMU2Slave
+from fmpy.model_description import read_model_description
+
+from autofmu.evaluation import evaluate
+from autofmu.generator import generate_fmu
+
+
+@pytest.fixture(scope="module")
+def fmu(tmp_path_factory):
+    fmu = tmp_path_factory.mktemp("evaluation") / "model.fmu"
+    rng = numpy.random.default_rng(0)
+    x = rng.uniform(-1, 1, size=(500, 2))
+    y = numpy.column_stack([x[:, 0] * x[:, 1], x[:, 0] - x[:, 1]])
+    dataframe = pandas.DataFrame(numpy.hstack([x, y]), columns=["a", "b", "u", "v"])
+    generate_fmu(dataframe, "Test Model", ["a", "b"], ["u", "v"], fmu, "lookup")
+    return fmu
+
+
+def test_evaluate_matches_fmi_evaluation(fmu):
+    unzipdir = extract(fmu)
+    model_description = read_model_description(unzipdir)
+    slave = FMU2Slave(
+        guid=model_description.guid,
+        unzipDirectory=unzipdir,
+        modelIdentifier=model_description.coSimulation.modelIdentifier,
+        instanceName="instance",
+    )
+    slave.instantiate()
+
+    x = numpy.random.default_rng(1).uniform(-1.5, 1.5, size=(20, 2))
+    outputs = evaluate(fmu, x)
+    assert outputs.shape == (20, 2)
+    for row, expected in zip(x, outputs):
+        slave.setReal([1, 2], list(row))
+        assert slave.getReal([3, 4]) == list(expected)
+    slave.freeInstance()
+
+
+def test_evaluate_accepts_any_layout(fmu):
+    x = numpy.random.default_rng(2).uniform(-1, 1, size=(2, 100))
+    expected = evaluate(fmu, numpy.ascontiguousarray(x.T))
+    numpy.testing.assert_array_equal(evaluate(fmu, x.T), expected)
+    numpy.testing.assert_array_equal(evaluate(fmu, x.T.tolist()), expected)
+    assert evaluate(fmu, numpy.empty((0, 2))).shape == (0, 2)
+
+
+def test_evaluate_fails_on_wrong_number_of_inputs(fmu):
+    with pytest.raises(ValueError):
+        evaluate(fmu, numpy.zeros((3, 3)))
+    with pytest.raises(ValueError):
+        evaluate(fmu, numpy.zeros(2))
+
+
+def test_importing_autofmu_does_not_load_evaluation():
+    code = "import sys, autofmu; assert 'autofmu.evaluation' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], check=True)
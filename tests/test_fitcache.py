@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+from autofmu import generator
+from autofmu.cache import Cache
+from autofmu.fitcache import FIT_FILE, fingerprint, fit_cache_key
+from autofmu.generator import fit_model, generate_fmu
+from autofmu.strategies import STRATEGIES
+
+
+def count_fits(monkeypatch):
+    calls = []
+    strategies = dict(generator.STRATEGIES)
+    for name, strategy in generator.STRATEGIES.items():
+        strategies[name] = lambda *args, strategy=strategy, **kwargs: (
+            calls.append(1) or strategy(*args, **kwargs)
+        )
+    monkeypatch.setattr(generator, "STRATEGIES", strategies)
+    return calls
+
+
+def test_fingerprint_depends_on_values_and_columns(monkeypatch, make_dataframe):
+    dataframe = make_dataframe(categorical=True)
+    expected = fingerprint(dataframe, ["x", "y"])
+    monkeypatch.setattr("autofmu.fitcache.FINGERPRINT_CHUNK_ROWS", 7)
+    assert fingerprint(dataframe.copy(), ["x", "y"]) == expected
+    assert fingerprint(dataframe, ["y", "x"]) != expected
+    assert fingerprint(dataframe.iloc[::-1], ["x", "y"]) != expected
+    changed = dataframe.copy()
+    changed.loc[150, "y"] += 1e-12
+    assert fingerprint(changed, ["x", "y"]) != expected
+
+
+def test_fit_model_reuses_cached_fit(tmp_path, monkeypatch, make_dataframe):
+    calls = count_fits(monkeypatch)
+    cache = Cache(tmp_path / "cache")
+    dataframe = make_dataframe(categorical=True)
+    fit = fit_model(dataframe, ["x", "y"], ["z"], "logistic", cache=cache)
+    assert len(calls) == 1
+    assert (
+        fit_model(dataframe.copy(), ["x", "y"], ["z"], "logistic", cache=cache) == fit
+    )
+    assert len(calls) == 1
+
+    # Other data, strategy or keyword arguments are fitted again
+    fit_model(dataframe.iloc[1:], ["x", "y"], ["z"], "logistic", cache=cache)
+    fit_model(dataframe, ["x", "y"], ["z"], "lookup", cache=cache)
+    parameters = {"lookup": {"resolution": 4}}
+    fit_model(
+        dataframe, ["x", "y"], ["z"], "lookup", parameters=parameters, cache=cache
+    )
+    assert len(calls) == 4
+
+
+def test_fit_model_refits_unreadable_cached_fit(tmp_path, make_dataframe):
+    cache = Cache(tmp_path / "cache")
+    dataframe = make_dataframe(categorical=True)
+    fit = fit_model(dataframe, ["x", "y"], ["z"], "linear", cache=cache)
+    key = fit_cache_key(
+        fingerprint(dataframe, ["x", "y", "z"]),
+        "linear",
+        inputs=["x", "y"],
+        outputs=["z"],
+        parameters={},
+    )
+    (cache.get(key) / FIT_FILE).write_bytes(b"garbage")
+    assert fit_model(dataframe, ["x", "y"], ["z"], "linear", cache=cache)[1] == fit[1]
+
+
+def test_generate_fmu_reuses_cached_fit(tmp_path, monkeypatch, make_dataframe):
+    calls = count_fits(monkeypatch)
+    fit_cache = Cache(tmp_path / "cache")
+    dataframe = make_dataframe(categorical=True)
+    for name in ("first", "second"):
+        generate_fmu(
+            dataframe,
+            name,
+            ["x", "y"],
+            ["z"],
+            tmp_path / f"{name}.fmu",
+            "logistic",
+            targets=["native"],
+            fit_cache=fit_cache,
+        )
+    assert len(calls) == 1
+    assert (tmp_path / "second.fmu").exists()
+
+
+@pytest.mark.parametrize("strategy", sorted(STRATEGIES))
+def test_cached_fits_are_stored_as_json(tmp_path, strategy, make_dataframe):
+    cache = Cache(tmp_path / "cache")
+    dataframe = make_dataframe(categorical=True)
+    fit = fit_model(dataframe, ["x", "y"], ["z"], strategy, cache=cache)
+    cached = fit_model(dataframe, ["x", "y"], ["z"], strategy, cache=cache)
+
+    assert cached[:2] == fit[:2]
+    assert type(cached[1]) is type(fit[1])
+    if fit[2] is None:
+        assert cached[2] is None
+    else:
+        assert cached[2].to_dict() == fit[2].to_dict()
+    (entry,) = [path for path in (tmp_path / "cache").rglob(FIT_FILE)]
+    assert json.loads(entry.read_text())["strategy"] == strategy
@@ -1,11 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor
+from ctypes import byref
 from uuid import uuid4
+from zipfile import ZIP_DEFLATED, ZipFile
 
+import numpy
 import pandas
 import pytest
+from fmpy import extract
+from fmpy.fmi2 import FMU2Slave
 from fmpy.model_description import read_model_description
 from fmpy.validation import validate_fmu
+from lxml import etree
 
-from autofmu.generator import generate_fmu, generate_model_description
+from autofmu.generator import (
+    generate_fmu,
+    generate_model_description,
+    generate_model_tables,
+)
+from autofmu.sampling import SamplingOptions
+from autofmu.strategies import (
+    MAX_LOOKUP_INPUTS,
+    LookupTableResult,
+    linear_regression,
+    lookup_table,
+    sparse_linear_regression,
+)
+
+
+def instantiate(unzipdir, instance_name="instance"):
+    model_description = read_model_description(unzipdir)
+    slave = FMU2Slave(
+        guid=model_description.guid,
+        unzipDirectory=unzipdir,
+        modelIdentifier=model_description.coSimulation.modelIdentifier,
+        instanceName=instance_name,
+    )
+    slave.instantiate()
+    slave.setupExperiment()
+    slave.enterInitializationMode()
+    slave.exitInitializationMode()
+    return slave
 
 
 def test_generate_model_description_generates_valid_model_description(tmp_path):
@@ -37,3 +71,330 @@ def test_generate_fmu_generates_valid_fmu(tmp_path, csvfile):
     )
     errors = validate_fmu(fmu)
     assert not errors
+
+
+def test_generate_fmu_compiles_selected_targets(tmp_path, csvfile):
+    fmu = tmp_path / "model.fmu"
+    dataframe = pandas.read_csv(csvfile)
+    generate_fmu(
+        dataframe=dataframe,  # type: ignore
+        model_name="Test Model",
+        inputs=["x", "y"],
+        outputs=["z"],
+        outfile=fmu,
+        strategy="linear",
+        targets=["native"],
+        jobs=2,
+    )
+    with ZipFile(fmu) as zipfile:
+        binaries = [name for name in zipfile.namelist() if name.startswith("binaries/")]
+    assert any(name.endswith("/test-model.so") for name in binaries)
+    assert not any("win" in name for name in binaries)
+
+
+def test_generate_fmu_evaluates_linear_regression(tmp_path, csvfile):
+    fmu = tmp_path / "model.fmu"
+    dataframe = pandas.read_csv(csvfile)
+    generate_fmu(dataframe, "Test Model", ["x", "y"], ["z"], fmu, "linear")
+    result = linear_regression(dataframe, ["x", "y"], ["z"])
+
+    slave = instantiate(extract(fmu))
+    for x, y in [(0.0, 0.0), (1.0, 2.0), (-3.5, 0.25)]:
+        slave.setReal([1, 2], [x, y])
+        expected = result.intercept[0] + result.coefs[0][0] * x + result.coefs[0][1] * y
+        assert slave.getReal([3, 1]) == pytest.approx([expected, x])
+        assert slave.getReal([3]) == pytest.approx([expected])
+    slave.terminate()
+    slave.freeInstance()
+
+
+def test_generate_fmu_evaluates_logistic_regression(tmp_path):
+    fmu = tmp_path / "model.fmu"
+    values = [index / 30 for index in range(30)]
+    dataframe = pandas.DataFrame(
+        {"x": values, "y": [0.5] * 30, "z": [float(int(v * 3)) for v in values]}
+    )
+    generate_fmu(dataframe, "Test Model", ["x", "y"], ["z"], fmu, "logistic")
+
+    slave = instantiate(extract(fmu))
+    for x, z in [(-10.0, 0.0), (0.5, 1.0), (10.0, 2.0)]:
+        slave.setReal([1, 2], [x, 0.5])
+        assert slave.getReal([3]) == [z]
+    slave.terminate()
+    slave.freeInstance()
+
+
+def test_generate_fmu_instances_run_concurrently(tmp_path, csvfile):
+    fmu = tmp_path / "model.fmu"
+    dataframe = pandas.read_csv(csvfile)
+    generate_fmu(dataframe, "Test Model", ["x", "y"], ["z"], fmu, "linear")
+    result = linear_regression(dataframe, ["x", "y"], ["z"])
+    unzipdir = extract(fmu)
+
+    def drive(index):
+        slave = instantiate(unzipdir, f"instance{index}")
+        try:
+            for step in range(2000):
+                x, y = float(index), float(step)
+                slave.setReal([1, 2], [x, y])
+                (z,) = slave.getReal([3])
+                expected = (
+                    result.intercept[0]
+                    + result.coefs[0][0] * x
+                    + result.coefs[0][1] * y
+                )
+                if z != pytest.approx(expected):
+                    return False
+            return True
+        finally:
+            slave.terminate()
+            slave.freeInstance()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert all(executor.map(drive, range(8)))
+
+
+def test_generate_fmu_instances_do_not_share_variables(tmp_path, csvfile):
+    fmu = tmp_path / "model.fmu"
+    dataframe = pandas.read_csv(csvfile)
+    generate_fmu(dataframe, "Test Model", ["x", "y"], ["z"], fmu, "linear")
+
+    unzipdir = extract(fmu)
+    slaves = [instantiate(unzipdir, f"instance{index}") for index in range(4)]
+    for index, slave in enumerate(slaves):
+        slave.setReal([1, 2], [float(index), -float(index)])
+    for index, slave in enumerate(slaves):
+        assert slave.getReal([1, 2]) == [float(index), -float(index)]
+        slave.terminate()
+        slave.freeInstance()
+
+
+def test_generate_fmu_evaluates_binary_and_high_cardinality_outputs(tmp_path):
+    fmu = tmp_path / "model.fmu"
+    values = [index / 300 for index in range(300)]
+    dataframe = pandas.DataFrame(
+        {
+            "x": values,
+            "binary": [float(v > 0.5) for v in values],
+            "many": [float(int(v * 150)) for v in values],
+        }
+    )
+    generate_fmu(dataframe, "Test Model", ["x"], ["binary", "many"], fmu, "logistic")
+
+    slave = instantiate(extract(fmu))
+    slave.setReal([1], [-10.0])
+    assert slave.getReal([2, 3]) == [0.0, 0.0]
+    slave.setReal([1], [10.0])
+    assert slave.getReal([2, 3]) == [1.0, 149.0]
+    slave.terminate()
+    slave.freeInstance()
+
+
+def test_generate_fmu_packs_only_fmu_entries(tmp_path, csvfile):
+    fmu = tmp_path / "model.fmu"
+    dataframe = pandas.read_csv(csvfile)
+    generate_fmu(
+        dataframe=dataframe,  # type: ignore
+        model_name="Test Model",
+        inputs=["x", "y"],
+        outputs=["z"],
+        outfile=fmu,
+        strategy="linear",
+        targets=["native"],
+        compression="deflate",
+        build_dir=tmp_path,
+    )
+    with ZipFile(fmu) as zipfile:
+        names = zipfile.namelist()
+        compressions = {info.compress_type for info in zipfile.infolist()}
+    assert "modelDescription.xml" in names
+    assert "sources/fmi2Functions.c" in names
+    assert not any(name.startswith("build/") or "CMake" in name for name in names)
+    assert compressions == {ZIP_DEFLATED}
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "dataset.csv",
+        "model.fmu",
+    ]
+
+
+def test_generate_fmu_evaluates_lookup_table(tmp_path):
+    fmu = tmp_path / "model.fmu"
+    rng = numpy.random.default_rng(0)
+    x = rng.uniform(-2, 2, size=(2000, 2))
+    dataframe = pandas.DataFrame(
+        {
+            "a": x[:, 0],
+            "b": x[:, 1],
+            "u": numpy.sin(x[:, 0]) * x[:, 1] ** 2,
+            "v": numpy.abs(x[:, 0] - x[:, 1]),
+        }
+    )
+    parameters = {"lookup": {"resolution": 12}}
+    generate_fmu(
+        dataframe,
+        "Test Model",
+        ["a", "b"],
+        ["u", "v"],
+        fmu,
+        "lookup",
+        parameters=parameters,
+    )
+    result = lookup_table(dataframe, ["a", "b"], ["u", "v"], resolution=12)
+
+    slave = instantiate(extract(fmu))
+    points = [(0.0, 0.0), (1.3, -0.7), (-1.99, 1.99), (-5.0, 0.25), (3.0, 9.0)]
+    for point, expected in zip(points, result.predict(numpy.array(points))):
+        slave.setReal([1, 2], list(point))
+        assert slave.getReal([3, 4]) == pytest.approx(list(expected))
+    slave.terminate()
+    slave.freeInstance()
+
+
+def test_generate_model_tables_rejects_lookup_tables_with_too_many_inputs():
+    result = LookupTableResult([[0.0]] * (MAX_LOOKUP_INPUTS + 1), [[1.0]], 1.0)
+    with pytest.raises(ValueError, match="at most"):
+        generate_model_tables("lookup", result)
+
+
+def test_generate_fmu_evaluates_sparse_linear_regression(tmp_path):
+    fmu = tmp_path / "model.fmu"
+    rng = numpy.random.default_rng(0)
+    inputs = [f"x{index}" for index in range(20)]
+    x = rng.normal(size=(500, 20))
+    # One output uses two inputs and is unrolled, the other uses all of them
+    y = numpy.column_stack([x[:, 3] - 2 * x[:, 11], x @ rng.uniform(1, 2, size=20)])
+    dataframe = pandas.DataFrame(numpy.hstack([x, y]), columns=[*inputs, "u", "v"])
+    generate_fmu(dataframe, "Test Model", inputs, ["u", "v"], fmu, "sparse")
+    result = sparse_linear_regression(dataframe, inputs, ["u", "v"])
+    assert [sum(1 for coef in row if coef) for row in result.coefs] == [2, 20]
+
+    slave = instantiate(extract(fmu))
+    for point in rng.normal(size=(5, 20)):
+        slave.setReal(list(range(1, 21)), list(point))
+        expected = result.predict(point.reshape(1, -1))[0]
+        assert slave.getReal([21, 22]) == pytest.approx(list(expected))
+    slave.terminate()
+    slave.freeInstance()
+
+
+def test_generate_fmu_records_sampling_in_model_description(tmp_path):
+    fmu = tmp_path / "model.fmu"
+    rng = numpy.random.default_rng(0)
+    x = rng.uniform(0, 1, size=(20000, 2))
+    dataframe = pandas.DataFrame(
+        numpy.column_stack([x, x @ [2, -1] + 1]), columns=["x", "y", "z"]
+    )
+    chunks = [dataframe.iloc[start : start + 5000] for start in range(0, 20000, 5000)]
+    sampling = SamplingOptions(initial_size=500)
+    generate_fmu(
+        chunks, "Test Model", ["x", "y"], ["z"], fmu, "auto", sampling=sampling
+    )
+    assert not validate_fmu(fmu)
+
+    with ZipFile(fmu) as archive:
+        root = etree.fromstring(archive.read("modelDescription.xml"))
+    sampled = root.find("VendorAnnotations/Tool[@name='autofmu']/Sampling")
+    assert sampled is not None
+    assert int(sampled.get("totalRows")) == 20000
+    assert int(sampled.get("sampleSize")) < 16000
+    assert float(sampled.get("timeSaved")) >= 0
+
+
+def test_generate_fmu_declares_dependencies_of_outputs(tmp_path):
+    fmu = tmp_path / "model.fmu"
+    rng = numpy.random.default_rng(0)
+    x = rng.normal(size=(200, 3))
+    y = numpy.column_stack([x[:, 0] - 2 * x[:, 2], 0.001 * x[:, 1] + x[:, 2]])
+    dataframe = pandas.DataFrame(
+        numpy.hstack([x, y]), columns=["a", "b", "c", "u", "v"]
+    )
+    generate_fmu(
+        dataframe,
+        "Test Model",
+        ["a", "b", "c"],
+        ["u", "v"],
+        fmu,
+        "sparse",
+        parameters={"sparse": {"tolerance": 0.0}},
+        dependency_tolerance=0.01,
+    )
+    assert not validate_fmu(fmu)
+
+    model_description = read_model_description(fmu, validate_model_structure=True)
+    dependencies = [
+        [variable.name for variable in output.dependencies]
+        for output in model_description.outputs
+    ]
+    assert dependencies == [["a", "c"], ["c"]]
+    assert [
+        [variable.name for variable in unknown.dependencies]
+        for unknown in model_description.initialUnknowns
+    ] == dependencies
+
+
+@pytest.mark.parametrize("strategy", ["linear", "sparse", "logistic", "lookup"])
+def test_generate_fmu_directional_derivatives_match_finite_differences(
+    tmp_path, strategy
+):
+    fmu = tmp_path / "model.fmu"
+    rng = numpy.random.default_rng(0)
+    x = rng.uniform(-1, 1, size=(500, 3))
+    if strategy == "logistic":
+        y = numpy.column_stack([x[:, 0] > x[:, 1], x[:, 2] > 0]).astype(float)
+    else:
+        y = numpy.column_stack([x @ [1.0, -2.0, 0.0], x[:, 0] * x[:, 2]])
+    dataframe = pandas.DataFrame(
+        numpy.hstack([x, y]), columns=["a", "b", "c", "u", "v"]
+    )
+    generate_fmu(dataframe, "Test Model", ["a", "b", "c"], ["u", "v"], fmu, strategy)
+    assert read_model_description(fmu).coSimulation.providesDirectionalDerivative
+
+    slave = instantiate(extract(fmu))
+    step = 1e-7
+    for point, seed in zip(
+        rng.uniform(-0.9, 0.9, size=(5, 3)), rng.normal(size=(5, 3))
+    ):
+        slave.setReal([1, 2, 3], list(point))
+        derivative = slave.getDirectionalDerivative([4, 5], [1, 2, 3], list(seed))
+        slave.setReal([1, 2, 3], list(point + step * seed))
+        forward = numpy.array(slave.getReal([4, 5]))
+        slave.setReal([1, 2, 3], list(point - step * seed))
+        backward = numpy.array(slave.getReal([4, 5]))
+        expected = (forward - backward) / (2 * step)
+        assert derivative == pytest.approx(list(expected), rel=1e-5, abs=1e-5)
+    slave.terminate()
+    slave.freeInstance()
+
+
+def test_generate_fmu_saves_and_restores_state(tmp_path, csvfile):
+    fmu = tmp_path / "model.fmu"
+    dataframe = pandas.read_csv(csvfile)
+    generate_fmu(dataframe, "Test Model", ["x", "y"], ["z"], fmu, "linear")
+    model_description = read_model_description(fmu)
+    assert model_description.coSimulation.canGetAndSetFMUstate
+    assert model_description.coSimulation.canSerializeFMUstate
+
+    slave = instantiate(extract(fmu))
+    slave.setReal([1, 2], [1.0, 2.0])
+    expected = slave.getReal([1, 2, 3])
+    state = slave.getFMUstate()
+    serialized = slave.serializeFMUstate(state)
+    assert len(serialized) == 3 * 8 + 1
+
+    slave.setReal([1, 2], [5.0, -3.0])
+    assert slave.getReal([1, 2, 3]) != expected
+    slave.setFMUstate(state)
+    assert slave.getReal([1, 2, 3]) == expected
+
+    # Saving the state again reuses it, instead of allocating a new one
+    slave.setReal([1, 2], [5.0, -3.0])
+    address = state.value
+    slave.fmi2GetFMUstate(slave.component, byref(state))
+    assert state.value == address
+    assert slave.deSerializeFMUstate(serialized, state).value == address
+    slave.setFMUstate(state)
+    assert slave.getReal([1, 2, 3]) == expected
+
+    slave.freeFMUstate(state)
+    slave.terminate()
+    slave.freeInstance()
@@ -1,7 +1,11 @@
+import json
+
 import pytest
 from fmpy.validation import validate_fmu
 
+from autofmu import main as main_module
 from autofmu.main import main
+from autofmu.state import read_state
 
 
 def test_main_fails_with_no_arguments():
@@ -14,3 +18,115 @@ def test_main_generates_valid_fmu(tmp_path, csvfile):
     main([str(csvfile), "--inputs", "x", "y", "--outputs", "z", "-o", fmu])
     errors = validate_fmu(fmu)
     assert not errors
+
+
+def test_main_generates_valid_fmu_reading_chunks(tmp_path, csvfile):
+    fmu = str(tmp_path / "model.fmu")
+    args = [str(csvfile), "--inputs", "x", "y", "--outputs", "z", "-o", fmu]
+    main([*args, "--chunksize", "3", "--no-cache"])
+    errors = validate_fmu(fmu)
+    assert not errors
+
+
+def test_main_fails_on_missing_columns(tmp_path, csvfile):
+    fmu = str(tmp_path / "model.fmu")
+    with pytest.raises(SystemExit):
+        main([str(csvfile), "--inputs", "x", "spam", "--outputs", "z", "-o", fmu])
+
+
+def test_main_generates_valid_fmu_with_auto_strategy(tmp_path, csvfile, capsys):
+    fmu = str(tmp_path / "model.fmu")
+    args = [str(csvfile), "--inputs", "x", "y", "--outputs", "z", "-o", fmu]
+    main([*args, "--strategy", "auto", "--no-cache"])
+    errors = validate_fmu(fmu)
+    assert not errors
+    output = capsys.readouterr().out
+    assert "score" in output
+    assert "Selected strategy" in output
+
+
+def test_main_writes_profile(tmp_path, csvfile):
+    fmu = str(tmp_path / "model.fmu")
+    trace = tmp_path / "trace.json"
+    args = [str(csvfile), "--inputs", "x", "y", "--outputs", "z", "-o", fmu]
+    main([*args, "--no-cache", "--targets", "native", "--profile", str(trace)])
+
+    names = {event["name"] for event in json.loads(trace.read_text())["traceEvents"]}
+    expected = {
+        "main",
+        "read_dataset",
+        "fit",
+        "compile_fmu",
+        "build_target",
+        "compiler",
+    }
+    assert expected <= names
+
+
+def test_main_generates_batch(tmp_path, csvfile):
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(
+        json.dumps(
+            [
+                {
+                    "dataset": str(csvfile),
+                    "inputs": ["x", "y"],
+                    "outputs": ["z"],
+                    "outfile": str(tmp_path / "model.fmu"),
+                }
+            ]
+        )
+    )
+    main(["batch", str(manifest), "--no-cache", "--targets", "native"])
+    errors = validate_fmu(str(tmp_path / "model.fmu"))
+    assert not errors
+
+
+def test_main_generates_valid_fmu_from_sample(tmp_path, csvfile):
+    fmu = str(tmp_path / "model.fmu")
+    args = [str(csvfile), "--inputs", "x", "y", "--outputs", "z", "-o", fmu]
+    main([*args, "--sample", "--sample-initial-size", "4", "--chunksize", "3"])
+    errors = validate_fmu(fmu)
+    assert not errors
+
+
+def test_main_reads_chunks_when_sampling(tmp_path, csvfile, monkeypatch):
+    chunksizes = []
+    read_datasets = main_module.read_datasets
+
+    def spy(*args, **kwargs):
+        chunksizes.append(kwargs["chunksize"])
+        return read_datasets(*args, **kwargs)
+
+    monkeypatch.setattr(main_module, "read_datasets", spy)
+    fmu = str(tmp_path / "model.fmu")
+    args = [str(csvfile), "--inputs", "x", "y", "--outputs", "z", "-o", fmu]
+    main([*args, "--sample", "--sample-initial-size", "4", "--sample-max-size", "8"])
+    assert chunksizes == [8]
+    assert not validate_fmu(fmu)
+
+
+def test_main_updates_fmu_with_new_rows(tmp_path, csvfile):
+    fmu = tmp_path / "model.fmu"
+    main([str(csvfile), "--inputs", "x", "y", "--outputs", "z", "-o", str(fmu)])
+    main([str(csvfile), "--update", str(fmu), "--no-cache"])
+    assert not validate_fmu(str(fmu))
+    assert read_state(fmu).statistics.count == 20
+
+
+def test_main_fails_to_update_with_other_variables(tmp_path, csvfile):
+    fmu = tmp_path / "model.fmu"
+    main([str(csvfile), "--inputs", "x", "y", "--outputs", "z", "-o", str(fmu)])
+    with pytest.raises(SystemExit):
+        main([str(csvfile), "--update", str(fmu), "--inputs", "x"])
+
+
+def test_main_generates_valid_fmu_from_several_files(tmp_path, csvfile):
+    fmu = str(tmp_path / "model.fmu")
+    shard = tmp_path / "shards" / "dataset.csv"
+    shard.parent.mkdir()
+    shard.write_text(csvfile.read_text())
+    args = ["--inputs", "x", "y", "--outputs", "z", "-o", fmu, "--no-cache"]
+    main([str(csvfile), str(shard.parent), *args])
+    errors = validate_fmu(fmu)
+    assert not errors
@@ -0,0 +1,41 @@
+import json
+
+from autofmu.profiling import profile, stage
+
+
+def test_stage_does_nothing_without_profiler():
+    with stage("ignored"):
+        pass
+
+
+def test_profile_collects_nested_stages():
+    seen = []
+    with profile(seen.append) as profiler:
+        with stage("outer", model="spam"):
+            with stage("inner"):
+                sum(range(1000))
+    with stage("after"):
+        pass
+
+    assert [measurement.name for measurement in profiler.stages] == ["inner", "outer"]
+    assert seen == profiler.stages
+    outer = profiler.stages[1]
+    assert outer.args == {"model": "spam"}
+    assert outer.wall_time >= profiler.stages[0].wall_time
+    assert outer.rss > 0
+    assert outer.peak_rss_increase >= 0
+
+
+def test_profiler_writes_chrome_trace(tmp_path):
+    with profile() as profiler:
+        with stage("spam"):
+            pass
+    path = tmp_path / "trace.json"
+    profiler.write_trace(path)
+
+    (event,) = json.loads(path.read_text())["traceEvents"]
+    assert event["name"] == "spam"
+    assert event["ph"] == "X"
+    assert {"cpu_time", "children_cpu_time", "rss", "peak_rss_increase"} <= set(
+        event["args"]
+    )
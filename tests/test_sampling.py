@@ -0,0 +1,73 @@
+import warnings
+
+import numpy
+import pandas
+import pytest
+
+from autofmu.sampling import SamplingOptions, progressive_fit, reservoir_sample
+
+
+def test_reservoir_sample_keeps_bounded_uniform_sample():
+    dataframe = pandas.DataFrame({"x": numpy.arange(100000)})
+    chunks = (dataframe.iloc[start : start + 7000] for start in range(0, 100000, 7000))
+    sample, total = reservoir_sample(chunks, 5000)
+    assert total == 100000
+    assert len(sample.index) == 5000
+    assert sample["x"].is_unique
+    # Rows from every part of the dataset are sampled with the same probability
+    counts = numpy.histogram(sample["x"], bins=10, range=(0, 100000))[0]
+    assert counts == pytest.approx([500] * 10, rel=0.15)
+
+
+def test_reservoir_sample_keeps_every_row_of_small_datasets(make_dataframe):
+    dataframe = make_dataframe(50, seed=1, noise=0.01)
+    sample, total = reservoir_sample([dataframe.iloc[:20], dataframe.iloc[20:]], 100)
+    assert total == 50
+    assert sorted(sample["x"]) == sorted(dataframe["x"])
+
+
+def test_reservoir_sample_fails_on_empty_dataset():
+    with pytest.raises(ValueError):
+        reservoir_sample([], 100)
+
+
+def test_progressive_fit_stops_when_score_converges(make_dataframe):
+    sample, total = reservoir_sample(
+        [make_dataframe(200000, seed=1, noise=0.01)], 200000
+    )
+    options = SamplingOptions(initial_size=500, tolerance=1e-3)
+    result, report = progressive_fit(
+        sample, ["x", "y"], ["z"], "linear", options=options, total_rows=total
+    )
+    assert report.total_rows == 200000
+    assert report.sample_size < 10000
+    assert [size for size, _ in report.scores][:2] == [500, 1000]
+    assert report.score > 0.99
+    assert report.time_saved >= 0
+    assert result.coefs[0] == pytest.approx([2, -1], abs=0.01)
+
+
+def test_progressive_fit_uses_whole_sample_without_convergence(make_dataframe):
+    sample, _ = reservoir_sample([make_dataframe(1000, seed=1, noise=0.01)], 1000)
+    options = SamplingOptions(initial_size=100, tolerance=0.0)
+    _, report = progressive_fit(sample, ["x", "y"], ["z"], "linear", options=options)
+    assert report.sample_size == 800
+    assert report.total_rows == 1000
+
+
+def test_progressive_fit_holds_out_at_least_two_validation_rows(make_dataframe):
+    sample, _ = reservoir_sample([make_dataframe(8, seed=1, noise=0.01)], 8)
+    options = SamplingOptions(initial_size=4)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        _, report = progressive_fit(
+            sample, ["x", "y"], ["z"], "linear", options=options
+        )
+    assert report.sample_size == 6
+
+
+def test_progressive_fit_fails_on_samples_without_training_rows(make_dataframe):
+    with pytest.raises(ValueError):
+        progressive_fit(
+            make_dataframe(2, seed=1, noise=0.01), ["x", "y"], ["z"], "linear"
+        )
@@ -0,0 +1,50 @@
+from autofmu.selection import (
+    Candidate,
+    applicable_strategies,
+    format_candidates,
+    select_strategy,
+)
+
+
+def test_applicable_strategies_skip_logistic_for_continuous_outputs(make_dataframe):
+    assert applicable_strategies(make_dataframe(categorical=False), ["z"]) == [
+        "linear",
+        "lookup",
+        "sparse",
+    ]
+    assert applicable_strategies(make_dataframe(categorical=True), ["z"]) == [
+        "linear",
+        "logistic",
+        "lookup",
+        "sparse",
+    ]
+
+
+def test_select_strategy_picks_best_on_held_out_data(make_dataframe):
+    strategy, candidates = select_strategy(
+        make_dataframe(categorical=True), ["x", "y"], ["z"]
+    )
+    assert strategy == "logistic"
+    assert [candidate.strategy for candidate in candidates] == [
+        "linear",
+        "logistic",
+        "lookup",
+        "sparse",
+    ]
+    assert all(0 <= candidate.score <= 1 for candidate in candidates)
+
+
+def test_select_strategy_breaks_ties_by_evaluation_cost(make_dataframe):
+    strategy, candidates = select_strategy(
+        make_dataframe(categorical=True), ["x", "y"], ["z"], folds=3, cost_tolerance=2.0
+    )
+    selected = next(c for c in candidates if c.strategy == strategy)
+    assert selected.cost == min(candidate.cost for candidate in candidates)
+
+
+def test_format_candidates_reports_failures():
+    table = format_candidates(
+        [Candidate("linear", 0.5, 0.1, 2), Candidate("logistic", 0, 0, 0, "boom")]
+    )
+    assert "linear" in table
+    assert "failed: boom" in table
@@ -0,0 +1,197 @@
+import http.client
+import json
+import socket
+import threading
+
+import pytest
+from fmpy.validation import validate_fmu
+
+from autofmu.cache import Cache
+from autofmu.dataset import read_dataset
+from autofmu.fitcache import fingerprint, fit_cache_key
+from autofmu.service import JobSpec, Service, ServiceBusyError, create_server
+
+
+@pytest.fixture(scope="module")
+def service():
+    service = Service(workers=1, queue_size=1, targets=["native"])
+    yield service
+    service.close()
+
+
+@pytest.fixture
+def server(service):
+    server = create_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def request(server, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection(*server.server_address[:2], timeout=60)
+    connection.request(method, path, body=body, headers=headers or {})
+    response = connection.getresponse()
+    return response, response.read()
+
+
+def test_service_generates_fmu_from_dataset_path(tmp_path, server, csvfile):
+    spec = {"dataset": str(csvfile), "inputs": ["x", "y"], "outputs": ["z"]}
+    response, body = request(
+        server,
+        "POST",
+        "/fmus",
+        json.dumps(spec),
+        {"Content-Type": "application/json"},
+    )
+    assert response.status == 200
+    assert response.getheader("X-Autofmu-Strategy") == "linear"
+    fmu = tmp_path / "model.fmu"
+    fmu.write_bytes(body)
+    assert not validate_fmu(str(fmu))
+
+
+def test_service_generates_fmu_from_uploaded_dataset(tmp_path, server, csvfile):
+    response, body = request(
+        server,
+        "POST",
+        "/fmus?inputs=x,y&outputs=z&name=Uploaded",
+        csvfile.read_bytes(),
+        {"Content-Type": "text/csv"},
+    )
+    assert response.status == 200
+    assert "uploaded.fmu" in response.getheader("Content-Disposition")
+    fmu = tmp_path / "uploaded.fmu"
+    fmu.write_bytes(body)
+    assert not validate_fmu(str(fmu))
+
+    response, body = request(server, "GET", "/metrics")
+    metrics = json.loads(body)
+    assert metrics["completed"] >= 1
+    assert metrics["queued"] == 0
+    assert metrics["latency"]["max"] > 0
+
+
+def test_service_rejects_invalid_specs(server, csvfile):
+    spec = {"dataset": str(csvfile), "inputs": ["x"], "spam": "eggs"}
+    response, body = request(
+        server,
+        "POST",
+        "/fmus",
+        json.dumps(spec),
+        {"Content-Type": "application/json"},
+    )
+    assert response.status == 400
+    assert "spam" in json.loads(body)["error"]
+
+
+@pytest.mark.parametrize("spec", [[{"inputs": ["x"]}], 42, {"inputs": 1, "outputs": 2}])
+def test_service_rejects_specs_that_are_not_objects(server, spec):
+    response, body = request(
+        server,
+        "POST",
+        "/fmus",
+        json.dumps(spec),
+        {"Content-Type": "application/json"},
+    )
+    assert response.status == 400
+    assert "Expected" in json.loads(body)["error"]
+
+
+def test_service_reports_failed_jobs(server, csvfile):
+    spec = {"dataset": str(csvfile), "inputs": ["x"], "outputs": ["spam"]}
+    response, body = request(
+        server,
+        "POST",
+        "/fmus",
+        json.dumps(spec),
+        {"Content-Type": "application/json"},
+    )
+    assert response.status == 422
+    assert "spam" in json.loads(body)["error"]
+
+
+def test_service_rejects_jobs_when_queue_is_full(tmp_path, service, csvfile):
+    spec = JobSpec(["x", "y"], ["z"])
+    futures = [
+        service.submit(spec, csvfile, tmp_path / f"{index}.fmu") for index in range(2)
+    ]
+    with pytest.raises(ServiceBusyError):
+        service.submit(spec, csvfile, tmp_path / "rejected.fmu")
+    for future in futures:
+        future.result()
+    assert service.metrics()["rejected"] >= 1
+
+
+def send_raw(server, head):
+    with socket.create_connection(server.server_address[:2], timeout=60) as client:
+        client.sendall(head)
+        response = http.client.HTTPResponse(client)
+        response.begin()
+        return response, response.read()
+
+
+@pytest.mark.parametrize(
+    "header, status",
+    [(b"", 411), (b"Content-Length: spam\r\n", 400), (b"Content-Length: -1\r\n", 400)],
+)
+def test_service_validates_content_length(server, header, status):
+    head = b"POST /fmus?inputs=x,y&outputs=z HTTP/1.1\r\nHost: local\r\n"
+    response, _ = send_raw(server, head + header + b"\r\n")
+    assert response.status == status
+
+
+def test_service_rejects_uploads_before_reading_them_when_busy(server, service):
+    for _ in range(service.workers + service.queue_size):
+        service.reserve()
+    try:
+        # The body is never sent, so the request blocks unless it is rejected
+        head = (
+            b"POST /fmus?inputs=x,y&outputs=z HTTP/1.1\r\nHost: local\r\n"
+            b"Content-Length: 1000000\r\n\r\n"
+        )
+        response, _ = send_raw(server, head)
+        assert response.status == 503
+        assert response.getheader("Retry-After") == "1"
+    finally:
+        for _ in range(service.workers + service.queue_size):
+            service.release()
+
+
+def test_service_stores_fits_in_fit_cache(tmp_path, csvfile):
+    fit_cache = Cache(tmp_path / "fits")
+    service = Service(workers=1, targets=["native"], fit_cache=fit_cache)
+    try:
+        service.submit(JobSpec(["x", "y"], ["z"]), csvfile, tmp_path / "a.fmu").result()
+    finally:
+        service.close()
+
+    key = fit_cache_key(
+        fingerprint(read_dataset(csvfile, ["x", "y", "z"]), ["x", "y", "z"]),
+        "linear",
+        inputs=["x", "y"],
+        outputs=["z"],
+        parameters={},
+    )
+    assert fit_cache.get(key) is not None
+    assert not validate_fmu(str(tmp_path / "a.fmu"))
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="requires Unix sockets")
+def test_service_listens_on_unix_socket(tmp_path, service):
+    path = tmp_path / "autofmu.sock"
+    server = create_server(service, unix_socket=path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with socket.socket(socket.AF_UNIX) as client:
+            client.connect(str(path))
+            client.sendall(b"GET /health HTTP/1.1\r\nHost: local\r\n\r\n")
+            response = http.client.HTTPResponse(client)
+            response.begin()
+            assert response.status == 200
+            assert json.loads(response.read()) == {"status": "ok"}
+    finally:
+        server.shutdown()
+        server.server_close()
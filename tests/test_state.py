@@ -0,0 +1,82 @@
+from zipfile import ZipFile
+
+import numpy
+import pandas
+import pytest
+
+from autofmu.generator import fit_model, generate_fmu
+from autofmu.state import STATE_FILE, FitState, read_state
+
+
+def test_fit_state_survives_json_round_trip(make_dataframe):
+    _, _, state = fit_model(make_dataframe(100, seed=0), ["x", "y"], ["z"], "sparse")
+    restored = FitState.from_json(state.to_json())
+    assert restored.strategy == "sparse"
+    assert restored.parameters == state.parameters
+    assert restored.statistics.count == 100
+    numpy.testing.assert_array_equal(restored.statistics.xx, state.statistics.xx)
+
+
+@pytest.mark.parametrize("strategy", ["linear", "sparse"])
+def test_update_matches_fit_of_whole_dataset(tmp_path, strategy, make_dataframe):
+    old, new = make_dataframe(300, seed=0), make_dataframe(100, seed=1)
+    fmu = tmp_path / "model.fmu"
+    generate_fmu(old, "Test Model", ["x", "y"], ["z"], fmu, strategy, targets=[])
+    previous = read_state(fmu)
+    generate_fmu(
+        new,
+        "Test Model",
+        ["x", "y"],
+        ["z"],
+        fmu,
+        strategy,
+        targets=[],
+        previous=previous,
+    )
+
+    whole = pandas.concat([old, new], ignore_index=True)
+    _, expected, _ = fit_model(whole, ["x", "y"], ["z"], strategy)
+    _, updated, _ = fit_model(new, ["x", "y"], ["z"], strategy, previous=previous)
+    assert read_state(fmu).statistics.count == 400
+    with ZipFile(fmu) as archive:
+        assert not any(name.startswith("binaries/") for name in archive.namelist())
+    numpy.testing.assert_allclose(updated.coefs, expected.coefs)
+    numpy.testing.assert_allclose(updated.intercept, expected.intercept)
+
+
+def test_update_warm_starts_logistic_regression(tmp_path, make_dataframe):
+    dataframe = make_dataframe(200, seed=0)
+    dataframe["z"] = (dataframe["z"] > 1).astype(float)
+    _, _, previous = fit_model(dataframe, ["x", "y"], ["z"], "logistic")
+    assert previous.result.outcomes == [[0.0, 1.0]]
+
+    _, result, state = fit_model(
+        dataframe, ["x", "y"], ["z"], "logistic", previous=previous
+    )
+    assert state.result == result
+    numpy.testing.assert_allclose(result.coefs, previous.result.coefs, rtol=1e-3)
+
+
+def test_update_fails_with_other_strategy(make_dataframe):
+    _, _, previous = fit_model(make_dataframe(100, seed=0), ["x", "y"], ["z"], "linear")
+    with pytest.raises(ValueError):
+        fit_model(
+            make_dataframe(100, seed=1), ["x", "y"], ["z"], "sparse", previous=previous
+        )
+
+
+def test_read_state_fails_without_state(tmp_path, make_dataframe):
+    fmu = tmp_path / "model.fmu"
+    generate_fmu(
+        make_dataframe(100, seed=0),
+        "Model",
+        ["x", "y"],
+        ["z"],
+        fmu,
+        "lookup",
+        targets=[],
+    )
+    with ZipFile(fmu) as archive:
+        assert STATE_FILE not in archive.namelist()
+    with pytest.raises(ValueError):
+        read_state(fmu)
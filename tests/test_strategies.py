@@ -0,0 +1,172 @@
+import numpy
+import pandas
+import pytest
+
+from autofmu.strategies import (
+    MAX_LOOKUP_INPUTS,
+    LinearRegressionStatistics,
+    linear_regression,
+    logistic_regression,
+    lookup_table,
+    sparse_linear_regression,
+    streaming_linear_regression,
+)
+
+
+@pytest.fixture
+def dataframe():
+    rng = numpy.random.default_rng(0)
+    x = rng.normal(1000.0, 5.0, size=(500, 3))
+    noise = rng.normal(size=(500, 2))
+    y = x @ [[1.0, -2.0], [0.5, 0.0], [3.0, 1.0]] + [10.0, -4.0] + noise
+    return pandas.DataFrame(numpy.hstack([x, y]), columns=["a", "b", "c", "u", "v"])
+
+
+def test_streaming_linear_regression_matches_linear_regression(dataframe):
+    inputs, outputs = ["a", "b", "c"], ["u", "v"]
+    expected = linear_regression(dataframe, inputs, outputs)
+    chunks = (dataframe.iloc[i : i + 64] for i in range(0, len(dataframe), 64))
+    result = streaming_linear_regression(chunks, inputs, outputs)
+
+    numpy.testing.assert_allclose(result.coefs, expected.coefs, rtol=1e-6)
+    numpy.testing.assert_allclose(result.intercept, expected.intercept, rtol=1e-6)
+    assert result.score == pytest.approx(expected.score)
+
+
+def test_linear_regression_statistics_fail_on_empty_dataset():
+    with pytest.raises(ValueError):
+        LinearRegressionStatistics.empty(2, 1).solve()
+
+
+def test_lookup_table_reproduces_gridded_data():
+    a, b = numpy.meshgrid([0.0, 1.0, 3.0], [-1.0, 0.0, 2.0, 5.0], indexing="ij")
+    y = a**2 - a * b
+    dataframe = pandas.DataFrame({"a": a.ravel(), "b": b.ravel(), "y": y.ravel()})
+    result = lookup_table(dataframe, ["a", "b"], ["y"])
+
+    assert result.breakpoints == [[0.0, 1.0, 3.0], [-1.0, 0.0, 2.0, 5.0]]
+    numpy.testing.assert_allclose(
+        result.predict(dataframe[["a", "b"]]), y.reshape(-1, 1)
+    )
+    # Interpolated between the nodes and held constant beyond the grid
+    assert result.predict([[2.0, 0.0]])[0, 0] == pytest.approx(5.0)
+    assert result.predict([[9.0, -7.0]])[0, 0] == pytest.approx(12.0)
+
+
+def test_lookup_table_fits_in_max_size():
+    rng = numpy.random.default_rng(0)
+    x = rng.uniform(size=(1000, 2))
+    dataframe = pandas.DataFrame({"a": x[:, 0], "b": x[:, 1], "y": x.sum(axis=1)})
+    result = lookup_table(dataframe, ["a", "b"], ["y"], resolution=20, max_size=100)
+
+    assert numpy.prod([len(points) for points in result.breakpoints]) <= 100
+    assert result.score > 0.95
+    with pytest.raises(ValueError):
+        lookup_table(dataframe, ["a", "b"], ["y"], max_size=3)
+
+
+def test_lookup_table_rejects_too_many_inputs():
+    columns = [f"x{index}" for index in range(MAX_LOOKUP_INPUTS + 1)]
+    dataframe = pandas.DataFrame(numpy.zeros((4, len(columns))), columns=columns)
+    with pytest.raises(ValueError, match="at most"):
+        lookup_table(dataframe.assign(y=1.0), columns, ["y"])
+
+
+def test_sparse_linear_regression_drops_irrelevant_inputs():
+    rng = numpy.random.default_rng(0)
+    x = rng.normal(size=(1000, 20))
+    y = x[:, [2, 7]] @ [3.0, -1.5] + 4.0 + rng.normal(scale=0.01, size=1000)
+    columns = [f"x{index}" for index in range(20)]
+    dataframe = pandas.DataFrame(x, columns=columns).assign(y=y)
+    result = sparse_linear_regression(dataframe, columns, ["y"])
+
+    assert [index for index, coef in enumerate(result.coefs[0]) if coef] == [2, 7]
+    numpy.testing.assert_allclose(result.coefs[0][2], 3.0, rtol=1e-3)
+    numpy.testing.assert_allclose(result.intercept, [4.0], rtol=1e-3)
+    assert result.nonzeros() == result.evaluation_cost() == 2
+    assert result.dense_score - 1e-3 <= result.score <= result.dense_score
+
+
+def test_sparse_linear_regression_keeps_inputs_within_tolerance():
+    rng = numpy.random.default_rng(0)
+    x = rng.normal(size=(1000, 3))
+    y = x @ [10.0, 1.0, 0.1]
+    dataframe = pandas.DataFrame(x, columns=["a", "b", "c"]).assign(y=y)
+    strict = sparse_linear_regression(dataframe, ["a", "b", "c"], ["y"], 0.0)
+    loose = sparse_linear_regression(dataframe, ["a", "b", "c"], ["y"], 0.05)
+
+    assert strict.nonzeros() == 3
+    assert loose.nonzeros() == 1
+    assert loose.score >= loose.dense_score - 0.05
+
+
+def test_logistic_regression_warm_starts_from_previous_result():
+    rng = numpy.random.default_rng(0)
+    x = rng.normal(size=(400, 2))
+    dataframe = pandas.DataFrame(
+        {"a": x[:, 0], "b": x[:, 1], "u": (x[:, 0] > x[:, 1]).astype(float)}
+    )
+    expected = logistic_regression(dataframe, ["a", "b"], ["u"])
+    result = logistic_regression(dataframe, ["a", "b"], ["u"], warm_start=expected)
+
+    assert result.outcomes == [[0.0, 1.0]]
+    numpy.testing.assert_allclose(result.coefs, expected.coefs, rtol=1e-3)
+    assert result.score == pytest.approx(expected.score)
+
+
+def test_dependencies_list_inputs_that_change_outputs():
+    a, b = numpy.meshgrid([0.0, 1.0, 2.0], [0.0, 1.0], indexing="ij")
+    dataframe = pandas.DataFrame(
+        {"a": a.ravel(), "b": b.ravel(), "u": a.ravel() * 2, "v": b.ravel()}
+    )
+    assert lookup_table(dataframe, ["a", "b"], ["u", "v"]).dependencies() == [
+        [0],
+        [1],
+    ]
+    result = logistic_regression(dataframe, ["a", "b"], ["v"])
+    assert result.dependencies(tolerance=1e-3) == [[1]]
+
+
+@pytest.fixture
+def classes():
+    rng = numpy.random.default_rng(0)
+    x = rng.normal([1000.0, 0.0], [5.0, 0.01], size=(2000, 2))
+    return pandas.DataFrame(
+        {
+            "a": x[:, 0],
+            "b": x[:, 1],
+            "u": (x[:, 0] - 1000.0 > 0.0).astype(float),
+            "v": numpy.digitize(x[:, 1], [-0.01, 0.01]).astype(float),
+        }
+    )
+
+
+def test_logistic_regression_fits_outputs_in_parallel(classes):
+    serial = logistic_regression(classes, ["a", "b"], ["u", "v"], jobs=1)
+    parallel = logistic_regression(classes, ["a", "b"], ["u", "v"], jobs=2)
+
+    assert parallel == serial
+    assert parallel.outcomes == [[0.0, 1.0], [0.0, 1.0, 2.0]]
+
+
+def test_logistic_regression_saga_fits_unscaled_inputs(classes):
+    lbfgs = logistic_regression(classes, ["a", "b"], ["u", "v"], solver="lbfgs")
+    saga = logistic_regression(classes, ["a", "b"], ["u", "v"], solver="saga")
+
+    assert saga.score > 0.95
+    assert saga.score > lbfgs.score
+
+
+def test_logistic_regression_auto_solver_uses_saga_for_large_datasets(
+    classes, monkeypatch
+):
+    monkeypatch.setattr("autofmu.strategies.SAGA_MIN_ROWS", len(classes.index))
+    auto = logistic_regression(classes, ["a", "b"], ["u"])
+    saga = logistic_regression(classes, ["a", "b"], ["u"], solver="saga")
+
+    assert auto == saga
+
+
+def test_logistic_regression_fails_on_unknown_solver(classes):
+    with pytest.raises(ValueError, match="Unknown solver"):
+        logistic_regression(classes, ["a", "b"], ["u"], solver="newton")
@@ -1,6 +1,19 @@
+from zipfile import ZipFile
+
 import pytest
 
-from autofmu.utils import slugify
+from autofmu import utils
+from autofmu.cache import Cache
+from autofmu.utils import (
+    BACKENDS,
+    TARGETS,
+    CompilationError,
+    compile_fmu,
+    detect_toolchain,
+    host_platform,
+    slugify,
+    target_cache_key,
+)
 
 
 @pytest.mark.parametrize(
@@ -24,3 +37,105 @@ from autofmu.utils import slugify
 )
 def test_slugify(given: str, expected: str, unicode: bool):
     assert slugify(given, allow_unicode=unicode) == expected
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_compile_fmu_reports_failed_targets(tmp_path, backend):
+    fmu = tmp_path / "broken.fmu"
+    with ZipFile(fmu, "w") as zipfile:
+        zipfile.writestr("sources/fmi2Functions.c", "this is not C code")
+
+    with pytest.raises(CompilationError) as excinfo:
+        compile_fmu("broken", fmu, targets=["native"], backend=backend)
+    assert list(excinfo.value.failures) == ["native"]
+    assert "fmi2Functions.c" in excinfo.value.failures["native"]
+
+
+def test_compile_fmu_reports_missing_compiler(tmp_path, monkeypatch):
+    fmu = tmp_path / "model.fmu"
+    with ZipFile(fmu, "w") as zipfile:
+        zipfile.writestr("sources/fmi2Functions.c", "void f(void) {}")
+    monkeypatch.setenv("CC", str(tmp_path / "missing-cc"))
+
+    with pytest.raises(CompilationError) as excinfo:
+        compile_fmu("model", fmu, targets=["native"], backend="direct")
+    assert "missing-cc" in excinfo.value.failures["native"]
+
+
+def test_compile_fmu_reuses_cached_libraries(tmp_path, monkeypatch):
+    cache = Cache(tmp_path / "cache")
+    source = "void f(void) {}"
+    for name in ("first.fmu", "second.fmu"):
+        with ZipFile(tmp_path / name, "w") as zipfile:
+            zipfile.writestr("sources/fmi2Functions.c", source)
+
+    compile_fmu("model", tmp_path / "first.fmu", targets=["native"], cache=cache)
+
+    def run_compiler(*args, **kwargs):
+        pytest.fail("the compiler should not run on a cache hit")
+
+    monkeypatch.setattr(utils, "run_compiler", run_compiler)
+    monkeypatch.setattr(utils, "run_cmake", run_compiler)
+    compile_fmu("model", tmp_path / "second.fmu", targets=["native"], cache=cache)
+
+    with ZipFile(tmp_path / "first.fmu") as first, ZipFile(
+        tmp_path / "second.fmu"
+    ) as second:
+        assert sorted(first.namelist()) == sorted(second.namelist())
+        assert any(name.endswith("model.so") for name in second.namelist())
+
+
+def test_compile_fmu_keeps_fmu_on_failure(tmp_path):
+    fmu = tmp_path / "broken.fmu"
+    with ZipFile(fmu, "w") as zipfile:
+        zipfile.writestr("sources/fmi2Functions.c", "this is not C code")
+    contents = fmu.read_bytes()
+
+    with pytest.raises(CompilationError):
+        compile_fmu("broken", fmu, targets=["native"])
+    assert fmu.read_bytes() == contents
+    assert list(tmp_path.iterdir()) == [fmu]
+
+
+def test_backends_write_the_same_binaries(tmp_path):
+    names = {}
+    for backend in BACKENDS:
+        fmu = tmp_path / f"{backend}.fmu"
+        with ZipFile(fmu, "w") as zipfile:
+            zipfile.writestr("sources/fmi2Functions.c", "void f(void) {}")
+        compile_fmu("model", fmu, targets=["native"], backend=backend)
+        with ZipFile(fmu) as zipfile:
+            names[backend] = sorted(zipfile.namelist())
+    assert names["direct"] == names["cmake"]
+
+
+def test_detect_toolchain_is_cached_across_runs(tmp_path, monkeypatch):
+    cache = Cache(tmp_path / "cache")
+    toolchain = detect_toolchain("cc", cache)
+    assert toolchain.platform in ("linux64", "linux32", "darwin64", "win64")
+
+    def probe(compiler):
+        pytest.fail("the toolchain should be read from the cache")
+
+    monkeypatch.setattr(utils, "_probe_toolchain", probe)
+    assert detect_toolchain("cc", cache) == toolchain
+
+
+def test_host_platform_matches_native_toolchain():
+    assert host_platform()[1] == detect_toolchain("cc").suffix
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_target_cache_key_identifies_only_tools_of_backend(
+    tmp_path, monkeypatch, backend
+):
+    (tmp_path / "CMakeLists.txt").write_text("")
+    identified = []
+
+    def compiler_identity(compiler):
+        identified.append(compiler)
+        return compiler
+
+    monkeypatch.setattr(utils, "compiler_identity", compiler_identity)
+    target_cache_key("model", tmp_path, TARGETS["native"], backend)
+    assert ("cmake" in identified) == (backend == "cmake")